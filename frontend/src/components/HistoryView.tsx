@@ -17,6 +17,9 @@ interface Wagon {
     original_image_path: string;
     deblurred_image_path: string;
     cropped_number_path: string;
+    original_image_thumb?: string;
+    deblurred_image_thumb?: string;
+    cropped_number_thumb?: string;
     defects: string;
     is_night: boolean;
     timestamp: string;
@@ -214,7 +217,7 @@ const HistoryView: React.FC = () => {
                                                 <h4 className="text-xs font-semibold text-gray-400 uppercase tracking-wider">Original Input</h4>
                                                 <div className="bg-black/40 rounded-lg border border-white/10 h-[260px] flex items-center justify-center relative overflow-hidden group">
                                                     {wagon.original_image_path ? (
-                                                        <img src={wagon.original_image_path} className="w-full h-full object-contain" alt="Original" />
+                                                        <img src={wagon.original_image_thumb || wagon.original_image_path} loading="lazy" className="w-full h-full object-contain" alt="Original" />
                                                     ) : (
                                                         <span className="text-xs text-gray-500 italic">No Image</span>
                                                     )}
@@ -225,7 +228,7 @@ const HistoryView: React.FC = () => {
                                                 <h4 className="text-xs font-semibold text-gray-400 uppercase tracking-wider">Processed Output</h4>
                                                 <div className="bg-black/40 rounded-lg border border-white/10 h-[260px] flex items-center justify-center relative overflow-hidden group">
                                                     {wagon.deblurred_image_path ? (
-                                                        <img src={wagon.deblurred_image_path} className="w-full h-full object-contain" alt="Deblurred" />
+                                                        <img src={wagon.deblurred_image_thumb || wagon.deblurred_image_path} loading="lazy" className="w-full h-full object-contain" alt="Deblurred" />
                                                     ) : (
                                                         <span className="text-xs text-gray-500 italic">Processing Skipped / Not Required</span>
                                                     )}
@@ -238,7 +241,7 @@ const HistoryView: React.FC = () => {
                                             <h4 className="text-xs font-semibold text-gray-400 uppercase tracking-wider mb-2">OCR Region</h4>
                                             <div className="bg-black/40 rounded-lg border border-white/10 h-[120px] flex items-center justify-center relative overflow-hidden group">
                                                 {wagon.cropped_number_path ? (
-                                                    <img src={wagon.cropped_number_path} className="h-full object-contain" alt="OCR Crop" />
+                                                    <img src={wagon.cropped_number_thumb || wagon.cropped_number_path} loading="lazy" className="h-full object-contain" alt="OCR Crop" />
                                                 ) : (
                                                     <span className="text-xs text-gray-500 italic">No OCR Data</span>
                                                 )}
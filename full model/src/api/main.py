@@ -1,4 +1,3 @@
-from fastapi import FastAPI
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -14,18 +13,38 @@ import sys
 # Import Database Module
 sys.path.append(os.path.join(os.path.dirname(__file__), '../core'))
 import database
-import report_generator
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks
-from fastapi.responses import Response
+from fastapi import FastAPI, UploadFile, File, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import Response, PlainTextResponse, FileResponse
+import json
 
-# Import Pipeline
+# Import Job Queue + Worker Pool
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 sys.path.append(os.path.join(os.path.dirname(__file__), '../scripts'))
-from cascaded_pipeline import cascaded_pipeline
+from src.core import job_queue
+from src.core import report_cache
+from src.core import image_service
+from src.core.progress import get_store, prometheus_text
+from src.core.stream_hub import StreamHub, mjpeg_part
+from worker_pool import WorkerPool
+from pipeline_viz import draw_stats
 
 app = FastAPI()
 
 # Initialize DB (Run Migrations)
 database.init_db()
+job_queue.init_queue()
+
+# Inspection processing runs in long-lived worker processes, not in the API process
+NUM_WORKERS = int(os.environ.get("INSPECTION_WORKERS", "1"))
+worker_pool = WorkerPool(num_workers=NUM_WORKERS)
+
+@app.on_event("startup")
+def start_worker_pool():
+    worker_pool.start()
+
+@app.on_event("shutdown")
+def stop_worker_pool():
+    worker_pool.stop()
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -47,16 +66,8 @@ full_model_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../
 os.makedirs(full_model_dir, exist_ok=True)
 app.mount("/static", StaticFiles(directory=full_model_dir), name="static")
 
-# Global Mock Data (Still used for live stats for now)
-mock_stats = {
-    "total_wagons": 0,
-    "last_wagon_id": "N/A",
-    "defects_found": 0,
-    "status": "Idle"
-}
-
-# ... (YouTube functions remain same, skipping for brevity in this replace block if possible, but replace_file_content replaces chunks)
-# I will keep the existing imports and setup, just adding the new routes.
+# Live progress published by the pipeline workers
+progress_store = get_store()
 
 @app.get("/history")
 async def get_history():
@@ -64,7 +75,7 @@ async def get_history():
     return database.get_all_inspections()
 
 @app.post("/upload")
-async def upload_video(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def upload_video(file: UploadFile = File(...), priority: int = 0):
     """Upload a video and automatically trigger processing."""
     try:
         # Define Paths
@@ -81,29 +92,17 @@ async def upload_video(background_tasks: BackgroundTasks, file: UploadFile = Fil
             
         print(f"[API] Video saved to: {file_path}")
         
-        # Define Model Paths
-        model_a = os.path.join(base_dir, "railway_hackathon_take6/merged_model_v6_generalized/weights/best.pt")
-        model_b = os.path.join(base_dir, "railway_hackathon_numbers/number_detector_v1/weights/best.pt") 
-        deblur_model = os.path.join(base_dir, "NAFnet/NAFNet-GoPro-width64.pth")
-        
         # Create Inspection Record BEFORE processing (so frontend has an ID)
         inspection_id = database.create_inspection(file.filename)
         
-        # Trigger Pipeline in Background
-        background_tasks.add_task(
-            cascaded_pipeline, 
-            video_path=file_path,
-            model_a_path=model_a,
-            model_b_path=model_b,
-            deblur_model_path=deblur_model,
-            headless=True,
-            inspection_id=inspection_id
-        )
+        # Queue for the worker pool (models are already warm there)
+        job_id = job_queue.enqueue(file_path, inspection_id=inspection_id, priority=priority)
         
         return {
-            "message": "Upload successful. Processing started in background.", 
+            "message": "Upload successful. Processing queued.", 
             "filename": file.filename,
             "inspection_id": inspection_id,
+            "job_id": job_id,
             "status": "PROCESSING"
         }
         
@@ -124,27 +123,113 @@ async def get_inspection_status(inspection_id: int):
     return {"status": status}
 
 
+@app.get("/inspections/{inspection_id}/progress")
+async def get_inspection_progress(inspection_id: int):
+    """Latest live progress snapshot for an inspection."""
+    snap = progress_store.get(inspection_id)
+    if not snap:
+        return Response(content="No live progress for this inspection", status_code=404)
+    return snap
+
+@app.get("/inspections/{inspection_id}/progress/stream")
+async def stream_inspection_progress(inspection_id: int):
+    """Server-Sent Events stream of progress snapshots until the run finishes."""
+    async def event_stream():
+        last_sent = None
+        while True:
+            snap = progress_store.get(inspection_id)
+            if snap and snap['updated_at'] != last_sent:
+                last_sent = snap['updated_at']
+                yield f"data: {json.dumps(snap)}\n\n"
+                if snap['state'] != 'PROCESSING':
+                    break
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.websocket("/ws/progress")
+async def progress_websocket(websocket: WebSocket):
+    """Push every changed snapshot (all inspections) to the client."""
+    await websocket.accept()
+    last_version = -1
+    try:
+        while True:
+            version = progress_store.version()
+            if version != last_version:
+                last_version = version
+                await websocket.send_json({"summary": progress_store.summary(),
+                                           "inspections": progress_store.all()})
+            await asyncio.sleep(0.5)
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint."""
+    queue_counts = job_queue.queue_summary()
+    extra = {
+        'wagon_jobs': ('Jobs per queue status', [({'status': k}, v) for k, v in queue_counts.items()]),
+        'wagon_workers_alive': ('Worker processes alive', [({}, sum(w['alive'] for w in worker_pool.status()))]),
+    }
+    return PlainTextResponse(prometheus_text(progress_store, extra),
+                             media_type="text/plain; version=0.0.4")
+
+@app.get("/jobs")
+async def list_jobs(status: str = None, limit: int = 100):
+    """List processing jobs (newest first) with queue and worker summary."""
+    return {
+        "summary": job_queue.queue_summary(),
+        "workers": worker_pool.status(),
+        "jobs": job_queue.get_jobs(status=status, limit=limit)
+    }
+
+@app.get("/models")
+async def list_models():
+    """Models held warm by each worker (load time, memory, cache hits)."""
+    return worker_pool.models()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: int):
+    """Get a single job."""
+    job = job_queue.get_job(job_id)
+    if not job:
+        return Response(content="Job not found", status_code=404)
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: int):
+    """Cancel a queued job, or ask a running one to stop."""
+    status = job_queue.cancel_job(job_id)
+    if status is None:
+        return Response(content="Job not found", status_code=404)
+    
+    job = job_queue.get_job(job_id)
+    if status == job_queue.CANCELLED and job['inspection_id'] is not None:
+        database.update_inspection_status(job['inspection_id'], job_queue.CANCELLED)
+    return {"job_id": job_id, "status": status, "cancel_requested": True}
+
+
 @app.get("/history/{inspection_id}/report")
-async def generate_report_pdf(inspection_id: int):
-    """Generate and download PDF report for an inspection."""
+async def generate_report_pdf(inspection_id: int, request: Request, thumbnails: bool = False):
+    """Download the PDF report (cached per content version, supports If-None-Match)."""
     inspection = database.get_inspection_by_id(inspection_id)
     if not inspection:
         return Response(content="Inspection not found", status_code=404)
-        
-    wagons = database.get_wagons_for_inspection(inspection_id)
-    
-    # Generate PDF
-    pdf = report_generator.generate_report(inspection, wagons)
-    
-    # Output to bytes
-    # output(dest='S') returns the document as a string (latin-1 encoding).
-    # We need to encode it to bytes.
-    pdf_bytes = pdf.output(dest='S').encode('latin-1')
-    
-    headers = {
-        'Content-Disposition': f'attachment; filename="report_{inspection_id}.pdf"'
-    }
-    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
+    etag = report_cache.report_etag(inspection, thumbnails)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+
+    # Built when the inspection completed; rebuilt only if wagons changed since
+    path, etag = await asyncio.to_thread(report_cache.get_report, inspection_id, thumbnails)
+    if not path:
+        return Response(content="Inspection not found", status_code=404)
+
+    headers['ETag'] = etag
+    headers['Content-Disposition'] = f'attachment; filename="report_{inspection_id}.pdf"'
+    return FileResponse(path, media_type="application/pdf", headers=headers)
 
 @app.get("/history/{inspection_id}")
 async def get_inspection_details(inspection_id: int):
@@ -170,14 +255,68 @@ async def get_inspection_details(inspection_id: int):
                 if len(parts) > 1:
                     rel_path = parts[-1].replace('\\', '/').lstrip('/')
                     w_dict[key] = f"http://localhost:8000/static/{rel_path}"
+                    # Small cached derivative for list views (full image stays at the static URL)
+                    w_dict[key.replace('_path', '_thumb')] = f"http://localhost:8000/images/{rel_path}?w={THUMB_WIDTH}&fmt=auto"
         
         clean_wagons.append(w_dict)
         
     return clean_wagons
 
+THUMB_WIDTH = 320
+
+def _parse_range(range_header, size):
+    """Parse a single 'bytes=start-end' range. Returns (start, end) inclusive, or None."""
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    start_s, _, end_s = range_header[6:].strip().partition('-')
+    try:
+        if start_s == '':
+            # Suffix range: last N bytes
+            length = int(end_s)
+            start, end = max(0, size - length), size - 1
+        else:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return None
+    return start, min(end, size - 1)
+
+@app.get("/images/{image_path:path}")
+async def get_image(image_path: str, request: Request, w: int = None, fmt: str = 'auto', q: int = 80):
+    """Resized / re-encoded wagon image, generated on first request and cached on disk."""
+    fmt = image_service.pick_format(fmt, request.headers.get('accept', ''))
+    try:
+        path, media_type, etag = await asyncio.to_thread(image_service.get_derivative, image_path, w, fmt, q)
+    except image_service.ImageServiceError as e:
+        status = 404 if isinstance(e, image_service.ImageNotFoundError) else 400
+        return Response(content=str(e), status_code=status)
+
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=86400', 'Accept-Ranges': 'bytes', 'Vary': 'Accept'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+
+    size = os.path.getsize(path)
+    byte_range = _parse_range(request.headers.get('range'), size)
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    with open(path, 'rb') as f:
+        f.seek(start)
+        chunk = f.read(end - start + 1)
+    headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+    return Response(content=chunk, status_code=206, media_type=media_type, headers=headers)
+
+@app.get("/images_cache_stats")
+async def image_cache_stats():
+    return image_service.get_cache().stats()
+
 @app.get("/stats")
 async def get_stats():
-    return mock_stats
+    """Live dashboard stats aggregated from running inspections."""
+    return progress_store.summary()
 
 def get_youtube_stream_url(youtube_url: str) -> str:
     ydl_opts = {
@@ -191,54 +330,59 @@ def get_youtube_stream_url(youtube_url: str) -> str:
         return info["url"]
 
 
-def generate_frames(url_key):
-    urls = {
-        1: "https://www.youtube.com/watch?v=7xdHH9KMSVk",
-        2: "https://www.youtube.com/watch?v=nO81bQFql7M",
-        3: "https://www.youtube.com/watch?v=23tmCNeFh7A"
-    }
-    
-    youtube_url = urls.get(url_key, urls[1])
-    try:
-        stream_url = get_youtube_stream_url(youtube_url)
-    except Exception as e:
-        print(f"Error getting YouTube URL for stream {url_key}: {e}")
-        return
+STREAM_URLS = {
+    1: "https://www.youtube.com/watch?v=7xdHH9KMSVk",
+    2: "https://www.youtube.com/watch?v=nO81bQFql7M",
+    3: "https://www.youtube.com/watch?v=23tmCNeFh7A"
+}
 
-    cap = cv2.VideoCapture(stream_url)
-    
-    # Simulate processing loop
-    while True:
-        success, frame = cap.read()
-        # print("Frame read:", success)
-        if not success:
-            # If video ends, try to reconnect
-            print(f"Stream {url_key} ended, restarting...")
-            cap.release()
-            try:
-                stream_url = get_youtube_stream_url(youtube_url)
-                cap = cv2.VideoCapture(stream_url)
-                continue
-            except:
-                break
+# One capture + one JPEG encode per stream, shared by every viewer
+stream_hub = StreamHub(target_fps=25.0, preview_width=640)
 
-        # Encode header
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
-        
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        
-        # Limit FPS
-        time.sleep(0.04) 
+def open_stream(url_key):
+    """Resolve the YouTube URL and open it (called again by the hub on reconnect)."""
+    youtube_url = STREAM_URLS.get(url_key, STREAM_URLS[1])
+    cap = cv2.VideoCapture(get_youtube_stream_url(youtube_url))
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open stream {url_key}")
+    return cap
+
+def draw_live_overlay(frame):
+    """Overlay the live pipeline numbers on the feed."""
+    summary = progress_store.summary()
+    draw_stats(frame, [
+        f"Status: {summary['status']}",
+        f"Wagons: {summary['total_wagons']}",
+        f"Last: {summary['last_wagon_id']}"[:24],
+        f"FPS: {summary['fps']:.1f}",
+    ])
+    return frame
+
+async def generate_frames(broadcaster, variant):
+    broadcaster.add_viewer(variant)
+    last_seq = 0
+    try:
+        while True:
+            # Wait in a thread so the event loop stays free; slow clients simply skip to the newest frame
+            frame = await asyncio.to_thread(broadcaster.wait_frame, variant, last_seq)
+            if frame is None:
+                continue
+            last_seq, jpeg = frame
+            yield mjpeg_part(jpeg)
+    finally:
+        broadcaster.remove_viewer(variant)
 
 @app.get("/video_feed/{stream_id}")
-async def video_feed(stream_id: int):
-    return StreamingResponse(generate_frames(stream_id), media_type="multipart/x-mixed-replace; boundary=frame")
+async def video_feed(stream_id: int, preview: bool = False, overlay: bool = False):
+    # One capture per camera; overlay viewers get a second encode of the same decoded frame
+    broadcaster = stream_hub.get(stream_id, lambda: open_stream(stream_id), overlay=draw_live_overlay)
+    variant = ('preview' if preview else 'full') + (':overlay' if overlay else '')
+    return StreamingResponse(generate_frames(broadcaster, variant), media_type="multipart/x-mixed-replace; boundary=frame")
 
-@app.get("/stats")
-async def get_stats():
-    return mock_stats
+@app.get("/video_feed_stats")
+async def video_feed_stats():
+    """Viewers and capture state per live stream."""
+    return stream_hub.stats()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,247 @@
+import sqlite3
+import os
+import hashlib
+from datetime import datetime, timedelta
+
+import cv2
+
+from src.core.database import DB_PATH
+
+# Blobs live under 'full model' (image_service.IMAGE_ROOT) so /static and /images can serve them
+ARTIFACT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../artifacts'))
+# Where earlier versions put them by mistake ('full model/full model/artifacts', outside /static)
+LEGACY_ARTIFACT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../full model/artifacts'))
+
+# Inspection states whose artifacts may be dropped early
+DISPOSABLE_STATES = ('FAILED', 'CANCELLED')
+
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def init_store():
+    """Create the artifact tables (same SQLite file as inspections)."""
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    conn = _connect()
+    cursor = conn.cursor()
+
+    # Table: Artifacts (one row per unique blob)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS artifacts (
+            hash TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+
+    # Table: Artifact References (who uses a blob, and as what)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS artifact_refs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hash TEXT NOT NULL,
+            inspection_id INTEGER,
+            role TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (hash) REFERENCES artifacts (hash),
+            FOREIGN KEY (inspection_id) REFERENCES inspections (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_artifact_refs_hash ON artifact_refs (hash)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_artifact_refs_inspection ON artifact_refs (inspection_id)')
+    _migrate_legacy_dir(cursor)
+    conn.commit()
+    conn.close()
+
+
+def _migrate_legacy_dir(cursor):
+    """Move blobs from LEGACY_ARTIFACT_DIR into ARTIFACT_DIR and rewrite the stored paths."""
+    if LEGACY_ARTIFACT_DIR == ARTIFACT_DIR or not os.path.isdir(LEGACY_ARTIFACT_DIR):
+        return
+    cursor.execute('SELECT hash, path FROM artifacts WHERE path LIKE ?', (LEGACY_ARTIFACT_DIR + '%',))
+    moved = 0
+    for row in cursor.fetchall():
+        new_path = ARTIFACT_DIR + row['path'][len(LEGACY_ARTIFACT_DIR):]
+        if os.path.exists(row['path']):
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.replace(row['path'], new_path)
+        cursor.execute('UPDATE artifacts SET path = ? WHERE hash = ?', (new_path, row['hash']))
+        for column in ('original_image_path', 'deblurred_image_path', 'cropped_number_path'):
+            cursor.execute(f'UPDATE wagons SET {column} = ? WHERE {column} = ?', (new_path, row['path']))
+        moved += 1
+    if moved:
+        # Image URLs changed: cached reports are stale
+        cursor.execute('''
+            UPDATE inspections SET content_version = content_version + 1
+            WHERE id IN (SELECT DISTINCT inspection_id FROM artifact_refs WHERE inspection_id IS NOT NULL)
+        ''')
+        print(f"[ARTIFACTS] Moved {moved} blob(s) from {LEGACY_ARTIFACT_DIR} to {ARTIFACT_DIR}")
+
+
+def blob_path(digest, ext='.jpg'):
+    """Sharded location: artifacts/ab/cd/abcd....jpg"""
+    return os.path.join(ARTIFACT_DIR, digest[:2], digest[2:4], digest + ext)
+
+
+def put_bytes(data, inspection_id=None, role=None, ext='.jpg'):
+    """Store a blob once (by SHA-256) and record a reference. Returns its absolute path."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest, ext)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    conn = _connect()
+    cursor = conn.cursor()
+    now = _now()
+    cursor.execute('INSERT OR IGNORE INTO artifacts (hash, path, size, created_at) VALUES (?, ?, ?, ?)',
+                   (digest, path, len(data), now))
+    cursor.execute('INSERT INTO artifact_refs (hash, inspection_id, role, created_at) VALUES (?, ?, ?, ?)',
+                   (digest, inspection_id, role, now))
+    conn.commit()
+    conn.close()
+    return path
+
+
+def put_image(img, inspection_id=None, role=None, quality=95):
+    """Encode an image as JPEG and store it. Identical crops map to the same file."""
+    ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode image")
+    return put_bytes(buffer.tobytes(), inspection_id=inspection_id, role=role, ext='.jpg')
+
+
+def store_stats():
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) AS blobs, COALESCE(SUM(size), 0) AS bytes FROM artifacts')
+    blobs = dict(cursor.fetchone())
+    cursor.execute('SELECT COUNT(*) AS refs FROM artifact_refs')
+    refs = cursor.fetchone()['refs']
+    conn.close()
+    return {'blobs': blobs['blobs'], 'refs': refs, 'size_mb': round(blobs['bytes'] / 1e6, 2)}
+
+
+# -----------------------------
+# Retention / Compaction
+# -----------------------------
+def _release_inspections(cursor, inspection_ids):
+    """Drop refs for these inspections and blank the wagon image paths that pointed at them."""
+    for insp_id in inspection_ids:
+        cursor.execute('DELETE FROM artifact_refs WHERE inspection_id = ?', (insp_id,))
+        # Exact match on the blob paths the store recorded (put_image returns them as is), column
+        # by column so images kept outside the store stay linked
+        for column in ('original_image_path', 'deblurred_image_path', 'cropped_number_path'):
+            cursor.execute(f'''
+                UPDATE wagons SET {column} = ''
+                WHERE inspection_id = ? AND {column} IN (SELECT path FROM artifacts)
+            ''', (insp_id,))
+        # Report content changed (images gone)
+        cursor.execute('UPDATE inspections SET content_version = content_version + 1 WHERE id = ?', (insp_id,))
+
+
+def _collect_garbage(cursor, dry_run):
+    """Delete blobs no inspection references any more. Returns (count, bytes)."""
+    cursor.execute('''
+        SELECT a.hash, a.path, a.size FROM artifacts a
+        LEFT JOIN artifact_refs r ON r.hash = a.hash
+        WHERE r.id IS NULL
+    ''')
+    orphans = cursor.fetchall()
+    freed = 0
+    for row in orphans:
+        freed += row['size']
+        if dry_run:
+            continue
+        try:
+            os.remove(row['path'])
+        except FileNotFoundError:
+            pass
+        cursor.execute('DELETE FROM artifacts WHERE hash = ?', (row['hash'],))
+    return len(orphans), freed
+
+
+def run_retention(max_age_days=None, disposable_after_days=1, quota_mb=None, dry_run=False):
+    """
+    Expire artifacts and compact the store.
+
+    1. Inspections older than max_age_days lose their artifacts.
+    2. FAILED / CANCELLED inspections lose theirs after disposable_after_days.
+    3. If the store is still above quota_mb, the oldest finished inspections are
+       released one by one until it fits.
+    Blobs left without references are then deleted. Returns a summary dict.
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    now = datetime.now()
+    released = set()
+
+    def older_than(days):
+        cutoff = (now - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        return cutoff
+
+    if max_age_days is not None:
+        cursor.execute('SELECT id FROM inspections WHERE timestamp < ?', (older_than(max_age_days),))
+        released.update(row['id'] for row in cursor.fetchall())
+
+    if disposable_after_days is not None:
+        placeholders = ','.join('?' * len(DISPOSABLE_STATES))
+        cursor.execute(f'SELECT id FROM inspections WHERE status IN ({placeholders}) AND timestamp < ?',
+                       (*DISPOSABLE_STATES, older_than(disposable_after_days)))
+        released.update(row['id'] for row in cursor.fetchall())
+
+    # Only inspections that actually hold artifacts matter
+    cursor.execute('SELECT DISTINCT inspection_id FROM artifact_refs WHERE inspection_id IS NOT NULL')
+    holding = {row['inspection_id'] for row in cursor.fetchall()}
+    released &= holding
+
+    # Released in dry runs too: the transaction is rolled back at the end, and this
+    # way the dry run reports exactly the blobs a real run would delete
+    _release_inspections(cursor, sorted(released))
+
+    if quota_mb is not None:
+        quota = quota_mb * 1e6  # MB, same unit as store_stats()
+        cursor.execute('''
+            SELECT DISTINCT r.inspection_id FROM artifact_refs r
+            JOIN inspections i ON i.id = r.inspection_id
+            WHERE i.status != 'PROCESSING'
+            ORDER BY r.inspection_id ASC
+        ''')
+        candidates = [row['inspection_id'] for row in cursor.fetchall()]
+        for insp_id in candidates:
+            # Blobs still referenced after the releases so far (shared blobs count once)
+            cursor.execute('''
+                SELECT COALESCE(SUM(size), 0) AS total FROM artifacts
+                WHERE hash IN (SELECT hash FROM artifact_refs)
+            ''')
+            if cursor.fetchone()['total'] <= quota:
+                break
+            _release_inspections(cursor, [insp_id])
+            released.add(insp_id)
+
+    blobs_deleted, bytes_freed = _collect_garbage(cursor, dry_run)
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    conn.close()
+
+    summary = {
+        'inspections_released': sorted(released),
+        'blobs_deleted': blobs_deleted,
+        'mb_freed': round(bytes_freed / 1e6, 2),
+        'dry_run': dry_run,
+    }
+    print(f"[ARTIFACTS] Retention: {summary}")
+    return summary
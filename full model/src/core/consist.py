@@ -0,0 +1,243 @@
+import statistics
+
+from src.core.line_counter import LineCounter
+
+
+def _iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class _Track:
+    def __init__(self, track_id, frame_idx, box):
+        self.track_id = track_id
+        self.root = track_id          # Track this one continues (itself unless merged)
+        self.first_seen = frame_idx
+        self.last_seen = frame_idx
+        self.box = box
+        self.cx, self.cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        self.vx = self.vy = 0.0       # Centroid velocity, px/frame
+        self.continued = False        # A later track took over from this one
+
+    def update(self, frame_idx, box):
+        cx, cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        dt = frame_idx - self.last_seen
+        if dt > 0:
+            # Smoothed velocity for gap prediction (dt > 1 with sparse detection)
+            self.vx = 0.7 * self.vx + 0.3 * (cx - self.cx) / dt
+            self.vy = 0.7 * self.vy + 0.3 * (cy - self.cy) / dt
+        self.cx, self.cy = cx, cy
+        self.box = box
+        self.last_seen = frame_idx
+
+    def predicted(self, frame_idx):
+        dt = frame_idx - self.last_seen
+        return self.cx + self.vx * dt, self.cy + self.vy * dt
+
+
+class ConsistBuilder:
+    """
+    Streaming consist reconstruction.
+
+    Wagons are ordered by the frame their box centroid crosses the virtual
+    line of a LineCounter (by default vertical, mid-frame). Counts are
+    available after every observed frame; frames may be sparse.
+
+    Fragmented tracks are reconciled as they stream:
+    - a track that appears where a recently lost track was predicted to be
+      (centroid continuity, similar height) continues that track;
+    - a crossing right after another one with an overlapping box is the same
+      wagon seen by two tracks;
+    - adjacent entries that read the same valid wagon number are merged.
+    Entries whose spacing to the previous crossing is much larger than usual
+    are flagged as a likely missed wagon.
+    """
+
+    def __init__(self, frame_width, frame_height, counter=None, merge_gap_frames=30,
+                 merge_dist_frac=0.1, duplicate_frames=5, duplicate_iou=0.5, gap_factor=1.8):
+        self.counter = counter or LineCounter.vertical(frame_width, frame_height)
+        self.merge_gap_frames = merge_gap_frames
+        self.merge_dist = frame_width * merge_dist_frac
+        self.duplicate_frames = duplicate_frames
+        self.duplicate_iou = duplicate_iou
+        self.gap_factor = gap_factor
+
+        self._tracks = {}     # track id -> _Track
+        self._entries = []    # ordered consist entries (dicts), see _on_cross
+        self._by_root = {}    # root track id -> entry
+        self._roots = {}      # every track id seen -> root (kept after the track is forgotten)
+        self._pending_ocr = {}  # root track id -> OCR result seen before the wagon crossed
+
+    # -----------------------------
+    # Tracking side
+    # -----------------------------
+    def _find_predecessor(self, frame_idx, box):
+        """Recently lost track whose predicted position matches a new box."""
+        cx, cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        height = box[3] - box[1]
+        best, best_dist = None, self.merge_dist
+        for t in self._tracks.values():
+            gap = frame_idx - t.last_seen
+            if gap <= 0 or gap > self.merge_gap_frames or t.continued:
+                continue
+            t_height = t.box[3] - t.box[1]
+            if not (0.7 <= height / t_height <= 1.4 if t_height > 0 else False):
+                continue
+            px, py = t.predicted(frame_idx)
+            dist = ((px - cx) ** 2 + (py - cy) ** 2) ** 0.5
+            if dist < best_dist:
+                best, best_dist = t, dist
+        return best
+
+    def observe(self, frame_idx, detections):
+        """
+        Feed one frame of tracked wagon boxes: iterable of (track_id, (x1, y1, x2, y2)).
+        Returns the number of wagons in the consist so far.
+        """
+        detections = [(track_id, tuple(float(v) for v in box)) for track_id, box in detections]
+        for track_id, box in detections:
+            t = self._tracks.get(track_id)
+            if t is None:
+                t = _Track(track_id, frame_idx, box)
+                prev = self._find_predecessor(frame_idx, box)
+                if prev is not None:
+                    # Same wagon under a new ID: inherit its root and line side
+                    t.root = prev.root
+                    t.vx, t.vy = prev.vx, prev.vy
+                    self.counter.inherit(track_id, prev.track_id)
+                    prev.continued = True
+                self._tracks[track_id] = t
+                self._roots[track_id] = t.root
+            else:
+                t.update(frame_idx, box)
+
+        for track_id, direction, _ in self.counter.update(frame_idx, detections):
+            self._on_cross(self._tracks[track_id], frame_idx, direction)
+
+        self._forget_stale(frame_idx)
+        return self.count
+
+    def _forget_stale(self, frame_idx):
+        horizon = self.merge_gap_frames * 4
+        for track_id in [tid for tid, t in self._tracks.items() if frame_idx - t.last_seen > horizon]:
+            del self._tracks[track_id]
+            self.counter.forget(track_id)
+
+    def _on_cross(self, track, frame_idx, direction):
+        entry = self._by_root.get(track.root)
+        if entry is not None:
+            if direction != entry['direction']:
+                # Crossed back (reversal or jitter past the band): un-count it
+                self._remove(entry)
+            return
+
+        # Two tracks on one wagon cross together
+        if self._entries:
+            last = self._entries[-1]
+            if (frame_idx - last['crossed_frame'] <= self.duplicate_frames
+                    and last['direction'] == direction and _iou(last['box'], track.box) >= self.duplicate_iou):
+                last['track_ids'].append(track.track_id)
+                self._by_root[track.root] = last
+                self._attach_pending(track.root, last)
+                return
+
+        entry = {
+            'track_ids': [track.track_id],
+            'crossed_frame': frame_idx,
+            'direction': direction,
+            'box': track.box,
+            'wagon_number': None,
+            'parsed': None,
+            'confidence': 0.0,
+        }
+        self._entries.append(entry)
+        self._by_root[track.root] = entry
+        self._attach_pending(track.root, entry)
+
+    def _remove(self, entry):
+        self._entries.remove(entry)
+        for root in [r for r, e in self._by_root.items() if e is entry]:
+            del self._by_root[root]
+
+    # -----------------------------
+    # OCR side
+    # -----------------------------
+    def _root_of(self, track_id):
+        return self._roots.get(track_id, track_id)
+
+    def set_ocr(self, track_id, text, confidence=0.0, parsed=None):
+        """Attach a (final) OCR reading to the wagon a track belongs to."""
+        root = self._root_of(track_id)
+        ocr = {'text': text, 'confidence': confidence, 'parsed': parsed}
+        entry = self._by_root.get(root)
+        if entry is None:
+            # Not crossed yet; keep the best reading until it does
+            prev = self._pending_ocr.get(root)
+            if prev is None or confidence >= prev['confidence']:
+                self._pending_ocr[root] = ocr
+            return
+        self._apply_ocr(entry, ocr)
+
+    def _attach_pending(self, root, entry):
+        ocr = self._pending_ocr.pop(root, None)
+        if ocr is not None:
+            self._apply_ocr(entry, ocr)
+
+    def _apply_ocr(self, entry, ocr):
+        if ocr['confidence'] < entry['confidence']:
+            return
+        entry['wagon_number'] = ocr['text']
+        entry['confidence'] = ocr['confidence']
+        entry['parsed'] = ocr['parsed']
+        self._merge_same_number(entry)
+
+    def _merge_same_number(self, entry):
+        parsed = entry['parsed']
+        if not parsed or not parsed.get('check_valid'):
+            return
+        idx = self._entries.index(entry)
+        for other_idx in (idx - 1, idx + 1):
+            if 0 <= other_idx < len(self._entries):
+                other = self._entries[other_idx]
+                if other['parsed'] and other['parsed']['original'] == parsed['original']:
+                    keep, drop = (other, entry) if other_idx < idx else (entry, other)
+                    keep['track_ids'].extend(drop['track_ids'])
+                    for root in [r for r, e in self._by_root.items() if e is drop]:
+                        self._by_root[root] = keep
+                    self._entries.remove(drop)
+                    return
+
+    # -----------------------------
+    # Results
+    # -----------------------------
+    @property
+    def count(self):
+        return len(self._entries)
+
+    def entries(self):
+        """Ordered consist: list of dicts with position, track_ids, crossed_frame, direction, OCR fields and gap_before."""
+        spacings = [b['crossed_frame'] - a['crossed_frame'] for a, b in zip(self._entries, self._entries[1:])]
+        typical = statistics.median(spacings) if len(spacings) >= 3 else None
+
+        result = []
+        for pos, entry in enumerate(self._entries):
+            gap_before = bool(typical and pos > 0 and spacings[pos - 1] > self.gap_factor * typical)
+            result.append({
+                'position': pos + 1,
+                'track_ids': list(entry['track_ids']),
+                'crossed_frame': entry['crossed_frame'],
+                'direction': entry['direction'],
+                'wagon_number': entry['wagon_number'],
+                'parsed': entry['parsed'],
+                'confidence': entry['confidence'],
+                'gap_before': gap_before,
+            })
+        return result
+
+    def entry_for_track(self, track_id):
+        """Position (1-based) of the wagon a track belongs to, or None if it hasn't crossed."""
+        entry = self._by_root.get(self._root_of(track_id))
+        return self._entries.index(entry) + 1 if entry is not None else None
@@ -0,0 +1,136 @@
+import json
+import os
+
+# -----------------------------
+# Configuration (environment)
+# -----------------------------
+# Cores one pipeline instance (pipeline process + its OCR worker) may use; 0 = every core available
+CPU_BUDGET = int(os.environ.get("CPU_BUDGET", "0"))
+# Cores reserved for the OCR worker out of each pipeline's share; 0 = a quarter of the share
+CPU_OCR_THREADS = int(os.environ.get("CPU_OCR_THREADS", "0"))
+# torch inter-op threads; the pipeline never runs independent ops in parallel inside one model
+CPU_INTEROP_THREADS = max(1, int(os.environ.get("CPU_INTEROP_THREADS", "1")))
+# OpenCV threads per process; 0 = same as the process's torch threads
+CPU_CV2_THREADS = int(os.environ.get("CPU_CV2_THREADS", "0"))
+# Pin each process to its cores (Linux only) so pools don't migrate onto each other's cores
+CPU_AFFINITY = os.environ.get("CPU_AFFINITY", "1") != "0"
+
+ROLES = ('pipeline', 'ocr')
+# Plan handed to spawned children (the OCR worker reads its own role from it)
+PLAN_ENV = "CPU_PLAN"
+
+_applied = None  # settings applied in this process
+
+
+def available_cores():
+    """Core ids this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def _role(cores, threads=None):
+    threads = threads or len(cores)
+    return {'cores': list(cores), 'threads': threads, 'interop_threads': CPU_INTEROP_THREADS,
+            'cv2_threads': CPU_CV2_THREADS or threads}
+
+def make_plans(workers=1, budget=None, ocr_threads=None, cores=None):
+    """
+    One plan per pipeline worker: {'pipeline': {...}, 'ocr': {...}}, each role
+    with its cores, torch intra/inter-op threads and OpenCV threads.
+
+    The cores are split evenly between workers, and each worker's slice into
+    the pipeline process (YOLO, NAFNet, Zero-DCE) and its OCR worker (EasyOCR),
+    so no two thread pools are sized for the same cores. With fewer cores than
+    workers (or than the OCR reservation) cores are shared round-robin.
+    """
+    cores = list(cores if cores is not None else available_cores())
+    budget = budget or CPU_BUDGET
+    if budget:
+        cores = cores[:budget * workers]
+    per_worker = max(1, len(cores) // workers)
+
+    plans = []
+    for idx in range(workers):
+        if len(cores) >= workers:
+            share = cores[idx * per_worker:(idx + 1) * per_worker]
+        else:
+            share = [cores[idx % len(cores)]]
+        n_ocr = ocr_threads or CPU_OCR_THREADS or max(1, len(share) // 4)
+        if len(share) > n_ocr:
+            plans.append({'pipeline': _role(share[:-n_ocr]), 'ocr': _role(share[-n_ocr:])})
+        else:
+            plans.append({'pipeline': _role(share), 'ocr': _role(share, min(n_ocr, len(share)))})
+    return plans
+
+def standalone_plan(budget=None):
+    """Every role on the whole budget: one engine running on its own (benchmarks, scripts)."""
+    cores = available_cores()
+    budget = budget or CPU_BUDGET
+    if budget:
+        cores = cores[:budget]
+    return {role: _role(cores) for role in ROLES}
+
+def inherited_plan():
+    """The plan a parent process exported, or None."""
+    raw = os.environ.get(PLAN_ENV)
+    return json.loads(raw) if raw else None
+
+
+# -----------------------------
+# Applying settings to this process
+# -----------------------------
+def _format_cores(cores):
+    if cores and cores == list(range(cores[0], cores[-1] + 1)):
+        return f"{cores[0]}-{cores[-1]}" if len(cores) > 1 else str(cores[0])
+    return ",".join(map(str, cores))
+
+def apply(role, plan=None):
+    """
+    Size torch and OpenCV thread pools for `role` and pin this process to its
+    cores. Without a plan, uses the one inherited from the parent, else the
+    standalone plan. The plan is exported so spawned children (the OCR worker)
+    configure themselves from the same split. Returns the role settings.
+    """
+    global _applied
+    if role not in ROLES:
+        raise ValueError(f"role must be one of {ROLES}, got {role!r}")
+    plan = plan or inherited_plan() or standalone_plan()
+    settings = dict(plan[role])
+    os.environ[PLAN_ENV] = json.dumps(plan)
+
+    if CPU_AFFINITY and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, settings['cores'])
+        except OSError as e:
+            print(f"[WARNING] CPU affinity not applied: {e}")
+
+    try:
+        import torch
+        torch.set_num_threads(settings['threads'])
+        try:
+            torch.set_num_interop_threads(settings['interop_threads'])
+        except RuntimeError:
+            # Only settable before the first inter-op parallel work in this process
+            settings['interop_threads'] = torch.get_num_interop_threads()
+    except ImportError:
+        pass
+
+    try:
+        import cv2
+        cv2.setNumThreads(settings['cv2_threads'])
+    except ImportError:
+        pass
+
+    settings['role'] = role
+    _applied = settings
+    print(f"[CPU] {role}: {settings['threads']} torch threads (inter-op {settings['interop_threads']}), "
+          f"{settings['cv2_threads']} OpenCV threads, cores {_format_cores(settings['cores'])}")
+    return settings
+
+def ensure(role, plan=None):
+    """Called by the engines: apply `role` (see apply) unless this process was configured already."""
+    return _applied if _applied is not None else apply(role, plan)
+
+def current():
+    """Settings applied in this process (None if never configured)."""
+    return dict(_applied) if _applied is not None else None
@@ -0,0 +1,142 @@
+from collections import Counter
+
+import cv2
+
+from src.core.blur_metric import calculate_blur_score
+
+
+def _exposure(image):
+    """Mean and standard deviation of the grayscale crop (lighting / contrast)."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    mean, std = cv2.meanStdDev(gray)
+    return float(mean[0][0]), float(std[0][0])
+
+
+class CropRouter:
+    """
+    Decides per crop which restoration steps are worth their cost.
+
+    Wagon crops (before Model B):
+      - deblur with NAFNet only when the crop is blurry (Laplacian variance
+        below wagon_blur_threshold) and deblurring happens at wagon scope.
+        The score is taken at deblur_min_height, like the original pipeline
+        (whose 1.0 cut-off was tuned on crops upscaled to 256 px): Laplacian
+        variance is not scale-invariant, and on native small crops the same
+        threshold would select a different set of wagons;
+      - hand Model B the upscaled crop only when it will be deblurred.
+        Model B letterboxes to its own input size, so upscaling just for
+        detection adds pixels without adding detail.
+
+    Number crops (after Model B):
+      - upscale only below number_target_height (EasyOCR's recognizer
+        rescales text lines to 64 px itself);
+      - deblur only the number region when deblur_scope is 'number', the
+        crop is blurry and its wagon wasn't deblurred already;
+      - run the enhancement chain only for dark, low-contrast or blurry
+        crops; sharp, well-lit crops go straight to OCR.
+
+    Every decision is counted per route, and record_outcome() tallies how
+    many reads per route came back with a check-digit valid number.
+    record_deblur() / record_wagon() add the NAFNet pixel budget and the
+    per-wagon success rate, for comparing deblur scopes.
+    """
+
+    def __init__(self, deblur_available=True, deblur_scope='wagon', wagon_blur_threshold=1.0,
+                 number_blur_threshold=100.0, deblur_min_height=256, number_target_height=64,
+                 dark_level=60.0, low_contrast=25.0):
+        if deblur_scope not in ('wagon', 'number'):
+            raise ValueError(f"deblur_scope must be 'wagon' or 'number', got {deblur_scope!r}")
+        self.deblur_available = deblur_available
+        self.deblur_scope = deblur_scope
+        self.wagon_blur_threshold = wagon_blur_threshold
+        self.number_blur_threshold = number_blur_threshold
+        self.deblur_min_height = deblur_min_height
+        self.number_target_height = number_target_height
+        self.dark_level = dark_level
+        self.low_contrast = low_contrast
+
+        self.routes = Counter()    # 'wagon:<route>' / 'number:<route>' -> crops
+        self.reads = Counter()     # number route -> OCR reads
+        self.valid = Counter()     # number route -> reads with a valid wagon number
+        self.deblur_calls = 0
+        self.deblur_pixels = 0
+        self.wagons = 0
+        self.wagons_valid = 0
+
+    def upscale_wagon(self, crop):
+        """Cubic upscale to deblur_min_height (crops already that tall are returned as is)."""
+        if crop.shape[0] >= self.deblur_min_height:
+            return crop
+        scale = self.deblur_min_height / crop.shape[0]
+        return cv2.resize(crop, (int(crop.shape[1] * scale), self.deblur_min_height), interpolation=cv2.INTER_CUBIC)
+
+    def route_wagon(self, crop):
+        """
+        Returns {'route', 'upscale', 'deblur', 'blur_score', 'upscaled'} for a
+        native-resolution wagon crop; 'upscaled' is the crop at deblur_min_height
+        when upscale is set (already computed for scoring, reuse it).
+        """
+        deblur = False
+        blur_score = None
+        scored = None
+        if self.deblur_available and self.deblur_scope == 'wagon':
+            scored = self.upscale_wagon(crop)
+            blur_score = calculate_blur_score(scored)
+            deblur = blur_score < self.wagon_blur_threshold
+        upscale = deblur and crop.shape[0] < self.deblur_min_height
+
+        route = 'deblur' if deblur else 'raw'
+        if upscale:
+            route = 'upscale+' + route
+        self.routes['wagon:' + route] += 1
+        return {'route': route, 'upscale': upscale, 'deblur': deblur, 'blur_score': blur_score,
+                'upscaled': scored if upscale else None}
+
+    def route_number(self, crop, wagon_deblurred=False):
+        """Returns {'route', 'upscale', 'deblur', 'enhance', 'blur_score'} for a padded number crop."""
+        blur_score = calculate_blur_score(crop)
+        mean, std = _exposure(crop)
+        blurry = blur_score < self.number_blur_threshold
+
+        deblur = (self.deblur_available and self.deblur_scope == 'number'
+                  and blurry and not wagon_deblurred)
+        # Upscaling runs before deblur, so NAFNet and OCR both get at least the target height
+        upscale = crop.shape[0] < self.number_target_height
+        enhance = mean < self.dark_level or std < self.low_contrast or (blurry and not deblur)
+
+        steps = [name for name, on in (('upscale', upscale), ('deblur', deblur), ('enhance', enhance)) if on]
+        route = '+'.join(steps) or 'direct'
+        self.routes['number:' + route] += 1
+        return {'route': route, 'upscale': upscale, 'deblur': deblur, 'enhance': enhance,
+                'blur_score': blur_score}
+
+    def record_outcome(self, route, valid):
+        self.reads[route] += 1
+        if valid:
+            self.valid[route] += 1
+
+    def record_deblur(self, crop):
+        """Count one NAFNet call and its input pixels."""
+        self.deblur_calls += 1
+        self.deblur_pixels += crop.shape[0] * crop.shape[1]
+
+    def record_wagon(self, valid):
+        """Count one finalized wagon and whether its consensus is a valid number."""
+        self.wagons += 1
+        if valid:
+            self.wagons_valid += 1
+
+    def stats(self):
+        """Crops per route, reads and valid-read rate per number route, NAFNet budget and wagon success rate."""
+        outcomes = {route: {'reads': n, 'valid': self.valid[route], 'valid_rate': round(self.valid[route] / n, 3)}
+                    for route, n in self.reads.items()}
+        return {
+            'deblur_scope': self.deblur_scope,
+            'routes': dict(self.routes),
+            'outcomes': outcomes,
+            'deblur_calls': self.deblur_calls,
+            'deblur_megapixels': round(self.deblur_pixels / 1e6, 3),
+            'wagons': self.wagons,
+            'wagons_valid': self.wagons_valid,
+            'wagon_valid_rate': round(self.wagons_valid / self.wagons, 3) if self.wagons else None,
+        }
@@ -19,7 +19,8 @@ def init_db():
             timestamp TEXT NOT NULL,
             total_wagons INTEGER DEFAULT 0,
             enhanced_video_path TEXT,
-            status TEXT DEFAULT 'PROCESSING'
+            status TEXT DEFAULT 'PROCESSING',
+            content_version INTEGER DEFAULT 0
         )
     ''')
     
@@ -33,6 +34,12 @@ def init_db():
         cursor.execute("ALTER TABLE inspections ADD COLUMN status TEXT DEFAULT 'PROCESSING'")
     except sqlite3.OperationalError:
         pass
+
+    # Bumped whenever report content changes (used to key cached PDF reports)
+    try:
+        cursor.execute("ALTER TABLE inspections ADD COLUMN content_version INTEGER DEFAULT 0")
+    except sqlite3.OperationalError:
+        pass
     
     # Table: Wagons (Represents a detected wagon in an inspection)
     cursor.execute('''
@@ -51,6 +58,13 @@ def init_db():
             FOREIGN KEY (inspection_id) REFERENCES inspections (id)
         )
     ''')
+
+    # Parsed wagon number fields (filled on insert, backfilled by scripts/backfill_wagon_codes.py)
+    for column in ('wagon_number TEXT', 'wagon_type TEXT', 'owning_railway TEXT', 'check_valid BOOLEAN'):
+        try:
+            cursor.execute(f'ALTER TABLE wagons ADD COLUMN {column}')
+        except sqlite3.OperationalError:
+            pass
     
     conn.commit()
     return conn
@@ -89,26 +103,62 @@ def update_inspection_count(inspection_id, total_wagons):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
-    cursor.execute('UPDATE inspections SET total_wagons = ? WHERE id = ?', (total_wagons, inspection_id))
+    cursor.execute('UPDATE inspections SET total_wagons = ?, content_version = content_version + 1 WHERE id = ?', (total_wagons, inspection_id))
     
     conn.commit()
     conn.close()
 
-def add_wagon(inspection_id, wagon_index, ocr_text, ocr_conf, orig_path, deblur_path, ocr_path, defects, is_night):
-    """Add a wagon record to the database."""
+def add_wagon(inspection_id, wagon_index, ocr_text, ocr_conf, orig_path, deblur_path, ocr_path, defects, is_night,
+              parsed=None):
+    """Add a wagon record to the database. parsed: optional IndianWagonParser result for ocr_text."""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    parsed = parsed or {}
     cursor.execute('''
         INSERT INTO wagons 
-        (inspection_id, wagon_index, ocr_text, ocr_confidence, original_image_path, deblurred_image_path, cropped_number_path, defects, is_night, timestamp)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (inspection_id, wagon_index, ocr_text, ocr_conf, orig_path, deblur_path, ocr_path, str(defects), is_night, timestamp))
+        (inspection_id, wagon_index, ocr_text, ocr_confidence, original_image_path, deblurred_image_path, cropped_number_path, defects, is_night, timestamp,
+         wagon_number, wagon_type, owning_railway, check_valid)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (inspection_id, wagon_index, ocr_text, ocr_conf, orig_path, deblur_path, ocr_path, str(defects), is_night, timestamp,
+          parsed.get('original'), parsed.get('type'), parsed.get('railway'), parsed.get('check_valid')))
+    cursor.execute('UPDATE inspections SET content_version = content_version + 1 WHERE id = ?', (inspection_id,))
     
     conn.commit()
     conn.close()
 
+def reset_inspection(inspection_id):
+    """
+    Drop everything a previous (failed) run wrote for an inspection before it is
+    processed again: its wagons, its artifact references (the blobs themselves
+    are garbage-collected by artifact retention) and its wagon count.
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM wagons WHERE inspection_id = ?', (inspection_id,))
+    try:
+        cursor.execute('DELETE FROM artifact_refs WHERE inspection_id = ?', (inspection_id,))
+    except sqlite3.OperationalError:
+        pass  # Artifact store not initialized yet
+    cursor.execute('UPDATE inspections SET total_wagons = 0, content_version = content_version + 1 WHERE id = ?',
+                   (inspection_id,))
+    conn.commit()
+    conn.close()
+
+def update_wagon_codes(rows):
+    """
+    Bulk-update parsed fields. rows: iterable of
+    (wagon_number, wagon_type, owning_railway, check_valid, wagon_row_id).
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.executemany('''
+        UPDATE wagons SET wagon_number = ?, wagon_type = ?, owning_railway = ?, check_valid = ? WHERE id = ?
+    ''', rows)
+    conn.commit()
+    conn.close()
+
 def get_all_inspections():
     """Fetch all inspections ordered by date."""
     conn = sqlite3.connect(DB_PATH)
@@ -2,23 +2,41 @@ import torch
 import numpy as np
 import cv2
 import os
+from collections import OrderedDict
 from src.core.nafnet_arch import NAFNet
+from src.core import cpu_resources
+
+
+def _fold_bgr_uint8_io(model):
+    """
+    Rewrite NAFNet's first and last conv so the network takes BGR in 0..255 and
+    returns BGR in 0..255: the BGR->RGB swap and /255 go into intro's input
+    channels, the RGB->BGR swap and *255 into ending's output channels. The
+    global residual (out = ending(...) + inp) stays consistent because both
+    sides end up in the same BGR 0..255 space.
+    """
+    with torch.no_grad():
+        model.intro.weight.copy_(model.intro.weight[:, [2, 1, 0]] / 255.0)
+        model.ending.weight.copy_(model.ending.weight[[2, 1, 0]] * 255.0)
+        model.ending.bias.copy_(model.ending.bias[[2, 1, 0]] * 255.0)
 
 class DeblurGANEngine:
-    def __init__(self, weights_path):
+    def __init__(self, weights_path, max_buffers=8):
         self.model = None
+        self.max_buffers = max_buffers
+        self._buffers = OrderedDict()  # padded (h, w) -> preallocated input/output buffers
+        cpu_resources.ensure('pipeline')
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         print(f"[INFO] NAFNet: Running on {self.device}")
 
-        if not os.path.exists(weights_path):
+        # weights_path=None builds the network with random weights (benchmarks only)
+        if weights_path is not None and not os.path.exists(weights_path):
             raise FileNotFoundError(f"NAFNet weights not found at: {weights_path}")
-            
-        print(f"[INFO] NAFNet: Loading weights from {weights_path}...")
-        
+
         # Determine config from filename (simple heuristic)
         # NAFNet-GoPro-width32.pth -> width=32
         width = 32
-        if "width64" in weights_path:
+        if weights_path and "width64" in weights_path:
             width = 64
             
         enc_blks = [1, 1, 1, 28]
@@ -29,20 +47,42 @@ class DeblurGANEngine:
         self.model = NAFNet(img_channel=3, width=width, middle_blk_num=middle_blk_num, 
                           enc_blk_nums=enc_blks, dec_blk_nums=dec_blks)
         
-        # Load Weights
-        checkpoint = torch.load(weights_path, map_location=self.device)
-        
-        # Handle 'params' key if present (common in basicsr checkpoints)
-        if 'params' in checkpoint:
-            state_dict = checkpoint['params']
+        if weights_path is None:
+            print("[WARNING] NAFNet: No weights given. Using random weights.")
         else:
-            state_dict = checkpoint
-            
-        self.model.load_state_dict(state_dict, strict=True)
+            print(f"[INFO] NAFNet: Loading weights from {weights_path}...")
+            # Load Weights
+            checkpoint = torch.load(weights_path, map_location=self.device)
+
+            # Handle 'params' key if present (common in basicsr checkpoints)
+            if 'params' in checkpoint:
+                state_dict = checkpoint['params']
+            else:
+                state_dict = checkpoint
+
+            self.model.load_state_dict(state_dict, strict=True)
+        _fold_bgr_uint8_io(self.model)
         self.model.to(self.device)
         self.model.eval()
         print("[INFO] NAFNet: Model loaded successfully.")
 
+    def _buffers_for(self, ph, pw):
+        """Per padded shape: pinned uint8 staging, the 2-image TTA input, the average and the uint8 output."""
+        key = (ph, pw)
+        buf = self._buffers.pop(key, None)
+        if buf is None:
+            pin = self.device.type == 'cuda'
+            buf = {
+                'staging': torch.empty((ph, pw, 3), dtype=torch.uint8, pin_memory=pin),
+                'input': torch.empty((2, 3, ph, pw), dtype=torch.float32, device=self.device),
+                'avg': torch.empty((3, ph, pw), dtype=torch.float32, device=self.device),
+                'output': torch.empty((ph, pw, 3), dtype=torch.uint8, pin_memory=pin),
+            }
+            if len(self._buffers) >= self.max_buffers:
+                self._buffers.popitem(last=False)
+        self._buffers[key] = buf
+        return buf
+
     def deblur(self, image: np.ndarray) -> np.ndarray:
         """
         Takes a BGR image (numpy), deblurs it, and returns BGR image.
@@ -57,37 +97,24 @@ class DeblurGANEngine:
         # This prevents edge artifacts and ensures the network architecture aligns correctly
         pad_h = (32 - h % 32) % 32
         pad_w = (32 - w % 32) % 32
-        img_padded = np.pad(image, ((0, pad_h), (0, pad_w), (0, 0)), mode='reflect')
+        buf = self._buffers_for(h + pad_h, w + pad_w)
+        # Reflect padding straight into the reused staging buffer (same as np.pad mode='reflect')
+        cv2.copyMakeBorder(image, 0, pad_h, 0, pad_w, cv2.BORDER_REFLECT_101, dst=buf['staging'].numpy())
 
-        def run_inference(img_in):
-            # Preprocess: BGR -> RGB, Normalize 0 to 1, Batch Dimension, Tensor
-            img_rgb = cv2.cvtColor(img_in, cv2.COLOR_BGR2RGB)
-            img_tensor = torch.from_numpy(img_rgb).float() / 255.0
-            img_tensor = img_tensor.permute(2, 0, 1).unsqueeze(0).to(self.device)
-            
-            # Inference
-            with torch.no_grad():
-                output_tensor = self.model(img_tensor)
-            
-            # Postprocess: Tensor -> Numpy (Float 0..1)
-            output = output_tensor.squeeze().permute(1, 2, 0).cpu().numpy()
-            return output
+        # 2. Original + horizontally flipped copy (Test Time Augmentation) as one batch of 2.
+        # The model takes BGR 0..255 directly (see _fold_bgr_uint8_io), so this is just a layout/dtype copy.
+        inp = buf['input']
+        inp[0].copy_(buf['staging'].permute(2, 0, 1), non_blocking=True)
+        inp[1].copy_(inp[0].flip(-1))
 
-        # 2. Run inference (Original)
-        out_1 = run_inference(img_padded)
+        with torch.no_grad():
+            out = self.model(inp)
 
-        # 3. Run inference (Flipped - Test Time Augmentation)
-        # This helps recover details by processing the image from a different orientation
-        img_flipped = cv2.flip(img_padded, 1)
-        out_2 = run_inference(img_flipped)
-        out_2 = cv2.flip(out_2, 1)
+        # 3. Un-flip the second result and average them for higher quality
+        avg = buf['avg']
+        torch.add(out[0], out[1].flip(-1), out=avg)
+        avg.mul_(0.5).clamp_(0, 255)
 
-        # 4. Average the results for higher quality
-        final_output = (out_1 + out_2) / 2.0
-        
-        # 5. Convert back to BGR and uint8
-        final_output = np.clip(final_output * 255.0, 0, 255).astype(np.uint8)
-        output_bgr = cv2.cvtColor(final_output, cv2.COLOR_RGB2BGR)
-        
-        # 6. Crop padding to return original size
-        return output_bgr[:h, :w, :]
+        # 4. Back to HWC uint8 (truncating, like astype) and crop padding to return original size
+        buf['output'].copy_(avg.permute(1, 2, 0))
+        return buf['output'].numpy()[:h, :w].copy()
@@ -0,0 +1,88 @@
+from collections import Counter
+
+import cv2
+import numpy as np
+
+# Darkest first; used to tell whether a change goes darker or brighter
+_RANK = {'night': 0, 'dim': 1, 'day': 2}
+
+
+class IlluminationMonitor:
+    """
+    Cheap day/night classification of a video, cached over time.
+
+    Every `interval` frames the frame is shrunk to a thumb_width-wide grayscale
+    thumbnail and its median luminance is blended into a moving average. The
+    mode only changes once the average is past a threshold by `hysteresis`, so
+    a dark wagon filling the view or a headlight doesn't flip it.
+
+    Modes:
+      'day'   - no enhancement
+      'dim'   - Zero-DCE on the crops that feed Model B / OCR only
+      'night' - Zero-DCE on the frame before detection
+    """
+
+    def __init__(self, interval=30, night_level=50.0, dim_level=90.0, hysteresis=8.0, smoothing=0.3,
+                 thumb_width=64):
+        self.interval = interval
+        self.night_level = night_level
+        self.dim_level = dim_level
+        self.hysteresis = hysteresis
+        self.smoothing = smoothing
+        self.thumb_width = thumb_width
+
+        self.mode = None
+        self.level = None
+        self.switches = 0
+        self.frames_by_mode = Counter()
+        self._last_sample = None
+
+    def _target(self, level):
+        if level < self.night_level:
+            return 'night'
+        if level < self.dim_level:
+            return 'dim'
+        return 'day'
+
+    def measure(self, frame):
+        """Median luminance (0-255) of a small thumbnail of the frame."""
+        h, w = frame.shape[:2]
+        thumb_h = max(1, int(h * self.thumb_width / w))
+        thumb = cv2.resize(frame, (self.thumb_width, thumb_h), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY) if thumb.ndim == 3 else thumb
+        return float(np.median(gray))
+
+    def observe(self, level):
+        """Feed one luminance sample; returns the (possibly updated) mode."""
+        if self.level is None:
+            self.level = level
+            self.mode = self._target(level)
+            return self.mode
+
+        self.level = (1 - self.smoothing) * self.level + self.smoothing * level
+        target = self._target(self.level)
+        if target != self.mode:
+            # Switch only if the level is still past the boundary when nudged back by the hysteresis margin
+            nudged = self.level + self.hysteresis if _RANK[target] < _RANK[self.mode] else self.level - self.hysteresis
+            confirmed = self._target(nudged)
+            if confirmed != self.mode:
+                print(f"[LIGHT] {self.mode} -> {confirmed} (luminance {self.level:.0f})")
+                self.mode = confirmed
+                self.switches += 1
+        return self.mode
+
+    def update(self, frame_idx, frame):
+        """Per-frame call: samples every `interval` frames, otherwise returns the cached mode."""
+        if self._last_sample is None or frame_idx - self._last_sample >= self.interval:
+            self._last_sample = frame_idx
+            self.observe(self.measure(frame))
+        self.frames_by_mode[self.mode] += 1
+        return self.mode
+
+    @property
+    def is_night(self):
+        return self.mode == 'night'
+
+    def stats(self):
+        return {'mode': self.mode, 'level': round(self.level, 1) if self.level is not None else None,
+                'switches': self.switches, 'frames_by_mode': dict(self.frames_by_mode)}
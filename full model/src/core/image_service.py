@@ -0,0 +1,181 @@
+import os
+import hashlib
+import threading
+
+import cv2
+
+# Source images live under 'full model' (same root the API serves as /static)
+IMAGE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
+DERIVATIVE_DIR = os.path.join(IMAGE_ROOT, 'detection', 'derivatives')
+MAX_CACHE_BYTES = int(os.environ.get("DERIVATIVE_CACHE_MB", "512")) * 1024 * 1024
+
+FORMATS = {
+    'jpg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+    # AVIF needs an OpenCV build with libavif; encode() falls back to WebP without it
+    'avif': ('.avif', 'image/avif', getattr(cv2, 'IMWRITE_AVIF_QUALITY', None)),
+}
+
+MAX_WIDTH = 2048
+
+
+class ImageServiceError(Exception):
+    """Bad request for a derivative (unknown format, size, or unreadable file)."""
+
+
+class ImageNotFoundError(ImageServiceError):
+    """Source image does not exist (or is outside IMAGE_ROOT)."""
+
+
+def resolve_source(rel_path):
+    """Map a path relative to IMAGE_ROOT (or an absolute path inside it) to a file, refusing escapes."""
+    if os.path.isabs(rel_path):
+        path = os.path.abspath(rel_path)
+    else:
+        path = os.path.abspath(os.path.join(IMAGE_ROOT, rel_path))
+    if os.path.commonpath([path, IMAGE_ROOT]) != IMAGE_ROOT or not os.path.isfile(path):
+        raise ImageNotFoundError(f"Image not found: {rel_path}")
+    return path
+
+
+def to_relative(path):
+    """Path stored in the DB -> path relative to IMAGE_ROOT (None if outside it)."""
+    if not path:
+        return None
+    # Stored paths may come from Windows machines; same 'full model' split the API already uses
+    if 'full model' in path:
+        return path.split('full model')[-1].replace('\\', '/').lstrip('/')
+    path = os.path.abspath(path)
+    if os.path.commonpath([path, IMAGE_ROOT]) == IMAGE_ROOT:
+        return os.path.relpath(path, IMAGE_ROOT).replace('\\', '/')
+    return None
+
+
+def pick_format(fmt, accept_header=""):
+    """Resolve fmt='auto' from the client's Accept header."""
+    if fmt != 'auto':
+        return fmt
+    if 'image/avif' in accept_header and FORMATS['avif'][2] is not None:
+        return 'avif'
+    if 'image/webp' in accept_header:
+        return 'webp'
+    return 'jpg'
+
+
+class DerivativeCache:
+    """
+    On-disk cache of resized / re-encoded images, generated on first request.
+    Keys include the source mtime, so a replaced source gets a fresh derivative.
+    Least-recently-used files (by mtime, refreshed on hit) are evicted above max_bytes.
+    """
+
+    def __init__(self, cache_dir=DERIVATIVE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._total = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _scan_total(self):
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _evict(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+
+        # Evict down to 90% so we don't rescan on every new file
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in entries:
+            if self._total <= target:
+                break
+            try:
+                os.remove(path)
+                self._total -= size
+            except OSError:
+                pass
+
+    def get(self, source_path, width=None, fmt='jpg', quality=80):
+        """Return (derivative path, media type, etag) for a source image."""
+        if fmt not in FORMATS:
+            raise ImageServiceError(f"Unsupported format: {fmt}")
+        if width is not None and not (16 <= width <= MAX_WIDTH):
+            raise ImageServiceError(f"Width must be between 16 and {MAX_WIDTH}")
+
+        ext, media_type, quality_flag = FORMATS[fmt]
+        mtime = os.path.getmtime(source_path)
+        key = hashlib.sha1(f"{source_path}|{mtime}|{width}|{fmt}|{quality}".encode()).hexdigest()
+        out_path = os.path.join(self.cache_dir, key[:2], key + ext)
+        etag = f'"{key[:16]}"'
+
+        if os.path.exists(out_path):
+            self.hits += 1
+            try:
+                os.utime(out_path)  # Refresh LRU position
+            except OSError:
+                pass
+            return out_path, media_type, etag
+
+        self.misses += 1
+        img = cv2.imread(source_path)
+        if img is None:
+            raise ImageServiceError(f"Unreadable image: {source_path}")
+        if width is not None and width < img.shape[1]:
+            height = max(1, int(img.shape[0] * width / img.shape[1]))
+            img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+
+        params = [quality_flag, quality] if quality_flag is not None else []
+        try:
+            ok, buffer = cv2.imencode(ext, img, params)
+        except cv2.error:
+            ok = False
+        if not ok:
+            if fmt == 'avif':
+                # This OpenCV build can't write AVIF
+                return self.get(source_path, width, 'webp', quality)
+            raise ImageServiceError(f"Could not encode {fmt}")
+
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        tmp_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.tobytes())
+        os.replace(tmp_path, out_path)
+
+        with self._lock:
+            if self._total is None:
+                self._total = self._scan_total()
+            else:
+                self._total += len(buffer)
+            if self._total > self.max_bytes:
+                self._evict()
+        return out_path, media_type, etag
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size_mb': round((self._total or 0) / 1e6, 2), 'max_mb': round(self.max_bytes / 1e6, 2)}
+
+
+# Shared cache per process
+_cache = DerivativeCache()
+
+def get_cache():
+    return _cache
+
+def get_derivative(path, width=None, fmt='jpg', quality=80):
+    """Convenience wrapper: resolve a stored/relative path and return the cached derivative."""
+    return _cache.get(resolve_source(path), width=width, fmt=fmt, quality=quality)
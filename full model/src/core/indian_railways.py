@@ -1,3 +1,24 @@
+import itertools
+import json
+import os
+import re
+
+import numpy as np
+
+# Versioned code registry (wagon types / owning railways); override with WAGON_CODES_PATH
+CODES_PATH = os.environ.get("WAGON_CODES_PATH",
+                            os.path.join(os.path.dirname(__file__), 'data', 'wagon_codes_v1.json'))
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def load_code_tables(path=CODES_PATH):
+    """Read a wagon code file. Returns (version, wagon_types, railway_codes)."""
+    with open(path) as f:
+        data = json.load(f)
+    return data.get('version'), data['wagon_types'], data['railway_codes']
+
+
 class IndianWagonParser:
     """
     Parses 11-digit Indian Railways Wagon Numbers.
@@ -9,29 +30,41 @@ class IndianWagonParser:
     C11         : Check Digit
     """
     
-    WAGON_TYPES = {
-        '10': 'BOXN', '11': 'BOXNHA', '12': 'BOXNHS', '13': 'BOXNCR', '14': 'BOXNLW',
-        '15': 'BOXNB', '16': 'BOXNF', '17': 'BOXNG', '18': 'BOY', '19': 'BOST',
-        '20': 'BOXNAL', '21': 'BOXN-HS', '22': 'BOXNHL', '24': 'BOXNS',
-        '30': 'BCN', '31': 'BCNA', '32': 'BCNAHS', '40': 'BTPN', '41': 'BTPGLN',
-        '42': 'BTALN', '43': 'BTCS', '44': 'BTPH', '45': 'BTAP', '46': 'BTFLN', 
-        # Add more mappings as needed
-    }
-
-    RAILWAY_CODES = {
-        '01': 'CR', '02': 'ER', '03': 'NR', '04': 'NER', '05': 'NFR', '06': 'SR',
-        '07': 'SER', '08': 'WR', '09': 'SCR', '16': 'NWR', '17': 'SWR', '11': 'ECR',
-        '12': 'ECoR', '13': 'NCR', '14': 'SECR', '10': 'EC', '15': 'WCR', '26': 'Metro'
-    }
+    # Loaded once at import; see data/wagon_codes_v*.json
+    CODES_VERSION, WAGON_TYPES, RAILWAY_CODES = load_code_tables()
+
+    @staticmethod
+    def use_code_tables(path):
+        """Switch to another code file (e.g. a newer version) for all later parses."""
+        version, wagon_types, railway_codes = load_code_tables(path)
+        IndianWagonParser.CODES_VERSION = version
+        IndianWagonParser.WAGON_TYPES = wagon_types
+        IndianWagonParser.RAILWAY_CODES = railway_codes
 
     @staticmethod
     def parse(number_str):
         # Clean input: remove spaces, non-digits
-        clean_num = ''.join(filter(str.isdigit, number_str))
+        clean_num = _NON_DIGITS.sub('', number_str)
         
         if len(clean_num) != 11:
             return None # Not a valid 11-digit code
 
+        return IndianWagonParser._build(clean_num, IndianWagonParser.validate_checksum(clean_num))
+
+    @staticmethod
+    def parse_many(number_strs):
+        """
+        Parse many OCR strings in one call (e.g. backfilling stored ocr_text).
+        Returns a list aligned with the input: a parse dict or None per string.
+        Check digits are validated in one vectorized pass.
+        """
+        cleaned = [_NON_DIGITS.sub('', s) if s else '' for s in number_strs]
+        valid = IndianWagonParser.validate_many(cleaned)
+        build = IndianWagonParser._build
+        return [build(c, bool(ok)) if len(c) == 11 else None for c, ok in zip(cleaned, valid)]
+
+    @staticmethod
+    def _build(clean_num, check_valid):
         c1_c2 = clean_num[0:2]
         c3_c4 = clean_num[2:4]
         c5_c6 = clean_num[4:6]
@@ -45,9 +78,6 @@ class IndianWagonParser:
         # Usually contextual, but let's just return the raw YY
         year_mfg = f"20{c5_c6}" # Approximation suitable for modern wagons
         
-        # Check Digit Validation (Standard approach involves specific weights, 
-        # but for now we just parse. We can implement Luhn or specific algo if specs provided)
-        
         return {
             "original": clean_num,
             "formatted": f"{c1_c2} {c3_c4} {c5_c6} {c7_c10} {c11}",
@@ -55,10 +85,126 @@ class IndianWagonParser:
             "railway": railway,
             "year": year_mfg,
             "id": c7_c10,
-            "check_digit": c11
+            "check_digit": c11,
+            "check_valid": check_valid
         }
 
+    # -----------------------------
+    # Check Digit
+    # -----------------------------
+    # Digits 1-10 are weighted 1,3,1,3,...; the check digit tops the sum up to a multiple of 10.
+    # (verifyWN in 'wagon number detection' rounds to the *next* multiple, so it rejects
+    # numbers whose weighted sum is already a multiple of 10 -- the check digit there is 0.)
+    CHECK_WEIGHTS = np.array([1, 3, 1, 3, 1, 3, 1, 3, 1, 3], dtype=np.int32)
+
+    @staticmethod
+    def check_digit(first_ten):
+        """Expected 11th digit for a 10-digit prefix."""
+        s4 = sum(int(d) * w for d, w in zip(first_ten, IndianWagonParser.CHECK_WEIGHTS))
+        return int((10 - s4 % 10) % 10)
+
     @staticmethod
     def validate_checksum(number_str):
-        # Placeholder for specific checksum algo
-        return True
+        clean_num = _NON_DIGITS.sub('', number_str or '')
+        if len(clean_num) != 11:
+            return False
+        return IndianWagonParser.check_digit(clean_num[:10]) == int(clean_num[10])
+
+    @staticmethod
+    def validate_many(numbers):
+        """
+        Vectorized check-digit test for many candidate strings.
+        Returns a bool array; anything that isn't exactly 11 ASCII digits is False.
+        """
+        numbers = list(numbers)
+        result = np.zeros(len(numbers), dtype=bool)
+        idx = [i for i, n in enumerate(numbers) if len(n) == 11 and n.isascii() and n.isdigit()]
+        if not idx:
+            return result
+        digits = np.frombuffer(''.join(numbers[i] for i in idx).encode('ascii'), dtype=np.uint8)
+        digits = digits.reshape(-1, 11).astype(np.int32) - ord('0')
+        s4 = digits[:, :10] @ IndianWagonParser.CHECK_WEIGHTS
+        result[idx] = (10 - s4 % 10) % 10 == digits[:, 10]
+        return result
+
+    # -----------------------------
+    # OCR Correction Candidates
+    # -----------------------------
+    # Letters OCR commonly returns for stencilled digits
+    CONFUSIONS = {'O': '0', 'o': '0', 'D': '0', 'Q': '0',
+                  'I': '1', 'l': '1', 'i': '1', '|': '1',
+                  'S': '5', 's': '5',
+                  'B': '8'}
+
+    @staticmethod
+    def _plausibility_cost(number):
+        """Small tie-breaker: unknown type / railway codes make a candidate less likely."""
+        cost = 0.0
+        if number[0:2] not in IndianWagonParser.WAGON_TYPES:
+            cost += 0.25
+        if number[2:4] not in IndianWagonParser.RAILWAY_CODES:
+            cost += 0.25
+        return cost
+
+    @staticmethod
+    def candidates(raw_text, max_candidates=5, max_confusable=6, insertions=True):
+        """
+        Ranked check-digit-valid readings of raw OCR text.
+
+        Confusable letters (O/0, I/1, S/5, B/8, ...) are either read as their digit
+        or treated as noise; with insertions, a 10-digit result may also be missing
+        one digit, so every insertion is tried. All variants are filtered with
+        validate_many. Returns [(number, cost)] with the cheapest (fewest edits,
+        plausible codes) first.
+        """
+        if not raw_text:
+            return []
+        chars = [c for c in raw_text if c.isdigit() or c in IndianWagonParser.CONFUSIONS]
+        confusable = [i for i, c in enumerate(chars) if not c.isdigit()][:max_confusable]
+
+        variants = {}  # number -> edit cost
+        def offer(number, cost):
+            if cost < variants.get(number, float('inf')):
+                variants[number] = cost
+
+        for mask in itertools.product((False, True), repeat=len(confusable)):
+            mapped = dict(zip(confusable, mask))
+            digits = ''.join(IndianWagonParser.CONFUSIONS[c] if mapped.get(i) else c
+                             for i, c in enumerate(chars) if c.isdigit() or mapped.get(i))
+            cost = sum(mask)
+            if len(digits) == 11:
+                offer(digits, cost)
+            elif len(digits) == 10 and insertions:
+                for pos in range(11):
+                    for d in '0123456789':
+                        offer(digits[:pos] + d + digits[pos:], cost + 1)
+
+        if not variants:
+            return []
+        numbers = list(variants)
+        valid = IndianWagonParser.validate_many(numbers)
+        ranked = sorted(((n, variants[n] + IndianWagonParser._plausibility_cost(n))
+                         for n, ok in zip(numbers, valid) if ok), key=lambda x: (x[1], x[0]))
+        return ranked[:max_candidates]
+
+    @staticmethod
+    def correct(raw_text, insertions=True):
+        """
+        Best check-digit-valid reading of raw OCR text as (number, cost), or None
+        when there is none or another reading needs as few edits. A missing digit
+        usually has ~10 insertions that pass the check digit with one edit each;
+        the plausibility tie-breaker only orders those, it doesn't make one right.
+        """
+        ranked = IndianWagonParser.candidates(raw_text, max_candidates=2, insertions=insertions)
+        if not ranked:
+            return None
+        if len(ranked) > 1:
+            edits = [cost - IndianWagonParser._plausibility_cost(n) for n, cost in ranked]
+            if edits[1] <= edits[0]:
+                return None
+        return ranked[0]
+
+    @staticmethod
+    def correct_confusions(raw_text):
+        """Like correct(), but only confusable-letter fixes (O->0, I->1, ...), never inserted digits."""
+        return IndianWagonParser.correct(raw_text, insertions=False)
@@ -0,0 +1,236 @@
+import sqlite3
+import os
+from datetime import datetime
+
+from src.core.database import DB_PATH
+
+# Job lifecycle states
+QUEUED = 'QUEUED'
+PROCESSING = 'PROCESSING'
+COMPLETED = 'COMPLETED'
+FAILED = 'FAILED'
+CANCELLED = 'CANCELLED'
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+def _connect():
+    # isolation_level=None lets us control transactions explicitly (BEGIN IMMEDIATE)
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def init_queue():
+    """Create the jobs table (lives in the same SQLite file as inspections)."""
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+
+    conn = _connect()
+    cursor = conn.cursor()
+
+    # WAL lets the API read job status while workers are writing
+    cursor.execute('PRAGMA journal_mode=WAL')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inspection_id INTEGER,
+            video_path TEXT NOT NULL,
+            priority INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'QUEUED',
+            attempts INTEGER DEFAULT 0,
+            max_attempts INTEGER DEFAULT 3,
+            cancel_requested INTEGER DEFAULT 0,
+            worker_pid INTEGER,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            FOREIGN KEY (inspection_id) REFERENCES inspections (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_priority ON jobs (status, priority DESC, id ASC)')
+    conn.close()
+
+
+def enqueue(video_path, inspection_id=None, priority=0, max_attempts=3):
+    """Add a video to the queue and return the job ID. Higher priority runs first."""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO jobs (inspection_id, video_path, priority, status, max_attempts, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (inspection_id, video_path, priority, QUEUED, max_attempts, _now()))
+    job_id = cursor.lastrowid
+    conn.close()
+    return job_id
+
+
+def claim_next(worker_pid):
+    """
+    Atomically take the highest-priority queued job and mark it PROCESSING.
+    Returns the job as a dict, or None if the queue is empty.
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    try:
+        # BEGIN IMMEDIATE takes the write lock up front so two workers
+        # can never claim the same row.
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            SELECT * FROM jobs WHERE status = ? AND cancel_requested = 0
+            ORDER BY priority DESC, id ASC LIMIT 1
+        ''', (QUEUED,))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute('COMMIT')
+            return None
+
+        cursor.execute('''
+            UPDATE jobs SET status = ?, worker_pid = ?, attempts = attempts + 1, started_at = ?, error = NULL
+            WHERE id = ?
+        ''', (PROCESSING, worker_pid, _now(), row['id']))
+        cursor.execute('COMMIT')
+    except Exception:
+        cursor.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+    job = dict(row)
+    job['status'] = PROCESSING
+    job['worker_pid'] = worker_pid
+    job['attempts'] += 1
+    return job
+
+
+def finish_job(job_id, status, error=None):
+    """Mark a job as COMPLETED, FAILED or CANCELLED."""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?',
+                   (status, error, _now(), job_id))
+    conn.close()
+
+
+def retry_or_fail(job_id, error):
+    """
+    Put a failed job back in the queue if it has attempts left, else mark it FAILED.
+    Returns the resulting status.
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('SELECT attempts, max_attempts, cancel_requested FROM jobs WHERE id = ?', (job_id,))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute('COMMIT')
+        conn.close()
+        return None
+
+    if row['cancel_requested']:
+        status = CANCELLED
+    elif row['attempts'] < row['max_attempts']:
+        status = QUEUED
+    else:
+        status = FAILED
+
+    finished_at = _now() if status != QUEUED else None
+    cursor.execute('UPDATE jobs SET status = ?, error = ?, worker_pid = NULL, finished_at = ? WHERE id = ?',
+                   (status, error, finished_at, job_id))
+    cursor.execute('COMMIT')
+    conn.close()
+    return status
+
+
+def recover_stale_jobs(alive_pids=()):
+    """
+    Re-queue jobs left PROCESSING by a worker that is no longer running
+    (API restart, worker crash). Jobs that ran out of attempts become FAILED.
+    Returns the list of recovered job IDs.
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, worker_pid FROM jobs WHERE status = ?', (PROCESSING,))
+    stale = [row['id'] for row in cursor.fetchall() if row['worker_pid'] not in alive_pids]
+    conn.close()
+
+    for job_id in stale:
+        status = retry_or_fail(job_id, "Worker exited while processing")
+        print(f"[QUEUE] Recovered stale job {job_id} -> {status}")
+    return stale
+
+
+def cancel_job(job_id):
+    """
+    Cancel a job. Queued jobs are cancelled immediately; running jobs are
+    flagged and stop at the worker's next cancellation check.
+    Returns the job's status after the request, or None if it doesn't exist.
+    """
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('SELECT status FROM jobs WHERE id = ?', (job_id,))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute('COMMIT')
+        conn.close()
+        return None
+
+    status = row['status']
+    if status == QUEUED:
+        cursor.execute('UPDATE jobs SET status = ?, cancel_requested = 1, finished_at = ? WHERE id = ?',
+                       (CANCELLED, _now(), job_id))
+        status = CANCELLED
+    elif status == PROCESSING:
+        cursor.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+    cursor.execute('COMMIT')
+    conn.close()
+    return status
+
+
+def is_cancel_requested(job_id):
+    """Cheap check used by running pipelines to honour cancellation."""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return bool(row and row['cancel_requested'])
+
+
+def get_job(job_id):
+    """Fetch a single job by its ID."""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def get_jobs(status=None, limit=100):
+    """Fetch jobs, newest first, optionally filtered by status."""
+    conn = _connect()
+    cursor = conn.cursor()
+    if status:
+        cursor.execute('SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?', (status, limit))
+    else:
+        cursor.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,))
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+
+def queue_summary():
+    """Count jobs per status (for the /jobs endpoint)."""
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status')
+    summary = {row['status']: row['n'] for row in cursor.fetchall()}
+    conn.close()
+    return summary
@@ -0,0 +1,79 @@
+class LineCounter:
+    """
+    Counts tracked objects whose box centroid crosses a virtual line.
+
+    The line runs from p1 to p2 (pixels). Its positive side is to the left of
+    p1 -> p2 (so with p1 at the top, moving left-to-right is a 'forward'
+    crossing). A dead band of band_px on each side stops jitter near the line
+    from producing crossings: a track must leave the band on the opposite side.
+
+    Only each track's last side is kept, so detections can be sparse (every
+    Nth frame); a crossing between two samples is still seen at the next one.
+    """
+
+    def __init__(self, p1, p2, band_px=10.0):
+        self.p1 = (float(p1[0]), float(p1[1]))
+        self.p2 = (float(p2[0]), float(p2[1]))
+        dx, dy = self.p2[0] - self.p1[0], self.p2[1] - self.p1[1]
+        self._length = (dx * dx + dy * dy) ** 0.5
+        if self._length == 0:
+            raise ValueError("Counting line needs two distinct points")
+        self.band_px = band_px
+
+        self._sides = {}  # track id -> -1 / +1 (last side outside the band)
+        self.forward = 0
+        self.backward = 0
+
+    @classmethod
+    def vertical(cls, frame_width, frame_height, x_frac=0.5, band_frac=0.02):
+        """Vertical line at x_frac of the width (trains moving across the frame)."""
+        x = frame_width * x_frac
+        # p2 below p1: the positive (left-hand) side is x > line, so left-to-right is forward
+        return cls((x, 0), (x, frame_height), band_px=frame_width * band_frac)
+
+    def signed_distance(self, point):
+        """Distance of a point from the line, positive on the forward side."""
+        (x1, y1), (x2, y2) = self.p1, self.p2
+        cross = (x2 - x1) * (point[1] - y1) - (y2 - y1) * (point[0] - x1)
+        return -cross / self._length
+
+    def side_of(self, point):
+        d = self.signed_distance(point)
+        if d > self.band_px:
+            return 1
+        if d < -self.band_px:
+            return -1
+        return 0
+
+    def inherit(self, track_id, from_track_id):
+        """A new track ID continues an old one (tracker ID switch): keep the old side."""
+        side = self._sides.get(from_track_id)
+        if side is not None:
+            self._sides[track_id] = side
+
+    def update(self, frame_idx, detections):
+        """
+        detections: iterable of (track_id, (x1, y1, x2, y2)).
+        Returns crossing events as (track_id, direction, frame_idx), direction +1 forward / -1 backward.
+        """
+        events = []
+        for track_id, box in detections:
+            centroid = ((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)
+            side = self.side_of(centroid)
+            if side == 0:
+                continue
+            prev = self._sides.get(track_id)
+            self._sides[track_id] = side
+            if prev is not None and prev != side:
+                events.append((track_id, side, frame_idx))
+                if side > 0:
+                    self.forward += 1
+                else:
+                    self.backward += 1
+        return events
+
+    def forget(self, track_id):
+        self._sides.pop(track_id, None)
+
+    def counts(self):
+        return {'forward': self.forward, 'backward': self.backward, 'net': self.forward - self.backward}
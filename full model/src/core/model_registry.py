@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # Optional: only used for RSS deltas in the stats
+    psutil = None
+
+
+# -----------------------------
+# Loaders (imports are lazy so the registry itself is cheap to import)
+# -----------------------------
+def _load_yolo(path):
+    from ultralytics import YOLO
+    from src.core import cpu_resources
+    cpu_resources.ensure('pipeline')
+    return YOLO(path)
+
+def _load_deblur(path):
+    from src.core.deblur_engine import DeblurGANEngine
+    return DeblurGANEngine(path)
+
+def _load_enhancer(path, device='cpu'):
+    from src.core.enhancer import LowLightEnhancer
+    return LowLightEnhancer(weights_path=path, device=device)
+
+def _load_ocr(path=None, mode='full'):
+    # path (optional) is where the OCR result cache is persisted
+    from src.core.ocr_engine import WagonOCR
+    if path:
+        return WagonOCR(mode=mode, cache_path=path)
+    return WagonOCR(mode=mode)
+
+
+def _rss_bytes():
+    if psutil is None:
+        return None
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+def _torch_modules(obj):
+    """Find the torch modules held by one of our engine/model wrappers."""
+    candidates = [obj, getattr(obj, 'model', None)]
+    reader = getattr(obj, 'reader', None)
+    if reader is not None:
+        candidates += [getattr(reader, 'detector', None), getattr(reader, 'recognizer', None)]
+    # ultralytics YOLO wraps the nn.Module one level deeper (YOLO.model.model)
+    candidates.append(getattr(getattr(obj, 'model', None), 'model', None))
+
+    modules = []
+    for c in candidates:
+        if c is not None and hasattr(c, 'parameters') and hasattr(c, 'buffers') and c not in modules:
+            modules.append(c)
+    # Drop modules that are children of another candidate so nothing is counted twice
+    return [m for m in modules if not any(m is not o and any(m is s for s in o.modules()) for o in modules)]
+
+
+def _param_bytes(obj):
+    total = 0
+    for module in _torch_modules(obj):
+        for t in list(module.parameters()) + list(module.buffers()):
+            total += t.numel() * t.element_size()
+    return total
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models.
+
+    Each model is loaded lazily on first request and shared afterwards, keyed by
+    (kind, absolute path, config). Instances are shared, so callers that keep
+    per-run state on a model (e.g. YOLO tracking with persist=True) must reset it
+    themselves and must not run two pipelines on one instance at the same time.
+    """
+
+    LOADERS = {
+        'yolo': _load_yolo,
+        'deblur': _load_deblur,
+        'enhancer': _load_enhancer,
+        'ocr': _load_ocr,
+    }
+
+    def __init__(self):
+        self._models = {}
+        self._stats = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(kind, path, config):
+        norm_path = os.path.abspath(path) if path else None
+        return (kind, norm_path, tuple(sorted(config.items())))
+
+    def get(self, kind, path=None, **config):
+        """Return the cached model for (kind, path, config), loading it on first use."""
+        if kind not in self.LOADERS:
+            raise ValueError(f"Unknown model kind: {kind}")
+
+        key = self._key(kind, path, config)
+        model = self._models.get(key)
+        if model is not None:
+            self._stats[key]['hits'] += 1
+            return model
+
+        with self._lock:
+            # Another thread may have loaded it while we waited
+            if key in self._models:
+                self._stats[key]['hits'] += 1
+                return self._models[key]
+
+            rss_before = _rss_bytes()
+            t0 = time.time()
+            model = self.LOADERS[kind](path, **config)
+            load_time = time.time() - t0
+            rss_after = _rss_bytes()
+
+            self._models[key] = model
+            self._stats[key] = {
+                'kind': kind,
+                'path': key[1],
+                'config': dict(config),
+                'load_time_s': round(load_time, 3),
+                'param_mb': round(_param_bytes(model) / 1e6, 2),
+                'rss_delta_mb': round((rss_after - rss_before) / 1e6, 2) if rss_before is not None else None,
+                'loaded_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'hits': 0,
+            }
+            print(f"[REGISTRY] Loaded {kind} ({key[1] or 'default'}) in {load_time:.2f}s")
+            return model
+
+    # Convenience accessors
+    def get_yolo(self, path):
+        return self.get('yolo', path)
+
+    def get_deblur(self, path):
+        return self.get('deblur', path)
+
+    def get_enhancer(self, path, device='cpu'):
+        return self.get('enhancer', path, device=device)
+
+    def get_ocr(self, mode='full'):
+        return self.get('ocr', mode=mode)
+
+    def prewarm(self, specs):
+        """
+        Load a list of models ahead of time.
+        specs: iterable of (kind, path) or (kind, path, config_dict).
+        Failures are logged and skipped so one missing file doesn't block the rest.
+        """
+        for spec in specs:
+            kind, path = spec[0], spec[1]
+            config = spec[2] if len(spec) > 2 else {}
+            try:
+                self.get(kind, path, **config)
+            except Exception as e:
+                print(f"[REGISTRY] Pre-warm failed for {kind} ({path}): {e}")
+
+    def stats(self):
+        """Load time, memory and hit count for every loaded model."""
+        return [dict(s) for s in self._stats.values()]
+
+    def evict(self, kind, path=None, **config):
+        with self._lock:
+            key = self._key(kind, path, config)
+            self._stats.pop(key, None)
+            return self._models.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._stats.clear()
+
+
+# One registry per process
+_registry = ModelRegistry()
+
+def get_registry():
+    return _registry
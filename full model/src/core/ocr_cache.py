@@ -0,0 +1,122 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Override with OCR_CACHE_PATH (e.g. a scratch file so benchmarks don't hit the production cache)
+DEFAULT_CACHE_PATH = os.environ.get("OCR_CACHE_PATH",
+                                    os.path.join(os.path.dirname(__file__), '../../full model/detection/ocr_cache.json'))
+# Bump when the stored result format changes; older files are ignored on load
+CACHE_VERSION = 3
+
+
+def crop_hash(image, hash_size=32):
+    """
+    Difference hash (dHash) of a crop: grayscale, resize to (hash_size+1) x hash_size,
+    compare horizontally adjacent pixels. Robust to re-encoding, small shifts and
+    brightness changes, which is what repeated crops of the same frame region differ by.
+    Returns the hash as a Python int (hash_size*hash_size bits).
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class OCRResultCache:
+    """
+    LRU cache of OCR results keyed by perceptual crop hash.
+
+    Lookups match the exact hash and aspect ratio only: wagon numbers share a
+    layout, so crops of plates that differ by a single digit sit only a few
+    bits apart and a nearest-hash match would return the other wagon's number.
+    Optionally persisted to a JSON file so re-processing an inspection hits
+    across runs.
+    """
+
+    def __init__(self, max_entries=4096, persist_path=None, save_every=50, hash_size=32):
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self.save_every = save_every
+        self.hash_size = hash_size
+
+        self._entries = OrderedDict()  # (hash, aspect) -> result
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+
+        if persist_path:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path) as f:
+                data = json.load(f)
+            if data.get('version') != CACHE_VERSION:
+                print(f"[OCR CACHE] Ignoring {self.persist_path} (format version {data.get('version')})")
+                return
+            if data.get('hash_size') != self.hash_size:
+                print(f"[OCR CACHE] Ignoring {self.persist_path} (hash size {data.get('hash_size')})")
+                return
+            for hex_hash, aspect, result in data.get('entries', [])[-self.max_entries:]:
+                self._entries[(int(hex_hash, 16), aspect)] = result
+            print(f"[OCR CACHE] Loaded {len(self._entries)} entries from {self.persist_path}")
+        except (OSError, ValueError) as e:
+            print(f"[OCR CACHE] Could not load {self.persist_path}: {e}")
+
+    def save(self):
+        if not self.persist_path:
+            return
+        with self._lock:
+            entries = [[format(h, 'x'), aspect, result] for (h, aspect), result in self._entries.items()]
+            self._unsaved = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+        tmp_path = f"{self.persist_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'hash_size': self.hash_size, 'entries': entries}, f)
+        os.replace(tmp_path, self.persist_path)
+
+    @staticmethod
+    def _aspect(image):
+        h, w = image.shape[:2]
+        return round(w / h, 2) if h else 0.0
+
+    def key_for(self, image):
+        return crop_hash(image, self.hash_size), self._aspect(image)
+
+    def lookup(self, key):
+        """Return (found, result) for a key from key_for()."""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, result
+            self.misses += 1
+            return False, None
+
+    def store(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            should_save = self.persist_path and self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+        }
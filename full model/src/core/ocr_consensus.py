@@ -0,0 +1,194 @@
+from collections import defaultdict
+
+from src.core.indian_railways import IndianWagonParser
+
+WAGON_NUMBER_LEN = 11
+GAP = None
+
+
+def align(reference, hypothesis):
+    """
+    Levenshtein-align hypothesis to reference. Returns a list with one entry per
+    reference position: the hypothesis character aligned to it, or GAP where the
+    hypothesis dropped it. Characters the hypothesis inserted are discarded.
+    """
+    n, m = len(reference), len(hypothesis)
+    dist = [[0] * (m + 1) for _ in range(n + 1)]
+    for i in range(n + 1):
+        dist[i][0] = i
+    for j in range(m + 1):
+        dist[0][j] = j
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            cost = 0 if reference[i - 1] == hypothesis[j - 1] else 1
+            dist[i][j] = min(dist[i - 1][j - 1] + cost, dist[i - 1][j] + 1, dist[i][j - 1] + 1)
+
+    aligned = [GAP] * n
+    i, j = n, m
+    while i > 0 and j > 0:
+        cost = 0 if reference[i - 1] == hypothesis[j - 1] else 1
+        if dist[i][j] == dist[i - 1][j - 1] + cost:
+            aligned[i - 1] = hypothesis[j - 1]
+            i, j = i - 1, j - 1
+        elif dist[i][j] == dist[i - 1][j] + 1:
+            i -= 1  # Reference char missing from hypothesis
+        else:
+            j -= 1  # Extra char in hypothesis
+    return aligned
+
+
+class TrackConsensus:
+    """
+    OCR hypotheses for one tracked wagon, combined by confidence-weighted voting
+    per digit position.
+
+    The reference layout is the strongest hypothesis of the expected length (the
+    strongest overall if none has it); every hypothesis is aligned to it and
+    votes its confidence for the digit it puts at each position (reads that
+    skip a position abstain). A position's confidence is the winning weight over
+    all weight cast there plus a fixed doubt mass, so a single read never looks
+    certain on its own; the number's confidence is its weakest position.
+    Reads served from the OCR result cache are kept apart (fresh_reads counts
+    the others) so the engine can weigh them down.
+    """
+
+    def __init__(self, expected_len=WAGON_NUMBER_LEN, doubt=0.5):
+        self.expected_len = expected_len
+        self.doubt = doubt
+        self.hypotheses = []  # (digits, confidence, cached)
+        self.attempts = 0
+        self.fresh_reads = 0
+
+    def add(self, text, confidence, cached=False):
+        self.attempts += 1
+        digits = ''.join(filter(str.isdigit, text or ''))
+        if digits:
+            self.hypotheses.append((digits, max(0.0, float(confidence)), cached))
+            if not cached:
+                self.fresh_reads += 1
+
+    def _reference(self):
+        by_len = defaultdict(float)
+        for digits, conf, _ in self.hypotheses:
+            by_len[len(digits)] += conf
+        candidates = [h for h in self.hypotheses if len(h[0]) == self.expected_len]
+        if not candidates:
+            # Prefer the length most of the weight agrees on
+            best_len = max(by_len, key=by_len.get)
+            candidates = [h for h in self.hypotheses if len(h[0]) == best_len]
+        return max(candidates, key=lambda h: h[1])[0]
+
+    def result(self):
+        """
+        {'text', 'confidence', 'position_confidence', 'hypotheses', 'fresh_reads', 'attempts'};
+        text is '' with no reads.
+        """
+        if not self.hypotheses:
+            return {'text': '', 'confidence': 0.0, 'position_confidence': [],
+                    'hypotheses': 0, 'fresh_reads': 0, 'attempts': self.attempts}
+
+        reference = self._reference()
+        votes = [defaultdict(float) for _ in reference]
+        for digits, conf, _ in self.hypotheses:
+            for pos, char in enumerate(align(reference, digits)):
+                if char is not GAP:  # Reads that dropped this position abstain
+                    votes[pos][char] += conf
+
+        text = []
+        position_conf = []
+        for pos_votes in votes:
+            char, weight = max(pos_votes.items(), key=lambda kv: kv[1])
+            text.append(char)
+            position_conf.append(round(weight / (sum(pos_votes.values()) + self.doubt), 3))
+
+        return {
+            'text': ''.join(text),
+            'confidence': min(position_conf) if position_conf else 0.0,
+            'position_confidence': position_conf,
+            'hypotheses': len(self.hypotheses),
+            'fresh_reads': self.fresh_reads,
+            'attempts': self.attempts,
+        }
+
+
+class ConsensusEngine:
+    """
+    Per-track consensus over repeated OCR reads.
+
+    A track is settled once its consensus is a valid wagon number (expected
+    length + validator, by default the Indian Railways check digit) with
+    confidence >= threshold, or a single read of that valid number was at least
+    single_read_conf confident, or once max_attempts reads have been spent on it.
+    Callers stop requesting OCR for settled tracks.
+
+    Reads served from the OCR result cache vote with their confidence scaled by
+    cached_weight and never settle a track by themselves: a valid consensus also
+    needs at least one fresh read, and only fresh reads count as the single
+    confident read.
+
+    Reads that fail the validator are first passed through corrector (by default
+    only unambiguous confusable-letter fixes such as O->0, I->1); a correction
+    votes with its confidence reduced per edit.
+    """
+
+    def __init__(self, threshold=0.75, max_attempts=8, validator=IndianWagonParser.validate_checksum,
+                 expected_len=WAGON_NUMBER_LEN, single_read_conf=0.9, corrector=IndianWagonParser.correct_confusions,
+                 correction_penalty=0.85, cached_weight=0.5):
+        self.threshold = threshold
+        self.max_attempts = max_attempts
+        self.validator = validator
+        self.expected_len = expected_len
+        self.single_read_conf = single_read_conf
+        self.corrector = corrector
+        self.correction_penalty = correction_penalty
+        self.cached_weight = cached_weight
+        self._tracks = {}
+
+    def add(self, track_id, text, confidence, cached=False):
+        track = self._tracks.get(track_id)
+        if track is None:
+            track = self._tracks[track_id] = TrackConsensus(self.expected_len)
+        if text and self.corrector is not None and not self.is_valid(''.join(filter(str.isdigit, text))):
+            corrected = self.corrector(text)
+            if corrected is not None:
+                text, cost = corrected
+                confidence *= self.correction_penalty ** cost
+        if cached:
+            confidence *= self.cached_weight
+        track.add(text, confidence, cached)
+        return self.result(track_id)
+
+    def is_valid(self, text):
+        return len(text) == self.expected_len and bool(self.validator(text))
+
+    def result(self, track_id):
+        track = self._tracks.get(track_id)
+        if track is None:
+            return None
+        res = track.result()
+        res['valid'] = self.is_valid(res['text'])
+        return res
+
+    def is_settled(self, track_id):
+        track = self._tracks.get(track_id)
+        if track is None:
+            return False
+        if track.attempts >= self.max_attempts:
+            return True
+        res = self.result(track_id)
+        if not res['valid'] or not track.fresh_reads:
+            return False
+        if res['confidence'] >= self.threshold:
+            return True
+        # One confident fresh read that already passes the check digit is enough
+        return any(digits == res['text'] and conf >= self.single_read_conf and not cached
+                   for digits, conf, cached in track.hypotheses)
+
+    def finalize(self, track_id):
+        """Remove the track and return its final result (None if it never got a read)."""
+        res = self.result(track_id)
+        self._tracks.pop(track_id, None)
+        return res
+
+    def tracks(self):
+        return list(self._tracks)
@@ -66,13 +66,83 @@
 
 # pip install easyocr
 
+import os
+import cv2
 import easyocr
+import numpy as np
 import torch
 
+from src.core.ocr_cache import OCRResultCache, DEFAULT_CACHE_PATH
+from src.core import cpu_resources
+
+DIGITS = '0123456789'
+OCR_MODES = ('full', 'recognize')
+
+
+def split_lines(gray, min_ink=0.02, min_gap=2, min_height_frac=0.3):
+    """
+    Split a localized number crop into horizontal text lines by row projection.
+    Returns a list of (y0, y1) bands, top to bottom; the whole crop if no split is found.
+    """
+    h, w = gray.shape[:2]
+    _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Ink is whichever polarity is the minority (stencilled numbers can be light on dark or dark on light)
+    if binary.mean() > 0.5:
+        binary = 1 - binary
+    profile = binary.sum(axis=1) > min_ink * w
+
+    bands = []
+    start = None
+    for y, has_ink in enumerate(profile):
+        if has_ink and start is None:
+            start = y
+        elif not has_ink and start is not None:
+            bands.append([start, y])
+            start = None
+    if start is not None:
+        bands.append([start, h])
+
+    # Close small gaps (broken strokes), then drop slivers relative to the tallest line
+    merged = []
+    for band in bands:
+        if merged and band[0] - merged[-1][1] <= min_gap:
+            merged[-1][1] = band[1]
+        else:
+            merged.append(band)
+    if not merged:
+        return [(0, h)]
+    tallest = max(y1 - y0 for y0, y1 in merged)
+    lines = [(y0, y1) for y0, y1 in merged if y1 - y0 >= min_height_frac * tallest]
+
+    # Pad each band a little; the recognizer expects some margin around glyphs
+    pad = max(1, tallest // 8)
+    return [(max(0, y0 - pad), min(h, y1 + pad)) for y0, y1 in lines] or [(0, h)]
+
+
 class WagonOCR:
-    def __init__(self):
-        print("Initializing EasyOCR...")
+    def __init__(self, mode='full', cache=True, cache_path=DEFAULT_CACHE_PATH):
+        """
+        mode: 'full' runs EasyOCR's text detector + recognizer (readtext);
+        'recognize' skips detection and feeds line bands of the (already
+        localized) crop straight to the recognizer with a digit allowlist.
+        cache: True for the default crop-hash result cache, an OCRResultCache
+        instance to share one, or False/None to always run EasyOCR.
+        cache_path: on-disk persistence for the default cache (None = memory only).
+        """
+        if mode not in OCR_MODES:
+            raise ValueError(f"Unknown OCR mode: {mode}")
+        self.mode = mode
+        # EasyOCR runs in the OCR worker process: its own share of the cores
+        cpu_resources.ensure('ocr')
+        print(f"Initializing EasyOCR ({mode})...")
         self.reader = self._init_reader()
+        if cache is True:
+            # Modes read differently, so they keep separate caches
+            if cache_path and mode != 'full':
+                root, ext = os.path.splitext(cache_path)
+                cache_path = f"{root}_{mode}{ext}"
+            cache = OCRResultCache(persist_path=cache_path)
+        self.cache = cache or None
 
     def _init_reader(self):
         """Prefer GPU when available; fall back to CPU otherwise."""
@@ -88,26 +158,70 @@ class WagonOCR:
 
         return easyocr.Reader(['en'], gpu=False)
 
-    def process_wagon(self, wagon_crop_image):
+    def _recognize(self, crop):
+        """Recognizer only: one box per text line, digits only. Same (bbox, text, conf) format as readtext."""
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        w = gray.shape[1]
+        boxes = [[0, w, y0, y1] for y0, y1 in split_lines(gray)]
+        results = self.reader.recognize(gray, horizontal_list=boxes, free_list=[],
+                                        allowlist=DIGITS, detail=1)
+        # Top-to-bottom reading order
+        return sorted(results, key=lambda r: np.min(np.asarray(r[0])[:, 1]))
+
+    def read(self, wagon_crop_image):
+        """
+        OCR one crop. Returns (text, confidence, cached): text is None when nothing
+        readable was found; confidence is the length-weighted mean of the kept segments;
+        cached is True when the result came from the crop-hash cache.
+        """
         if wagon_crop_image is None or wagon_crop_image.size == 0:
-            return None
+            return None, 0.0, False
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key_for(wagon_crop_image)
+            found, cached = self.cache.lookup(key)
+            if found:
+                print(f"      [OCR Cache] Hit: {cached[0]}")
+                return cached[0], cached[1], True
 
         try:
-            results = self.reader.readtext(wagon_crop_image)
+            if self.mode == 'recognize':
+                results = self._recognize(wagon_crop_image)
+            else:
+                results = self.reader.readtext(wagon_crop_image)
         except Exception as e:
             print(f"OCR Error: {e}")
-            return None
+            return None, 0.0, False
 
         detected_text = []
+        weighted_conf = 0.0
         for (bbox, text, confidence) in results:
             print(f"      [EasyOCR Raw] Text: '{text}' | Conf: {confidence:.2f}")
             if confidence > 0.3 and len(text) >= 1:
                 detected_text.append(text)
+                weighted_conf += confidence * len(text)
 
         if not detected_text:
             print("      [OCR] No valid text found after filtering.")
-            return None
+            full_text, confidence = None, 0.0
+        else:
+            full_text = " ".join(detected_text)
+            confidence = round(float(weighted_conf) / sum(len(t) for t in detected_text), 4)
+            print(f"      [Final Selection] {full_text} ({confidence:.2f})")
+
+        # Empty reads are cached too; exceptions above are not (they may be transient)
+        if key is not None:
+            self.cache.store(key, [full_text, confidence])
+        return full_text, confidence, False
+
+    def process_wagon(self, wagon_crop_image):
+        """Text only (None if nothing was read)."""
+        return self.read(wagon_crop_image)[0]
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
 
-        full_text = " ".join(detected_text)
-        print(f"      [Final Selection] {full_text}")
-        return full_text
\ No newline at end of file
+    def save_cache(self):
+        if self.cache is not None:
+            self.cache.save()
\ No newline at end of file
@@ -0,0 +1,212 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+# Histogram bucket upper bounds (ms); the last bucket is everything slower
+HIST_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class _NullSpan:
+    """Shared no-op span handed out while profiling is disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'args', 'start')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._add(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class Profiler:
+    """
+    Span-based timing for the pipeline stages.
+
+    Use `with profiler.span('model_b', wagon=3):`, `@profiled('name')`, or
+    clock()/record() around code that can't be indented. While disabled,
+    span() returns a shared no-op object and record() returns immediately.
+
+    Each span is kept as a trace event (up to max_events, then only counted)
+    and as a duration sample for the per-stage summary. Events from another
+    process are added with merge(); timestamps are wall-clock so they line up.
+    """
+
+    def __init__(self, enabled=False, process_name=None, max_events=500000):
+        self.enabled = enabled
+        self.process_name = process_name or f"pid {os.getpid()}"
+        self.max_events = max_events
+        # perf_counter -> epoch seconds, so events from several processes share a time base
+        self._offset = time.time() - time.perf_counter()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._events = []      # chrome trace events (dicts)
+            self._samples = defaultdict(list)  # span name -> durations (ms)
+            self._dropped = 0
+
+    # -----------------------------
+    # Recording
+    # -----------------------------
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def clock(self):
+        """Start time for record(); 0.0 when disabled."""
+        return time.perf_counter() if self.enabled else 0.0
+
+    def record(self, name, start, end=None, **args):
+        """Record a span that started at clock() (and ends now unless end is given)."""
+        if not self.enabled:
+            return
+        self._add(name, start, time.perf_counter() if end is None else end, args)
+
+    def record_wall(self, name, start_epoch, end_epoch=None, **args):
+        """Record a span given wall-clock times (e.g. a timestamp sent by another process)."""
+        if not self.enabled:
+            return
+        end_epoch = time.time() if end_epoch is None else end_epoch
+        self._add(name, start_epoch - self._offset, end_epoch - self._offset, args)
+
+    def _add(self, name, start, end, args):
+        event = {
+            'name': name,
+            'cat': name.split('.')[0],
+            'ph': 'X',
+            'ts': round((start + self._offset) * 1e6, 1),
+            'dur': round((end - start) * 1e6, 1),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self._samples[name].append((end - start) * 1000)
+            if len(self._events) < self.max_events:
+                self._events.append(event)
+            else:
+                self._dropped += 1
+
+    # -----------------------------
+    # Cross-process
+    # -----------------------------
+    def drain(self):
+        """Take this process's events (plus its name) and clear them, for merge() elsewhere."""
+        with self._lock:
+            events = self._events + [self._process_meta()]
+            self._events = []
+            self._samples = defaultdict(list)
+            self._dropped = 0
+        return events
+
+    def merge(self, events):
+        with self._lock:
+            for event in events:
+                if event.get('ph') == 'X':
+                    self._samples[event['name']].append(event['dur'] / 1000)
+                if len(self._events) < self.max_events:
+                    self._events.append(event)
+                else:
+                    self._dropped += 1
+
+    def _process_meta(self):
+        return {'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': self.process_name}}
+
+    # -----------------------------
+    # Export
+    # -----------------------------
+    def summary(self):
+        """Per span name: count, total/mean/percentile ms and a latency histogram, slowest total first."""
+        with self._lock:
+            samples = {name: list(values) for name, values in self._samples.items()}
+
+        stats = {}
+        for name, values in samples.items():
+            arr = np.asarray(values, dtype=np.float64)
+            p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+            counts = np.bincount(np.searchsorted(HIST_BUCKETS_MS, arr), minlength=len(HIST_BUCKETS_MS) + 1)
+            labels = [f"<={b}ms" for b in HIST_BUCKETS_MS] + [f">{HIST_BUCKETS_MS[-1]}ms"]
+            stats[name] = {
+                'count': len(arr),
+                'total_ms': round(float(arr.sum()), 2),
+                'mean_ms': round(float(arr.mean()), 3),
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'p99_ms': round(float(p99), 3),
+                'max_ms': round(float(arr.max()), 3),
+                'histogram': {label: int(c) for label, c in zip(labels, counts) if c},
+            }
+        return dict(sorted(stats.items(), key=lambda kv: -kv[1]['total_ms']))
+
+    def export_chrome_trace(self, path):
+        """Write Chrome trace-event JSON (open in chrome://tracing or ui.perfetto.dev)."""
+        with self._lock:
+            events = [self._process_meta()] + list(self._events)
+            dropped = self._dropped
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'dropped_events': dropped}}, f)
+        return path
+
+    def export_summary(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        return path
+
+
+# One profiler per process; PIPELINE_PROFILE=1 turns it on (inherited by spawned workers)
+_profiler = Profiler(enabled=os.environ.get("PIPELINE_PROFILE") == "1")
+
+def get_profiler():
+    return _profiler
+
+def enable_profiling(process_name=None):
+    """Turn profiling on here and in worker processes started from now on."""
+    os.environ["PIPELINE_PROFILE"] = "1"
+    _profiler.enabled = True
+    if process_name:
+        _profiler.process_name = process_name
+    return _profiler
+
+
+def profiled(name=None):
+    """Decorator: time every call as a span (checked per call, so enabling later works)."""
+    def decorate(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _profiler.enabled:
+                return fn(*args, **kwargs)
+            with _Span(_profiler, label, None):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import deque, OrderedDict
+
+import numpy as np
+
+
+# -----------------------------
+# Pipeline side: collects live numbers for one run
+# -----------------------------
+class ProgressReporter:
+    """
+    Collects live progress for a single inspection and pushes snapshots to a sink.
+
+    The sink is any callable taking a snapshot dict (e.g. ProgressStore.update
+    in-process, or a multiprocessing queue's put from a worker). Snapshots are
+    rate-limited so publishing from the frame loop stays cheap.
+    """
+
+    FIELDS = ('state', 'total_frames', 'frames_processed', 'wagons_counted',
+              'ocr_requested', 'ocr_completed', 'last_wagon')
+
+    def __init__(self, inspection_id, sink=None, total_frames=0, interval=0.5, window=500):
+        self.inspection_id = inspection_id
+        self.sink = sink if sink is not None else get_store().update
+        self.interval = interval
+        self.window = window
+
+        self.state = "PROCESSING"
+        self.total_frames = total_frames
+        self.frames_processed = 0
+        self.wagons_counted = 0
+        self.ocr_requested = 0
+        self.ocr_completed = 0
+        self.last_wagon = None
+        self.extra = {}
+
+        self.started_at = time.time()
+        self._frame_times = deque(maxlen=50)
+        self._stages = {}
+        self._last_publish = 0.0
+
+    def frame_done(self):
+        self.frames_processed += 1
+        self._frame_times.append(time.time())
+
+    def record_stage(self, stage, ms):
+        """Record one latency sample (milliseconds) for a pipeline stage."""
+        samples = self._stages.get(stage)
+        if samples is None:
+            samples = self._stages[stage] = deque(maxlen=self.window)
+        samples.append(ms)
+
+    def update(self, **fields):
+        """Set known counters directly; anything else is passed through in the snapshot."""
+        for key, value in fields.items():
+            if key in self.FIELDS:
+                setattr(self, key, value)
+            else:
+                self.extra[key] = value
+
+    def fps(self):
+        if len(self._frame_times) < 2:
+            return 0.0
+        span = self._frame_times[-1] - self._frame_times[0]
+        return (len(self._frame_times) - 1) / span if span > 0 else 0.0
+
+    def snapshot(self):
+        stages = {}
+        for stage, samples in self._stages.items():
+            if not samples:
+                continue
+            arr = np.fromiter(samples, dtype=np.float64, count=len(samples))
+            p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+            stages[stage] = {'count': len(arr), 'mean_ms': round(float(arr.mean()), 2),
+                             'p50_ms': round(float(p50), 2), 'p95_ms': round(float(p95), 2),
+                             'p99_ms': round(float(p99), 2)}
+
+        snap = {
+            'inspection_id': self.inspection_id,
+            'state': self.state,
+            'frames_processed': self.frames_processed,
+            'total_frames': self.total_frames,
+            'progress': round(self.frames_processed / self.total_frames, 4) if self.total_frames else None,
+            'fps': round(self.fps(), 2),
+            'wagons_counted': self.wagons_counted,
+            'ocr_queue_depth': self.ocr_requested - self.ocr_completed,
+            'ocr_requested': self.ocr_requested,
+            'ocr_completed': self.ocr_completed,
+            'last_wagon': self.last_wagon,
+            'elapsed_s': round(time.time() - self.started_at, 1),
+            'stages': stages,
+            'updated_at': time.time(),
+        }
+        snap.update(self.extra)
+        return snap
+
+    def publish(self, force=False):
+        now = time.time()
+        if not force and now - self._last_publish < self.interval:
+            return
+        self._last_publish = now
+        try:
+            self.sink(self.snapshot())
+        except Exception as e:
+            # Progress must never take the pipeline down
+            print(f"[PROGRESS] Publish failed: {e}")
+
+    def finish(self, state):
+        self.state = state
+        self.publish(force=True)
+
+
+# -----------------------------
+# API side: latest snapshot per inspection
+# -----------------------------
+class ProgressStore:
+    """Thread-safe in-memory store of the latest snapshot per inspection."""
+
+    def __init__(self, max_finished=50):
+        self.max_finished = max_finished
+        self._snapshots = OrderedDict()
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def update(self, snapshot):
+        with self._lock:
+            key = snapshot['inspection_id']
+            self._snapshots.pop(key, None)
+            self._snapshots[key] = snapshot
+            self._version += 1
+
+            # Forget the oldest finished runs
+            finished = [k for k, s in self._snapshots.items() if s['state'] != 'PROCESSING']
+            for k in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._snapshots[k]
+
+    def get(self, inspection_id):
+        with self._lock:
+            return self._snapshots.get(inspection_id)
+
+    def all(self):
+        with self._lock:
+            return list(self._snapshots.values())
+
+    def version(self):
+        return self._version
+
+    def summary(self):
+        """Dashboard stats (same keys the StatsPanel already reads)."""
+        snaps = self.all()
+        active = [s for s in snaps if s['state'] == 'PROCESSING']
+        latest = snaps[-1] if snaps else None
+        return {
+            'total_wagons': sum(s['wagons_counted'] for s in active) if active else (latest['wagons_counted'] if latest else 0),
+            'last_wagon_id': (latest or {}).get('last_wagon') or "N/A",
+            'defects_found': 0,
+            'status': f"Processing ({len(active)})" if active else "Idle",
+            'fps': round(sum(s['fps'] for s in active), 2),
+            'ocr_queue_depth': sum(s['ocr_queue_depth'] for s in active),
+        }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus_text(store, extra_gauges=None):
+    """
+    Render the store in Prometheus text exposition format.
+    extra_gauges: optional {metric_name: (help, [(labels_dict, value), ...])}.
+    """
+    gauges = {
+        'wagon_inspection_frames_processed': ('Frames processed so far', 'frames_processed'),
+        'wagon_inspection_frames_total': ('Frames in the video', 'total_frames'),
+        'wagon_inspection_fps': ('Current processing frames per second', 'fps'),
+        'wagon_inspection_wagons_counted': ('Wagons counted so far', 'wagons_counted'),
+        'wagon_inspection_ocr_queue_depth': ('OCR requests in flight', 'ocr_queue_depth'),
+    }
+    snaps = store.all()
+    lines = []
+    for name, (help_text, field) in gauges.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for s in snaps:
+            lines.append(f'{name}{{inspection_id="{s["inspection_id"]}",state="{_escape(s["state"])}"}} {s[field] or 0}')
+
+    name = 'wagon_inspection_stage_latency_ms'
+    lines.append(f"# HELP {name} Per-stage latency percentiles over the recent window")
+    lines.append(f"# TYPE {name} summary")
+    for s in snaps:
+        for stage, st in s['stages'].items():
+            labels = f'inspection_id="{s["inspection_id"]}",stage="{_escape(stage)}"'
+            for q, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+                lines.append(f'{name}{{{labels},quantile="{q}"}} {st[key]}')
+            lines.append(f'{name}_count{{{labels}}} {st["count"]}')
+
+    for metric, (help_text, samples) in (extra_gauges or {}).items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for labels, value in samples:
+            label_str = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f'{metric}{{{label_str}}} {value}' if label_str else f'{metric} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+
+# One store per process (the API process is the one that serves it)
+_store = ProgressStore()
+
+def get_store():
+    return _store
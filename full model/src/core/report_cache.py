@@ -0,0 +1,112 @@
+import os
+import glob
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.core import database
+from src.core import report_generator
+from src.core import image_service
+
+REPORT_DIR = os.path.join(os.path.dirname(__file__), '../../full model/detection/reports')
+THUMB_WIDTH = 160
+
+# Thumbnail resizing is mostly cv2 work (releases the GIL), so threads are enough
+_thumb_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="report-thumbs")
+# Separate pool for whole-report builds so they never wait on their own thumbnail tasks
+_build_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-build")
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def _lock_for(key):
+    with _build_locks_guard:
+        return _build_locks.setdefault(key, threading.Lock())
+
+
+def report_path(inspection, thumbnails=False):
+    """Cache file for this inspection at its current content version."""
+    suffix = "_thumbs" if thumbnails else ""
+    version = inspection.get('content_version') or 0
+    return os.path.abspath(os.path.join(REPORT_DIR, f"report_{inspection['id']}_v{version}{suffix}.pdf"))
+
+
+def report_etag(inspection, thumbnails=False):
+    suffix = "-t" if thumbnails else ""
+    return f'"{inspection["id"]}-{inspection.get("content_version") or 0}{suffix}"'
+
+
+def _make_thumbnail(wagon):
+    """Small JPEG of the best available image for a wagon row. Returns (row id, path or None)."""
+    src = wagon.get('deblurred_image_path') or wagon.get('original_image_path') or wagon.get('cropped_number_path')
+    if not src:
+        return wagon['id'], None
+    try:
+        # Shared with the /images endpoint, so thumbnails are generated once for both
+        path, _, _ = image_service.get_derivative(image_service.to_relative(src) or src,
+                                                   width=THUMB_WIDTH, fmt='jpg', quality=75)
+    except (image_service.ImageServiceError, OSError):
+        return wagon['id'], None
+    return wagon['id'], path
+
+
+def _remove_stale(inspection_id, keep_path, thumbnails):
+    """Delete older cached versions of the same report variant."""
+    for path in glob.glob(os.path.join(REPORT_DIR, f"report_{inspection_id}_v*.pdf")):
+        path = os.path.abspath(path)
+        if path != keep_path and path.endswith("_thumbs.pdf") == thumbnails:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def build_report(inspection_id, thumbnails=False):
+    """
+    Generate the PDF for the inspection's current content version and write it
+    to the cache. Returns (path, etag), or (None, None) if the inspection is unknown.
+    """
+    inspection = database.get_inspection_by_id(inspection_id)
+    if not inspection:
+        return None, None
+
+    path = report_path(inspection, thumbnails)
+    etag = report_etag(inspection, thumbnails)
+    with _lock_for((inspection_id, thumbnails)):
+        if os.path.exists(path):
+            return path, etag
+
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        wagons = database.get_wagons_for_inspection(inspection_id)
+
+        thumbs = None
+        if thumbnails:
+            thumbs = dict(_thumb_pool.map(_make_thumbnail, wagons))
+
+        pdf = report_generator.generate_report(inspection, wagons, thumbnails=thumbs)
+        pdf_bytes = pdf.output(dest='S').encode('latin-1')
+
+        # Write-then-rename so readers (and other processes) never see a half-written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, path)
+
+        _remove_stale(inspection_id, path, thumbnails)
+        print(f"[REPORT] Cached report for inspection {inspection_id} -> {path}")
+    return path, etag
+
+
+def get_report(inspection_id, thumbnails=False):
+    """Cached (path, etag) for the current content version, building it on a miss."""
+    inspection = database.get_inspection_by_id(inspection_id)
+    if not inspection:
+        return None, None
+    path = report_path(inspection, thumbnails)
+    if os.path.exists(path):
+        return path, report_etag(inspection, thumbnails)
+    return build_report(inspection_id, thumbnails)
+
+
+def prebuild_in_background(inspection_id):
+    """Warm the thumbnail variant without blocking the caller."""
+    return _build_pool.submit(build_report, inspection_id, True)
@@ -1,5 +1,15 @@
 from fpdf import FPDF
 import datetime
+import cv2
+
+def _fit_image(path, max_w, max_h):
+    """(w, h) in mm that keeps the image's aspect ratio inside max_w x max_h, or None if unreadable."""
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    img_h, img_w = img.shape[:2]
+    scale = min(max_w / img_w, max_h / img_h)
+    return img_w * scale, img_h * scale
 
 class PDFReport(FPDF):
     def header(self):
@@ -12,7 +22,11 @@ class PDFReport(FPDF):
         self.set_font('Arial', 'I', 8)
         self.cell(0, 10, 'Page ' + str(self.page_no()) + '/{nb}', 0, 0, 'C')
 
-def generate_report(inspection, wagons):
+def generate_report(inspection, wagons, thumbnails=None):
+    """
+    Build the inspection PDF.
+    thumbnails: optional {wagon row id: small JPEG path} embedded as an extra column.
+    """
     pdf = PDFReport()
     pdf.alias_nb_pages()
     pdf.add_page()
@@ -41,12 +55,17 @@ def generate_report(inspection, wagons):
     pdf.ln(10)
 
     # Table Header
+    # With thumbnails, narrow the text columns so the table still fits the page
+    row_h = 18 if thumbnails else 10
+    ocr_w, ts_w = (40, 30) if thumbnails else (50, 40)
     pdf.set_font('Arial', 'B', 10)
+    if thumbnails:
+        pdf.cell(30, 10, 'Image', 1)
     pdf.cell(20, 10, 'Index', 1)
-    pdf.cell(50, 10, 'OCR Result', 1)
+    pdf.cell(ocr_w, 10, 'OCR Result', 1)
     pdf.cell(30, 10, 'Confidence', 1)
     pdf.cell(30, 10, 'Defects', 1)
-    pdf.cell(40, 10, 'Timestamp', 1)
+    pdf.cell(ts_w, 10, 'Timestamp', 1)
     pdf.ln()
 
     # Table Rows
@@ -57,11 +76,27 @@ def generate_report(inspection, wagons):
         defects = wagon['defects']
         ts = wagon['timestamp'].split(' ')[1] if ' ' in wagon['timestamp'] else wagon['timestamp']
         
-        pdf.cell(20, 10, str(wagon['wagon_index']), 1)
-        pdf.cell(50, 10, str(ocr_text), 1)
-        pdf.cell(30, 10, conf, 1)
-        pdf.cell(30, 10, str(defects), 1)
-        pdf.cell(40, 10, ts, 1)
+        if thumbnails:
+            # New page first so the image and its row stay together
+            if pdf.get_y() + row_h > pdf.page_break_trigger:
+                pdf.add_page()
+            x, y = pdf.get_x(), pdf.get_y()
+            pdf.cell(30, row_h, '', 1)
+            thumb = thumbnails.get(wagon['id'])
+            size = _fit_image(thumb, 28, row_h - 2) if thumb else None
+            if size:
+                # Scaled to fit the cell both ways (wide crops would otherwise spill into the next columns)
+                img_w, img_h = size
+                try:
+                    pdf.image(thumb, x + (30 - img_w) / 2, y + (row_h - img_h) / 2, w=img_w, h=img_h)
+                except Exception:
+                    pass  # Unreadable thumbnail: leave the cell empty
+
+        pdf.cell(20, row_h, str(wagon['wagon_index']), 1)
+        pdf.cell(ocr_w, row_h, str(ocr_text), 1)
+        pdf.cell(30, row_h, conf, 1)
+        pdf.cell(30, row_h, str(defects), 1)
+        pdf.cell(ts_w, row_h, ts, 1)
         pdf.ln()
 
     return pdf
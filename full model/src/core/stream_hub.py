@@ -0,0 +1,218 @@
+import threading
+import time
+
+import cv2
+
+
+# Seconds before restarting a crashed capture thread / reopening a failed source (doubles up to the max)
+MAX_BACKOFF = 30.0
+
+
+def _backoff(previous):
+    return min(MAX_BACKOFF, max(1.0, previous * 2))
+
+
+class FrameBroadcaster:
+    """
+    One capture per stream: a background thread decodes frames once, encodes
+    each requested variant to JPEG once, and keeps only the latest result.
+    Viewers always take the newest frame, so a slow client drops frames instead
+    of building a backlog, and ten viewers cost the same as one.
+
+    Variants are 'full' / 'preview', optionally with ':overlay' (the overlay
+    callable drawn on a copy of the same decoded frame), so overlay and plain
+    viewers share the capture too.
+    """
+
+    def __init__(self, stream_key, open_source, target_fps=25.0, jpeg_quality=80,
+                 preview_width=640, overlay=None, idle_timeout=10.0):
+        self.stream_key = stream_key
+        self.open_source = open_source  # callable -> cv2.VideoCapture (re-called on reconnect)
+        self.target_fps = target_fps
+        self.jpeg_quality = jpeg_quality
+        self.preview_width = preview_width
+        self.overlay = overlay  # optional callable(frame) -> frame, applied before encoding
+        self.idle_timeout = idle_timeout
+
+        self._cond = threading.Condition()
+        self._frames = {}  # variant -> (seq, jpeg bytes)
+        self._seq = 0
+        self._wanted = {}  # variant -> number of viewers
+        self._last_viewer = time.time()
+        self._thread = None
+        self._running = False
+        self._restart_backoff = 0.0
+        self._restart_at = 0.0  # after a crash: don't restart the capture before this time
+
+    # -----------------------------
+    # Viewer side
+    # -----------------------------
+    def _start(self):
+        # Caller holds the lock
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"stream-{self.stream_key}", daemon=True)
+        self._thread.start()
+
+    def add_viewer(self, variant):
+        with self._cond:
+            self._wanted[variant] = self._wanted.get(variant, 0) + 1
+            if not self._running and time.time() >= self._restart_at:
+                self._start()
+
+    def remove_viewer(self, variant):
+        with self._cond:
+            self._wanted[variant] = max(0, self._wanted.get(variant, 0) - 1)
+            if self._wanted[variant] == 0:
+                del self._wanted[variant]
+            self._last_viewer = time.time()
+
+    def running(self):
+        return self._running
+
+    def viewers(self):
+        with self._cond:
+            return sum(self._wanted.values())
+
+    def wait_frame(self, variant, last_seq, timeout=1.0):
+        """
+        Block until a frame newer than last_seq exists. Returns (seq, jpeg) or None.
+        If the capture thread died, restarts it once its backoff has passed
+        (waiting out the backoff otherwise), so callers never spin.
+        """
+        with self._cond:
+            if not self._running:
+                delay = self._restart_at - time.time()
+                if delay > 0:
+                    self._cond.wait(min(timeout, delay))
+                    return None
+                if self._wanted:
+                    print(f"[STREAM] {self.stream_key}: restarting capture.")
+                    self._start()
+            self._cond.wait_for(lambda: self._frames.get(variant, (0,))[0] > last_seq or not self._running,
+                                timeout=timeout)
+            frame = self._frames.get(variant)
+            if frame is None or frame[0] <= last_seq:
+                return None
+            return frame
+
+    # -----------------------------
+    # Capture side
+    # -----------------------------
+    def _encode(self, frame, variant):
+        if variant.split(':')[0] == 'preview' and frame.shape[1] > self.preview_width:
+            scale = self.preview_width / frame.shape[1]
+            frame = cv2.resize(frame, (self.preview_width, int(frame.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return buffer.tobytes() if ok else None
+
+    def _run(self):
+        cap = None
+        open_backoff = 0.0
+        frames_since_open = 0
+        frame_interval = 1.0 / self.target_fps if self.target_fps else 0.0
+        next_due = time.time()
+        try:
+            while True:
+                with self._cond:
+                    idle = not self._wanted and time.time() - self._last_viewer > self.idle_timeout
+                    if idle:
+                        # Decide and mark stopped under the lock so a new viewer restarts the thread
+                        print(f"[STREAM] {self.stream_key}: no viewers, releasing capture.")
+                        self._running = False
+                        self._frames.clear()
+                        self._cond.notify_all()
+                        break
+                    variants = list(self._wanted)
+
+                if cap is None:
+                    try:
+                        cap = self.open_source()
+                    except Exception as e:
+                        open_backoff = _backoff(open_backoff)
+                        print(f"[STREAM] {self.stream_key}: could not open source: {e} (retrying in {open_backoff:.0f}s)")
+                        time.sleep(open_backoff)
+                        continue
+                    frames_since_open = 0
+
+                success, frame = cap.read()
+                if not success:
+                    cap.release()
+                    cap = None
+                    if frames_since_open:
+                        # If video ends, try to reconnect
+                        print(f"[STREAM] {self.stream_key} ended, restarting...")
+                        continue
+                    # Opened but gave no frame: back off like a failed open instead of spinning
+                    open_backoff = _backoff(open_backoff)
+                    print(f"[STREAM] {self.stream_key}: source opened but returned no frames "
+                          f"(retrying in {open_backoff:.0f}s)")
+                    time.sleep(open_backoff)
+                    continue
+                # Only a frame actually read proves the source works
+                frames_since_open += 1
+                open_backoff = 0.0
+
+                # Pace to target FPS; skip encode work entirely when nobody is watching
+                now = time.time()
+                if now < next_due:
+                    time.sleep(next_due - now)
+                next_due = max(next_due + frame_interval, time.time())
+                if not variants:
+                    continue
+
+                sources = {}
+                if any(not v.endswith(':overlay') for v in variants):
+                    sources[False] = frame
+                if self.overlay is not None and any(v.endswith(':overlay') for v in variants):
+                    try:
+                        sources[True] = self.overlay(frame.copy())
+                    except Exception as e:
+                        print(f"[STREAM] Overlay failed: {e}")
+                        sources[True] = frame
+
+                encoded = {v: self._encode(sources.get(v.endswith(':overlay'), frame), v) for v in variants}
+                with self._cond:
+                    self._restart_backoff = 0.0
+                    self._seq += 1
+                    for v, jpeg in encoded.items():
+                        if jpeg is not None:
+                            self._frames[v] = (self._seq, jpeg)
+                    self._cond.notify_all()
+        except Exception as e:
+            with self._cond:
+                self._restart_backoff = _backoff(self._restart_backoff)
+                self._restart_at = time.time() + self._restart_backoff
+                print(f"[STREAM] {self.stream_key}: capture thread crashed: {e} "
+                      f"(restarting in {self._restart_backoff:.0f}s if anyone is watching)")
+                self._running = False
+                self._frames.clear()
+                self._cond.notify_all()
+        finally:
+            if cap is not None:
+                cap.release()
+
+
+class StreamHub:
+    """Registry of FrameBroadcasters, one per stream (overlay is a per-viewer variant)."""
+
+    def __init__(self, **broadcaster_kwargs):
+        self.broadcaster_kwargs = broadcaster_kwargs
+        self._broadcasters = {}
+        self._lock = threading.Lock()
+
+    def get(self, stream_key, open_source, overlay=None):
+        with self._lock:
+            b = self._broadcasters.get(stream_key)
+            if b is None:
+                b = FrameBroadcaster(stream_key, open_source, overlay=overlay, **self.broadcaster_kwargs)
+                self._broadcasters[stream_key] = b
+            return b
+
+    def stats(self):
+        with self._lock:
+            return {str(k): {'viewers': b.viewers(), 'running': b.running()} for k, b in self._broadcasters.items()}
+
+
+def mjpeg_part(jpeg):
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
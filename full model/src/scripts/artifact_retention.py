@@ -0,0 +1,27 @@
+import argparse
+import sys
+import os
+
+# Add project root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import src.core.database as database
+import src.core.artifact_store as artifact_store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expire old wagon artifacts and delete unreferenced blobs.")
+    parser.add_argument("--max_age_days", type=float, default=None, help="Release artifacts of inspections older than this.")
+    parser.add_argument("--disposable_after_days", type=float, default=1.0,
+                        help="Release FAILED/CANCELLED inspections after this many days.")
+    parser.add_argument("--quota_mb", type=float, default=None, help="Release oldest inspections until the store fits.")
+    parser.add_argument("--dry_run", action="store_true", help="Report what would be deleted without deleting.")
+    args = parser.parse_args()
+
+    database.init_db()
+    artifact_store.init_store()
+    print(f"[ARTIFACTS] Before: {artifact_store.store_stats()}")
+    artifact_store.run_retention(max_age_days=args.max_age_days,
+                                 disposable_after_days=args.disposable_after_days,
+                                 quota_mb=args.quota_mb,
+                                 dry_run=args.dry_run)
+    print(f"[ARTIFACTS] After: {artifact_store.store_stats()}")
@@ -0,0 +1,461 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+import cv2
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: fall back to psutil below
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Add the project root to the python path so we can import from src
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.core import cpu_resources
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), '../../full model/detection/benchmarks')
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, 'baseline.json')
+STAGES = ('blur', 'zero_dce', 'nafnet', 'nafnet_number', 'model_a', 'model_b', 'ocr', 'pipeline')
+# Metrics compared against the baseline: +1 = higher is worse, -1 = lower is worse
+COMPARED = (('throughput_per_s', -1), ('p95_ms', 1), ('peak_rss_mb', 1))
+
+
+# -----------------------------
+# Memory
+# -----------------------------
+def _rss_mb():
+    if psutil is None:
+        return None
+    return round(psutil.Process(os.getpid()).memory_info().rss / 1e6, 1)
+
+def _peak_rss_mb(who='self'):
+    """Peak RSS of this process (or its reaped children) in MB."""
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+        # ru_maxrss is KB on Linux, bytes on macOS
+        return round(usage.ru_maxrss / (1e6 if sys.platform == 'darwin' else 1e3), 1)
+    if psutil is not None and who == 'self':
+        info = psutil.Process(os.getpid()).memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / 1e6, 1)
+    return None
+
+
+# -----------------------------
+# Inputs (fixed seed -> identical inputs every run)
+# -----------------------------
+def _draw_number(img, rng, x, y, scale=0.9):
+    text = ''.join(str(d) for d in rng.integers(0, 10, 11))
+    cv2.putText(img, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, scale, (235, 235, 235), 2, cv2.LINE_AA)
+
+def synthetic_frame(rng, width=1280, height=720):
+    """A frame of flat-coloured wagons with painted numbers over a noisy gradient."""
+    grad = np.linspace(90, 160, height, dtype=np.float32)[:, None, None]
+    frame = np.clip(grad + rng.normal(0, 8, (height, width, 3)), 0, 255).astype(np.uint8)
+    x = int(rng.integers(-200, 100))
+    y1, y2 = int(height * 0.25), int(height * 0.85)
+    while x < width:
+        wagon_w = int(rng.integers(350, 500))
+        color = tuple(int(c) for c in rng.integers(40, 120, 3))
+        cv2.rectangle(frame, (x, y1), (x + wagon_w, y2), color, -1)
+        _draw_number(frame, rng, x + 40, y1 + 60)
+        x += wagon_w + int(rng.integers(20, 60))
+    return frame
+
+def synthetic_wagon_crop(rng, height=320, width=480):
+    """Wagon crop with horizontal motion blur (what the deblur stage sees)."""
+    color = rng.integers(40, 120, 3).astype(np.float32)
+    crop = np.clip(color + rng.normal(0, 6, (height, width, 3)), 0, 255).astype(np.uint8)
+    _draw_number(crop, rng, 30, 70)
+    return cv2.blur(crop, (int(rng.integers(5, 15)), 1))
+
+def synthetic_number_crop(rng, height=96, width=360):
+    crop = np.full((height, width, 3), int(rng.integers(30, 80)), np.uint8)
+    _draw_number(crop, rng, 8, height // 2 + 12, scale=1.1)
+    return cv2.GaussianBlur(crop, (3, 3), 0)
+
+def read_clip(path, max_frames):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise RuntimeError(f"Could not read frames from {path}")
+    return frames
+
+def build_inputs(cfg):
+    rng = np.random.default_rng(cfg['seed'])
+    if cfg['clip']:
+        frames = read_clip(cfg['clip'], cfg['frames'])
+    else:
+        frames = [synthetic_frame(rng) for _ in range(cfg['frames'])]
+    wagon_crops = [synthetic_wagon_crop(rng) for _ in range(cfg['frames'])]
+    if cfg['crops']:
+        from src.scripts.benchmark_ocr import load_crops
+        number_crops = [img for _, img in load_crops(cfg['crops'], cfg['frames'])]
+    else:
+        number_crops = [synthetic_number_crop(rng) for _ in range(cfg['frames'])]
+    return {'frames': frames, 'wagon_crops': wagon_crops, 'number_crops': number_crops}
+
+
+# -----------------------------
+# Models (random weights allowed with --allow-random)
+# -----------------------------
+def _weights(path, cfg, what):
+    if path and os.path.exists(path):
+        return path
+    if not cfg['allow_random']:
+        raise FileNotFoundError(f"{what} weights not found at {path} (pass --allow-random to use random weights)")
+    print(f"[BENCH] {what}: weights not found at {path}, using random weights")
+    return None
+
+def _yolo(path, cfg, what):
+    from ultralytics import YOLO
+    path = _weights(path, cfg, what)
+    # yolov8n.yaml builds the architecture without downloading weights
+    return YOLO(path or 'yolov8n.yaml')
+
+
+# -----------------------------
+# Stages: each returns (callable, inputs) to be timed per item
+# -----------------------------
+def _setup_stage(stage, cfg, inputs):
+    if stage == 'blur':
+        from src.core.blur_metric import calculate_blur_score
+        return calculate_blur_score, inputs['wagon_crops']
+    if stage == 'zero_dce':
+        from src.core.enhancer import LowLightEnhancer
+        enhancer = LowLightEnhancer(weights_path=_weights(cfg['zero_dce'], cfg, 'Zero-DCE'), device=cfg['device'])
+        return enhancer.enhance_frame, inputs['frames']
+    if stage == 'nafnet':
+        from src.core.deblur_engine import DeblurGANEngine
+        engine = DeblurGANEngine(_weights(cfg['deblur_model'], cfg, 'NAFNet'))
+        return engine.deblur, inputs['wagon_crops']
+    if stage == 'nafnet_number':
+        # Number-scope deblurring: NAFNet on padded number crops only
+        from src.core.deblur_engine import DeblurGANEngine
+        engine = DeblurGANEngine(_weights(cfg['deblur_model'], cfg, 'NAFNet'))
+        return engine.deblur, inputs['number_crops']
+    if stage == 'model_a':
+        model = _yolo(cfg['model_a'], cfg, 'Model A')
+        return (lambda frame: model.predict(frame, verbose=False)), inputs['frames']
+    if stage == 'model_b':
+        model = _yolo(cfg['model_b'], cfg, 'Model B')
+        return (lambda crop: model.predict(crop, verbose=False, conf=0.25)), inputs['wagon_crops']
+    if stage == 'ocr':
+        from src.core.ocr_engine import WagonOCR
+        ocr = WagonOCR(mode=cfg['ocr_mode'], cache=False)
+        return ocr.read, inputs['number_crops']
+    raise ValueError(f"Unknown stage: {stage}")
+
+def _latency_stats(timings_ms, wall_s):
+    arr = np.asarray(timings_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        'items': len(arr),
+        'throughput_per_s': round(len(arr) / wall_s, 3) if wall_s > 0 else None,
+        'mean_ms': round(float(arr.mean()), 2),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+    }
+
+def run_stage(stage, cfg, inputs):
+    t0 = time.perf_counter()
+    fn, items = _setup_stage(stage, cfg, inputs)
+    load_s = time.perf_counter() - t0
+
+    # Warm-up calls pay for lazy init / kernel selection and are not timed
+    for item in items[:cfg['warmup']]:
+        fn(item)
+
+    timings = []
+    start = time.perf_counter()
+    for i in range(cfg['iterations']):
+        item = items[i % len(items)]
+        t0 = time.perf_counter()
+        fn(item)
+        timings.append((time.perf_counter() - t0) * 1000)
+    stats = _latency_stats(timings, time.perf_counter() - start)
+    stats['load_s'] = round(load_s, 3)
+    if hasattr(items[0], 'shape'):
+        stats['mean_input_pixels'] = int(np.mean([item.shape[0] * item.shape[1] for item in items]))
+    return stats
+
+def _write_clip(frames, path, fps=25):
+    h, w = frames[0].shape[:2]
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+    for frame in frames:
+        out.write(frame)
+    out.release()
+
+def run_pipeline(cfg, inputs, deblur_scope, threads=None):
+    """Full cascaded pipeline, headless, against scratch DB / artifact / report / OCR cache locations."""
+    scratch = tempfile.mkdtemp(prefix='wagon_bench_')
+    try:
+        # `threads` cores (default: all) split between this process and the OCR worker, as in production
+        cpu_resources.apply('pipeline', cpu_resources.make_plans(budget=threads, ocr_threads=cfg['ocr_threads'])[0])
+        os.environ['OCR_CACHE_PATH'] = os.path.join(scratch, 'ocr_cache.json')  # Read by the spawned OCR worker
+        import src.core.database as database
+        import src.core.artifact_store as artifact_store
+        import src.core.report_cache as report_cache
+        from src.core.deblur_engine import DeblurGANEngine
+        from src.scripts import cascaded_pipeline as cp
+        database.DB_PATH = artifact_store.DB_PATH = os.path.join(scratch, 'inspections.db')
+        artifact_store.ARTIFACT_DIR = os.path.join(scratch, 'artifacts')
+        report_cache.REPORT_DIR = os.path.join(scratch, 'reports')
+
+        # The pipeline writes its text report relative to the video, so the clip lives in scratch too
+        clip_dir = os.path.join(scratch, 'video', 'clip')
+        os.makedirs(clip_dir)
+        video_path = os.path.join(clip_dir, 'bench.mp4')
+        if cfg['clip']:
+            shutil.copy(cfg['clip'], video_path)
+        else:
+            _write_clip(inputs['frames'], video_path)
+
+        t0 = time.perf_counter()
+        deblur_path = _weights(cfg['deblur_model'], cfg, 'NAFNet')
+        models = {'model_a': _yolo(cfg['model_a'], cfg, 'Model A'),
+                  'model_b': _yolo(cfg['model_b'], cfg, 'Model B'),
+                  'deblur': DeblurGANEngine(deblur_path)}
+        cp.get_ocr_service()
+        load_s = time.perf_counter() - t0
+
+        snapshots = []
+        start = time.perf_counter()
+        cp.cascaded_pipeline(video_path, None, None, None, headless=True, models=models,
+                             progress_sink=snapshots.append, deblur_scope=deblur_scope)
+        wall = time.perf_counter() - start
+        cp.shutdown_ocr_service()
+
+        final = snapshots[-1] if snapshots else {'frames_processed': 0, 'stages': {}}
+        frame_stats = final['stages'].get('frame_detect', {})
+        return {
+            'items': final['frames_processed'],
+            'throughput_per_s': round(final['frames_processed'] / wall, 3) if wall > 0 else None,
+            'mean_ms': frame_stats.get('mean_ms'),
+            'p50_ms': frame_stats.get('p50_ms'),
+            'p95_ms': frame_stats.get('p95_ms'),
+            'p99_ms': frame_stats.get('p99_ms'),
+            'load_s': round(load_s, 3),
+            'wagons_counted': final.get('wagons_counted'),
+            'crop_router': final.get('crop_router'),
+            'stage_breakdown': final['stages'],
+        }
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _stage_process(stage, cfg, out_q):
+    """Child entry point: one stage per process so peak RSS is attributable to it."""
+    try:
+        random.seed(cfg['seed'])
+        np.random.seed(cfg['seed'])
+        try:
+            import torch
+            torch.manual_seed(cfg['seed'])
+        except ImportError:
+            pass
+
+        # '<stage>@<n>' when sweeping CPU thread counts
+        base, _, threads = stage.partition('@')
+        threads = int(threads) if threads else None
+
+        base_rss = _rss_mb()
+        inputs = build_inputs(cfg)
+        if base.startswith('pipeline'):
+            # 'pipeline:<scope>' when several deblur scopes are compared
+            scope = base.split(':', 1)[1] if ':' in base else cfg['deblur_scopes'][0]
+            result = run_pipeline(cfg, inputs, scope, threads)
+        else:
+            cpu_resources.apply('ocr' if base == 'ocr' else 'pipeline', cpu_resources.standalone_plan(threads))
+            result = run_stage(base, cfg, inputs)
+        result['cpu'] = cpu_resources.current()
+        result['base_rss_mb'] = base_rss
+        result['peak_rss_mb'] = _peak_rss_mb()
+        if stage.startswith('pipeline'):
+            result['peak_rss_children_mb'] = _peak_rss_mb('children')  # OCR worker process
+        out_q.put((stage, result))
+    except Exception as e:
+        out_q.put((stage, {'error': f"{type(e).__name__}: {e}", 'traceback': traceback.format_exc()}))
+
+
+def sweep_summary(stage_results):
+    """Per swept stage: throughput at each thread count, speedup and parallel efficiency vs the smallest count."""
+    sweeps = {}
+    for key, result in stage_results.items():
+        base, _, threads = key.partition('@')
+        if threads and 'error' not in result and result.get('throughput_per_s'):
+            sweeps.setdefault(base, []).append((int(threads), result['throughput_per_s']))
+    summary = {}
+    for base, points in sweeps.items():
+        points.sort()
+        t0, tp0 = points[0]
+        summary[base] = [{'threads': t, 'throughput_per_s': tp, 'speedup': round(tp / tp0, 2),
+                          'efficiency': round(tp * t0 / (tp0 * t), 2)} for t, tp in points]
+    return summary
+
+
+# -----------------------------
+# Baseline comparison
+# -----------------------------
+def compare(results, baseline, tolerance):
+    """Print current vs baseline per stage. Returns the list of regressed 'stage.metric' names."""
+    for key in ('seed', 'frames', 'iterations', 'clip', 'crops'):
+        if baseline.get('config', {}).get(key) != results['config'].get(key):
+            print(f"[BENCH] Warning: baseline was recorded with {key}={baseline.get('config', {}).get(key)!r}")
+
+    regressions = []
+    print(f"{'stage':<10} {'metric':<18} {'baseline':>10} {'current':>10} {'change':>8}")
+    for stage, cur in results['stages'].items():
+        base = baseline.get('stages', {}).get(stage)
+        if not base or 'error' in cur or 'error' in base:
+            continue
+        for metric, worse in COMPARED:
+            b, c = base.get(metric), cur.get(metric)
+            if not b or c is None:
+                continue
+            change = (c - b) / b
+            regressed = change * worse > tolerance
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{stage:<10} {metric:<18} {b:>10.2f} {c:>10.2f} {change:>+7.1%}{flag}")
+            if regressed:
+                regressions.append(f"{stage}.{metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages (throughput, latency percentiles, peak RSS).")
+    parser.add_argument("--stages", type=str, default=",".join(STAGES), help="Comma-separated stages to run")
+    parser.add_argument("--clip", type=str, default=None, help="Recorded sample clip (default: synthetic frames)")
+    parser.add_argument("--crops", type=str, default=None, help="Directory of number crops for OCR (default: synthetic)")
+    parser.add_argument("--frames", type=int, default=16, help="Distinct input frames/crops")
+    parser.add_argument("--iterations", type=int, default=50, help="Timed calls per stage")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed calls per stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model_a", default="railway_hackathon_take6/merged_model_v6_generalized/weights/best.pt")
+    parser.add_argument("--model_b", default="railway_hackathon_numbers/number_detector_v1/weights/best.pt")
+    parser.add_argument("--deblur_model", default="NAFnet/NAFNet-GoPro-width32.pth")
+    parser.add_argument("--zero_dce", default="zero_dce_model/Epoch99.pth")
+    parser.add_argument("--ocr_mode", default=os.environ.get("OCR_MODE", "full"))
+    parser.add_argument("--device", default="cpu", help="Device for Zero-DCE")
+    parser.add_argument("--deblur_scopes", type=str, default="wagon",
+                        help="Deblur scope(s) for the pipeline stage; 'wagon,number' runs and compares both")
+    parser.add_argument("--threads", type=str, default=None,
+                        help="Comma-separated CPU thread counts to sweep per stage, e.g. 1,2,4,8,16 "
+                             "(pipeline stages: cores shared by the pipeline process and its OCR worker)")
+    parser.add_argument("--ocr_threads", type=int, default=None,
+                        help="Cores reserved for the OCR worker in pipeline stages (default: CPU_OCR_THREADS or a quarter)")
+    parser.add_argument("--allow-random", action="store_true", help="Use random weights when a weights file is missing")
+    parser.add_argument("--output", type=str, default=None, help="Results JSON (default: detection/benchmarks/<timestamp>.json)")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Also store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative change before flagging")
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds per stage")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)} (choose from {', '.join(STAGES)})")
+    scopes = [s.strip() for s in args.deblur_scopes.split(',') if s.strip()]
+    if 'pipeline' in stages and len(scopes) > 1:
+        idx = stages.index('pipeline')
+        stages[idx:idx + 1] = [f"pipeline:{scope}" for scope in scopes]
+    thread_counts = [int(t) for t in args.threads.split(',') if t.strip()] if args.threads else []
+    if thread_counts:
+        stages = [f"{stage}@{t}" for stage in stages for t in thread_counts]
+
+    cfg = {
+        'seed': args.seed, 'frames': args.frames, 'iterations': args.iterations, 'warmup': args.warmup,
+        'clip': args.clip, 'crops': args.crops, 'model_a': args.model_a, 'model_b': args.model_b,
+        'deblur_model': args.deblur_model, 'zero_dce': args.zero_dce, 'ocr_mode': args.ocr_mode,
+        'device': args.device, 'allow_random': args.allow_random, 'deblur_scopes': scopes,
+        'threads': thread_counts, 'ocr_threads': args.ocr_threads,
+    }
+
+    results = {
+        'created_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'host': {'platform': platform.platform(), 'python': platform.python_version(), 'cpu_count': os.cpu_count(),
+                 'cores_available': len(cpu_resources.available_cores())},
+        'config': cfg,
+        'stages': {},
+    }
+
+    ctx = mp.get_context("spawn")
+    for stage in stages:
+        print(f"[BENCH] Running {stage}...")
+        out_q = ctx.Queue()
+        p = ctx.Process(target=_stage_process, args=(stage, cfg, out_q))
+        p.start()
+        try:
+            _, result = out_q.get(timeout=args.timeout)
+        except queue.Empty:
+            p.terminate()
+            result = {'error': f"timed out after {args.timeout:.0f}s"}
+        p.join()
+        if 'error' not in result and result.get('peak_rss_mb') is None:
+            print("[BENCH] Peak RSS unavailable on this platform")
+
+        results['stages'][stage] = result
+        if 'error' in result:
+            print(f"[BENCH] {stage}: FAILED ({result['error']})")
+        else:
+            print(f"[BENCH] {stage}: {result['throughput_per_s']}/s | p50 {result['p50_ms']} ms | "
+                  f"p95 {result['p95_ms']} ms | p99 {result['p99_ms']} ms | peak RSS {result['peak_rss_mb']} MB")
+            router = result.get('crop_router')
+            if router:
+                print(f"[BENCH] {stage}: deblur scope {router['deblur_scope']} | NAFNet {router['deblur_calls']} calls, "
+                      f"{router['deblur_megapixels']} MP | wagons with a valid number "
+                      f"{router['wagons_valid']}/{router['wagons']}")
+
+    if thread_counts:
+        results['cpu_sweep'] = sweep_summary(results['stages'])
+        for base, points in results['cpu_sweep'].items():
+            best = max(points, key=lambda pt: pt['throughput_per_s'])
+            line = " | ".join(f"{pt['threads']}t {pt['throughput_per_s']}/s x{pt['speedup']} ({pt['efficiency']:.0%})"
+                              for pt in points)
+            print(f"[BENCH] {base} threads: {line} -> best {best['threads']}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"benchmark_{time.strftime('%Y-%m-%d_%H-%M-%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"[BENCH] Results written to {output}")
+
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        shutil.copy(output, args.baseline)
+        print(f"[BENCH] Baseline updated: {args.baseline}")
+
+    if regressions:
+        print(f"[BENCH] Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# Add the project root to the python path so we can import from src
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.core.ocr_engine import WagonOCR, OCR_MODES
+from src.core.indian_railways import IndianWagonParser
+from src.core.ocr_preprocess import OCRPreprocessor
+
+
+def load_crops(crops_dir, limit=None):
+    paths = []
+    for ext in ('*.jpg', '*.jpeg', '*.png'):
+        paths += glob.glob(os.path.join(crops_dir, '**', ext), recursive=True)
+    paths = sorted(paths)[:limit] if limit else sorted(paths)
+
+    crops = []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is not None:
+            crops.append((path, img))
+    return crops
+
+
+def load_labels(labels_path):
+    """CSV with columns: filename, number (11 digits). Matched on file basename."""
+    labels = {}
+    with open(labels_path, newline='') as f:
+        for row in csv.DictReader(f):
+            labels[os.path.basename(row['filename'])] = ''.join(filter(str.isdigit, row['number']))
+    return labels
+
+
+def preprocess_crops(chain, crops):
+    """Apply one preprocessing chain to every crop. Returns (crops, per-crop ms, {step: total ms})."""
+    preprocessor = OCRPreprocessor(chain)
+    out, timings, steps = [], [], {}
+    for path, img in crops:
+        t0 = time.perf_counter()
+        processed, step_ms = preprocessor.timed(img)
+        timings.append((time.perf_counter() - t0) * 1000)
+        for step, ms in step_ms.items():
+            steps[step] = steps.get(step, 0.0) + ms
+        out.append((path, processed))
+    return out, np.array(timings), steps
+
+
+def run_mode(mode, crops, repeat):
+    ocr = WagonOCR(mode=mode, cache=False)
+    # Warm-up: first call pays for CUDA/kernel init
+    ocr.process_wagon(crops[0][1])
+
+    timings = []
+    outputs = {}
+    for path, img in crops:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            text = ocr.process_wagon(img)
+            timings.append((time.perf_counter() - t0) * 1000)
+        outputs[path] = text
+    return np.array(timings), outputs
+
+
+def digits(text):
+    return ''.join(filter(str.isdigit, text or ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR latency/accuracy across OCR modes and preprocessing chains.")
+    parser.add_argument("--crops", type=str, required=True, help="Directory of number-plate crops (before preprocessing)")
+    parser.add_argument("--labels", type=str, default=None, help="Optional CSV (filename,number) for accuracy")
+    parser.add_argument("--modes", type=str, default=",".join(OCR_MODES), help="Comma-separated modes to run")
+    parser.add_argument("--limit", type=int, default=None, help="Use at most N crops")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per crop")
+    parser.add_argument("--chains", type=str, nargs='+', default=['none'],
+                        help="Preprocessing profiles or comma-separated step lists (e.g. default legacy clahe,unsharp)")
+    args = parser.parse_args()
+
+    crops = load_crops(args.crops, args.limit)
+    if not crops:
+        print(f"Error: No crops found in {args.crops}")
+        return
+    labels = load_labels(args.labels) if args.labels else {}
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+
+    print(f"Benchmarking {len(crops)} crops x {args.repeat} runs: {', '.join(modes)} | chains: {', '.join(args.chains)}")
+    prepared = {}
+    for chain in args.chains:
+        chain_crops, pre_ms, steps = preprocess_crops(chain, crops)
+        prepared[chain] = chain_crops
+        step_str = ", ".join(f"{step} {ms / len(crops):.2f}" for step, ms in steps.items()) or "-"
+        print(f"{chain:>20} preprocess: mean {pre_ms.mean():7.2f} ms | p95 {np.percentile(pre_ms, 95):7.2f} ms"
+              f" | per step (ms/crop): {step_str}")
+
+    results = {}
+    for mode in modes:
+        for chain in args.chains:
+            label = f"{mode}/{chain}" if len(args.chains) > 1 else mode
+            timings, outputs = run_mode(mode, prepared[chain], args.repeat)
+            results[label] = outputs
+
+            parsed = sum(1 for text in outputs.values() if text and IndianWagonParser.parse(text))
+            valid = sum(1 for text in outputs.values() if text and IndianWagonParser.validate_checksum(digits(text)))
+            line = (f"{label:>20}: mean {timings.mean():7.1f} ms | p50 {np.percentile(timings, 50):7.1f} ms"
+                    f" | p95 {np.percentile(timings, 95):7.1f} ms | 11-digit parses {parsed}/{len(crops)}"
+                    f" | check-digit valid {valid}/{len(crops)}")
+            if labels:
+                labelled = [p for p in outputs if os.path.basename(p) in labels]
+                correct = sum(1 for p in labelled if digits(outputs[p]) == labels[os.path.basename(p)])
+                line += f" | exact {correct}/{len(labelled)}"
+            print(line)
+
+    if len(results) > 1:
+        base, other = list(results)[:2]
+        agree = sum(1 for p, _ in crops if digits(results[base][p]) == digits(results[other][p]))
+        print(f"Digit agreement {base} vs {other}: {agree}/{len(crops)}")
+
+
+if __name__ == "__main__":
+    main()
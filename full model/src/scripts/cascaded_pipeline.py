@@ -1,5 +1,4 @@
 import cv2
-from ultralytics import YOLO
 import sys
 import os
 import argparse
@@ -12,45 +11,115 @@ import numpy as np
 # Add project root
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from src.core.ocr_engine import WagonOCR
 from src.core.indian_railways import IndianWagonParser
 from src.scripts.pipeline_viz import draw_stats, draw_track
-from src.core.deblur_engine import DeblurGANEngine
-from src.core.blur_metric import calculate_blur_score
+from src.core.model_registry import get_registry
+from src.core.ocr_consensus import ConsensusEngine
+from src.core.consist import ConsistBuilder
+from src.core.progress import ProgressReporter
+from src.core.profiling import get_profiler, enable_profiling, profiled
+from src.core.ocr_preprocess import OCRPreprocessor
+from src.core.crop_router import CropRouter
+from src.core.illumination import IlluminationMonitor
+import src.core.cpu_resources as cpu_resources
 import src.core.database as database
+import src.core.report_cache as report_cache
+import src.core.artifact_store as artifact_store
 
 # -----------------------------
 # OCR Processing (CPU)
 # -----------------------------
+OCR_FLUSH = "__flush__"
+# Sent by the OCR worker just before echoing a flush: its profiling events for this run
+OCR_PROFILE = "__profile__"
+# 'recognize' skips EasyOCR's text detector (Model B already localizes the number). Opt-in until
+# benchmark_ocr.py on the labelled crop set shows it reads as accurately as 'full'.
+OCR_MODE = os.environ.get("OCR_MODE", "full")
+# Number-crop preprocessing chain before OCR (profile name or step list, see src.core.ocr_preprocess)
+OCR_PREPROCESS = os.environ.get("OCR_PREPROCESS", "default")
+# What NAFNet deblurs: the whole wagon crop before Model B ('wagon'), or only the
+# padded number crop Model B found on the raw wagon ('number', a few % of the pixels)
+DEBLUR_SCOPE = os.environ.get("DEBLUR_SCOPE", "wagon")
+# Stop reading a track once its consensus is a valid number at this confidence (or after max attempts)
+CONSENSUS_THRESHOLD = 0.75
+CONSENSUS_MAX_ATTEMPTS = 8
+# A track unseen for this many frames is finalized without waiting for the end of the video
+TRACK_LOST_FRAMES = 90
+# Run Model A (detection + tracking) every Nth frame; Model B on about every 3rd frame as before
+DETECT_EVERY = max(1, int(os.environ.get("DETECT_EVERY", "2")))
+NUMBER_EVERY = max(1, round(3 / DETECT_EVERY))
+
 def ocr_worker(input_queue, output_queue):
-    ocr = WagonOCR()
+    # Threads / cores from the plan the pipeline process exported before spawning us
+    cpu_resources.apply('ocr')
+    ocr = get_registry().get_ocr(mode=OCR_MODE)
+    profiler = get_profiler()
+    profiler.process_name = "ocr_worker"
     while True:
         item = input_queue.get()
-        if item is None: break
+        if item is None:
+            ocr.save_cache()
+            break
+
+        # End-of-run marker: echo it back so the pipeline knows every earlier result is out
+        if item[0] == OCR_FLUSH:
+            ocr.save_cache()
+            print(f"[OCR] Cache stats: {ocr.cache_stats()}")
+            if profiler.enabled:
+                output_queue.put((OCR_PROFILE, profiler.drain()))
+            output_queue.put(item)
+            continue
         
-        # New Unpacking: Added ocr_path
-        wagon_id, crop, req_time, orig_path, deblur_path, ocr_path = item
+        wagon_id, crop, req_time = item
+        profiler.record_wall('ocr.queue_wait', req_time, wagon=wagon_id)
         
         # In a real scenario, DeblurGAN would run here before OCR
         
-        raw_text = ocr.process_wagon(crop)
-        
-        if raw_text:
-            parsed = IndianWagonParser.parse(raw_text)
-            output_queue.put((wagon_id, raw_text, parsed, req_time, orig_path, deblur_path, ocr_path))
-        else:
+        with profiler.span('ocr.read', wagon=wagon_id):
+            raw_text, confidence, cached = ocr.read(crop)
+        if not raw_text:
             print(f"[WARNING] OCR Failed for Wagon {wagon_id}")
-            # Still pass paths so we can see the failed image
-            output_queue.put((wagon_id, "OCR Failed", None, req_time, orig_path, deblur_path, ocr_path))
+        # Parsing happens after multi-frame consensus in the pipeline
+        output_queue.put((wagon_id, raw_text, confidence, cached, req_time))
+
+# The OCR process outlives a single run so EasyOCR stays loaded between videos
+_ocr_service = None
+
+def get_ocr_service():
+    """Return (input_queue, output_queue) of the persistent OCR process, starting it if needed."""
+    global _ocr_service
+    if _ocr_service is None or not _ocr_service[0].is_alive():
+        # Split the cores with the OCR worker before it inherits this process's plan
+        cpu_resources.ensure('pipeline', cpu_resources.make_plans()[0])
+        ocr_in_q = mp.Queue(maxsize=10)
+        ocr_out_q = mp.Queue()
+        ocr_p = mp.Process(target=ocr_worker, args=(ocr_in_q, ocr_out_q), daemon=True)
+        ocr_p.start()
+        _ocr_service = (ocr_p, ocr_in_q, ocr_out_q)
+    return _ocr_service[1], _ocr_service[2]
+
+def shutdown_ocr_service():
+    global _ocr_service
+    if _ocr_service is not None:
+        ocr_p, ocr_in_q, _ = _ocr_service
+        ocr_in_q.put(None)
+        ocr_p.join()
+        _ocr_service = None
 
 # -----------------------------
-# Cascaded Pipeline
+# Model Loading
 # -----------------------------
-def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path, headless=False, inspection_id=None):
-    if not os.path.exists(video_path): return
-    
+def load_models(model_a_path, model_b_path, deblur_model_path, zero_dce_path=None):
+    """
+    Fetch Model A, Model B, NAFNet and Zero-DCE from the process-wide registry
+    (loaded on first use, shared afterwards). Returns a dict usable as `models=` below.
+    """
+    registry = get_registry()
+    # Unless a worker pool configured this process already: this process + its OCR worker share the cores
+    cpu_resources.ensure('pipeline', cpu_resources.make_plans()[0])
+
     print(f"[INFO] Loading Model A (Wagon): {model_a_path}")
-    model_a = YOLO(model_a_path)
+    model_a = registry.get_yolo(model_a_path)
     
     print(f"[INFO] Loading Model B (Number): {model_b_path}")
     # Check if model B exists, if not warn user
@@ -58,33 +127,78 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
         print(f"[WARNING] Model B not found at {model_b_path}. Number detection will fail.")
         model_b = None
     else:
-        model_b = YOLO(model_b_path)
+        model_b = registry.get_yolo(model_b_path)
 
     # DeblurGAN Setup
     deblur_engine = None
     if os.path.exists(deblur_model_path):
         try:
             print(f"[INFO] Loading DeblurGAN: {deblur_model_path}")
-            deblur_engine = DeblurGANEngine(deblur_model_path)
+            deblur_engine = registry.get_deblur(deblur_model_path)
         except Exception as e:
             print(f"[WARNING] Failed to load DeblurGAN: {e}. Running without deblurring.")
     else:
         print(f"[WARNING] DeblurGAN weights not found at {deblur_model_path}. Running without deblurring.")
+
+    # Zero-DCE (low light), only applied when the illumination monitor says dim/night
+    enhancer = None
+    if zero_dce_path and os.path.exists(zero_dce_path):
+        try:
+            import torch
+            print(f"[INFO] Loading Zero-DCE: {zero_dce_path}")
+            enhancer = registry.get_enhancer(zero_dce_path, device='cuda' if torch.cuda.is_available() else 'cpu')
+        except Exception as e:
+            print(f"[WARNING] Failed to load Zero-DCE: {e}. Night footage will not be enhanced.")
+    else:
+        print(f"[WARNING] Zero-DCE weights not found at {zero_dce_path}. Night footage will not be enhanced.")
+
+    return {'model_a': model_a, 'model_b': model_b, 'deblur': deblur_engine, 'enhancer': enhancer}
+
+def _reset_tracker(model):
+    """Clear ByteTrack state left over from a previous video on a reused model."""
+    predictor = getattr(model, 'predictor', None)
+    for tracker in getattr(predictor, 'trackers', None) or []:
+        tracker.reset()
+
+# -----------------------------
+# Cascaded Pipeline
+# -----------------------------
+def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path, headless=False, inspection_id=None,
+                      models=None, should_stop=None, progress_sink=None, ocr_preprocess=None, deblur_scope=None,
+                      zero_dce_path=None):
+    """
+    Run detection -> deblur -> number detection -> OCR over a video.
+
+    models: optional dict from load_models() so long-lived workers can reuse warm models.
+    should_stop: optional callable polled during the run; returning True cancels it.
+    progress_sink: optional callable receiving live progress snapshots (see src.core.progress).
+    ocr_preprocess: preprocessing profile for number crops (default: OCR_PREPROCESS).
+    deblur_scope: 'wagon' or 'number' (default: DEBLUR_SCOPE).
+    zero_dce_path: Zero-DCE weights, used when models is None.
+    Returns the final inspection status ("COMPLETED" / "CANCELLED"), or None if the video is missing.
+    """
+    if not os.path.exists(video_path): return
+    
+    if models is None:
+        models = load_models(model_a_path, model_b_path, deblur_model_path, zero_dce_path)
+    model_a = models['model_a']
+    model_b = models['model_b']
+    deblur_engine = models['deblur']
+    enhancer = models.get('enhancer')
+    _reset_tracker(model_a)
+    preprocess = OCRPreprocessor(ocr_preprocess or OCR_PREPROCESS)
+    print(f"[INFO] OCR preprocessing: {preprocess}")
+    # Per-crop choice of upscale / deblur / enhance / straight to OCR
+    router = CropRouter(deblur_available=deblur_engine is not None, deblur_scope=deblur_scope or DEBLUR_SCOPE)
+    print(f"[INFO] Deblur scope: {router.deblur_scope}")
+    # Day / dim / night, re-checked every 30 frames: decides where Zero-DCE runs and what is_night records
+    illumination = IlluminationMonitor()
         
-    deblur_save_dir = os.path.join(os.path.dirname(video_path), '../../full model/DeblurredImg')
-    original_save_dir = os.path.join(os.path.dirname(video_path), '../../full model/OriginalImg')
-    ocr_save_dir = os.path.join(os.path.dirname(video_path), '../../full model/OCRimage')
-    os.makedirs(deblur_save_dir, exist_ok=True)
-    os.makedirs(original_save_dir, exist_ok=True)
-    os.makedirs(ocr_save_dir, exist_ok=True)
 
     cap = cv2.VideoCapture(video_path)
     
-    # OCR Setup
-    ocr_in_q = mp.Queue(maxsize=10)
-    ocr_out_q = mp.Queue()
-    ocr_p = mp.Process(target=ocr_worker, args=(ocr_in_q, ocr_out_q), daemon=True)
-    ocr_p.start()
+    # OCR Setup (persistent worker process, EasyOCR already loaded after the first run)
+    ocr_in_q, ocr_out_q = get_ocr_service()
     
     # Logging Setup
     import datetime
@@ -99,10 +213,17 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
 
     # Database Init
     database.init_db()
+    # Crops go to the content-addressed artifact store (deduplicated, subject to retention)
+    artifact_store.init_store()
     if inspection_id is None:
         inspection_id = database.create_inspection(os.path.basename(video_path))
     print(f"[INFO] Inspection Run ID: {inspection_id}")
 
+    # Span timings for this run (no-op unless profiling is enabled)
+    profiler = get_profiler()
+    profiler.process_name = "pipeline"
+    profiler.reset()
+
     # Data Buffers
     unique_wagons = set()
     consist_log = [] # List of dicts: {'id': track_id, 'text': ..., 'parsed': ..., 'time': ...}
@@ -112,7 +233,117 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
     prev_time = time.time()
     metrics = {'fps': deque(maxlen=50), 'det': deque(maxlen=50), 'ocr': deque(maxlen=50)}
     wagon_data = {}
-    ocr_requested = set()
+    active_wagons_list = []  # Kept between sparse detection frames for the overlay
+    detect_pass = 0
+
+    # Multi-frame OCR: one read in flight per track, repeated until the consensus settles
+    consensus = ConsensusEngine(threshold=CONSENSUS_THRESHOLD, max_attempts=CONSENSUS_MAX_ATTEMPTS)
+    ocr_inflight = {}    # track id -> crops (ocr, original, deblurred) of the read in flight
+    ocr_routes = {}      # track id -> crop route of the read in flight
+    wagon_night = {}     # track id -> is_night when its latest crop was read
+    best_crops = {}      # track id -> (confidence, crops) of the most confident read so far
+    finalized = set()
+    last_seen = {}
+
+    # -----------------------------
+    # OCR Result Handling (consensus -> buffer + DB)
+    # -----------------------------
+    @profiled('finalize_track')
+    def finalize_track(wagon_id):
+        """Write the consensus for a track to the log/DB. Called once per track."""
+        finalized.add(wagon_id)
+        res = consensus.finalize(wagon_id)
+        crops = best_crops.pop(wagon_id, (0.0, None))[1]
+        if res is None and crops is None:
+            return  # Never sent to OCR
+
+        router.record_wagon(bool(res and res['valid']))
+        raw_text = res['text'] if res and res['text'] else "OCR Failed"
+        conf = res['confidence'] if res and res['text'] else 0.0
+        parsed = IndianWagonParser.parse(raw_text) if res and res['text'] else None
+
+        # Timestamp for this specific detection
+        det_time = datetime.datetime.now().strftime("%H:%M:%S")
+        wagon_data[wagon_id] = {'raw': raw_text, 'parsed': parsed}
+        
+        # Formatted Output
+        parsed_str = str(parsed) if parsed else "Invalid"
+        reads = f"{res['hypotheses']}/{res['attempts']}" if res else "0/0"
+        
+        log_entry = f"[{det_time}] ID: {wagon_id} | OCR: {raw_text:<15} | Conf: {conf:.2f} | Reads: {reads} | Parsed: {parsed_str}"
+        print(log_entry)
+        
+        consist_log.append({
+            'id': wagon_id,
+            'raw': raw_text, 
+            'parsed': parsed,
+            'timestamp': det_time
+        })
+
+        # Save the crops of the most confident read (identical blobs are stored once)
+        ocr_path = orig_path = deblur_path = ""
+        if crops is not None:
+            ocr_img, orig_img, deblur_img = crops
+            ocr_path = artifact_store.put_image(ocr_img, inspection_id, 'ocr')
+            orig_path = artifact_store.put_image(orig_img, inspection_id, 'original') if orig_img is not None else ""
+            deblur_path = artifact_store.put_image(deblur_img, inspection_id, 'deblurred') if deblur_img is not None else ""
+
+        # Fallback logic for DB paths
+        # If deblur didn't happen, use the OCR crop path as placeholder 
+        # so the DB has *something* to show (same blob, no extra file).
+        deblur_path = deblur_path or ocr_path
+        orig_path = orig_path or ocr_path
+
+        if res and res['text']:
+            consist.set_ocr(wagon_id, raw_text, conf, parsed)
+
+        print(f"[DEBUG] Adding Wagon {wagon_id} to DB...")
+        database.add_wagon(
+            inspection_id=inspection_id,
+            wagon_index=wagon_id,
+            ocr_text=raw_text,
+            ocr_conf=conf,
+            orig_path=orig_path,
+            deblur_path=deblur_path,
+            ocr_path=ocr_path,
+            defects="None",
+            is_night=wagon_night.pop(wagon_id, illumination.is_night),
+            parsed=parsed
+        )
+
+    def handle_ocr_result(item):
+        wagon_id, raw_text, confidence, cached, req_time = item
+        
+        # Calculate Latency
+        latency = time.time() - req_time
+        metrics['ocr'].append(latency)
+        progress.record_stage('ocr', latency * 1000)
+        progress.update(ocr_completed=progress.ocr_completed + 1)
+
+        crops = ocr_inflight.pop(wagon_id, None)
+        route = ocr_routes.pop(wagon_id, None)
+        if route is not None:
+            router.record_outcome(route, IndianWagonParser.validate_checksum(raw_text))
+        if wagon_id in finalized:
+            return  # Late read for a track already written out
+
+        # A cache hit repeats an earlier read of the same crop: it votes at reduced weight
+        # (once per track, later repeats only count the attempt) and can't settle the track alone
+        prior = consensus.result(wagon_id)
+        if cached and prior is not None and prior['hypotheses']:
+            raw_text = None
+        res = consensus.add(wagon_id, raw_text, confidence, cached=cached)
+
+        if crops is not None and (wagon_id not in best_crops or confidence > best_crops[wagon_id][0]):
+            best_crops[wagon_id] = (confidence, crops)
+
+        # Show the running consensus on the track
+        if res['text']:
+            wagon_data[wagon_id] = {'raw': res['text'], 'parsed': IndianWagonParser.parse(res['text'])}
+            progress.update(last_wagon=res['text'])
+
+        if consensus.is_settled(wagon_id):
+            finalize_track(wagon_id)
 
     # -----------------------------
     # VIDEO DISPLAY SETTINGS (VLC-like)
@@ -122,6 +353,13 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
     video_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     video_fps = cap.get(cv2.CAP_PROP_FPS)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    # Consist: passage order + counts from wagons crossing the middle of the frame
+    consist = ConsistBuilder(video_width, video_height)
+
+    # Live progress (frames, FPS, wagon count, OCR backlog, stage latencies)
+    progress = ProgressReporter(inspection_id, sink=progress_sink, total_frames=total_frames)
+    progress.publish(force=True)
     
     # Calculate display size (fit to screen, max 1280x720 for comfortable viewing)
     max_display_width = 1280
@@ -142,49 +380,93 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
         except:
             pass
         
+    final_status = "COMPLETED"
     while cap.isOpened():
+        # Cancellation check (cheap, but not every frame)
+        if should_stop is not None and frame_cnt % 30 == 0 and should_stop():
+            print(f"[INFO] Inspection {inspection_id} cancelled at frame {frame_cnt}.")
+            final_status = "CANCELLED"
+            break
+
+        t_frame = profiler.clock()
         success, frame = cap.read()
         if not success: break
+        profiler.record('decode', t_frame)
         
         frame_cnt += 1
         t0 = time.time()
+        light = illumination.update(frame_cnt, frame)
+        det_frame = frame  # What Model A and the crops see (enhanced at night)
         
         # -----------------------------
         # STEP 1: Model A (Full Frame) - Detect Wagons
         # -----------------------------
-        results_a = model_a.track(frame, persist=True, tracker="../../trackers/byte_track.yaml", verbose=False)
-        # DEBUG: Print raw detections
-        if results_a and results_a[0].boxes.id is not None:
-             print(f"Raw Classes Detected: {results_a[0].boxes.cls.cpu().numpy()}")
-             print(f"Confidences: {results_a[0].boxes.conf.cpu().numpy()}")
-
-        active_wagons_list = []
-        if results_a and results_a[0].boxes.id is not None:
-            boxes = results_a[0].boxes.xyxy.cpu().numpy()
-            ids = results_a[0].boxes.id.cpu().numpy()
-            clss = results_a[0].boxes.cls.cpu().numpy()
+        # Sparse cadence: detect/track every DETECT_EVERY frames; the line counter
+        # only needs each track's side, so crossings between samples are still caught
+        run_detection = frame_cnt % DETECT_EVERY == 0
+        if run_detection:
+            detect_pass += 1
+            if light == 'night' and enhancer is not None:
+                t_stage = time.time()
+                with profiler.span('zero_dce_frame', frame=frame_cnt):
+                    det_frame = enhancer.enhance_frame(frame)
+                # Own stage: full-frame passes are not comparable with the per-crop 'zero_dce' in dim mode
+                progress.record_stage('zero_dce_frame', (time.time()-t_stage)*1000)
+            t_stage = time.time()
+            with profiler.span('model_a', frame=frame_cnt):
+                results_a = model_a.track(det_frame, persist=True, tracker="../../trackers/byte_track.yaml", verbose=False)
+            progress.record_stage('model_a', (time.time()-t_stage)*1000)
+            # DEBUG: Print raw detections
+            if results_a and results_a[0].boxes.id is not None:
+                 print(f"Raw Classes Detected: {results_a[0].boxes.cls.cpu().numpy()}")
+                 print(f"Confidences: {results_a[0].boxes.conf.cpu().numpy()}")
+
+            active_wagons_list = []
+            wagon_boxes = []
+            if results_a and results_a[0].boxes.id is not None:
+                boxes = results_a[0].boxes.xyxy.cpu().numpy()
+                ids = results_a[0].boxes.id.cpu().numpy()
+                clss = results_a[0].boxes.cls.cpu().numpy()
             
-            for box, track_id, cls in zip(boxes, ids, clss):
-                track_id = int(track_id)
-                if int(cls) == 0 or int(cls) == 6:  # Assuming classes 0 and 6 are wagons
-                    # RULE 1: Area-based filtering
-                    # Wagon box area: 5% – 35% (User requested 3% - 40%)
-                    x1, y1, x2, y2 = box
-                    box_area = (x2 - x1) * (y2 - y1)
-                    image_area = video_width * video_height
-                    ratio = box_area / image_area
-
-                    if 0.03 < ratio < 0.40:
-                        active_wagons_list.append((track_id, box))
+                for box, track_id, cls in zip(boxes, ids, clss):
+                    track_id = int(track_id)
+                    if int(cls) == 0 or int(cls) == 6:  # Assuming classes 0 and 6 are wagons
+                        # Counting: every wagon box goes to the line counter
+                        wagon_boxes.append((track_id, box))
                         unique_wagons.add(track_id)
-                    else:
-                        pass
-                        # print(f"[DEBUG] Filtered box {track_id} with area ratio {ratio:.3f}")
+
+                        # RULE 1: Area-based filtering (now only picks crops worth reading, not what is counted)
+                        # Wagon box area: 5% – 35% (User requested 3% - 40%)
+                        x1, y1, x2, y2 = box
+                        box_area = (x2 - x1) * (y2 - y1)
+                        image_area = video_width * video_height
+                        ratio = box_area / image_area
+
+                        if 0.03 < ratio < 0.40:
+                            active_wagons_list.append((track_id, box))
+
+            with profiler.span('consist'):
+                consist.observe(frame_cnt, wagon_boxes)
+            progress.update(line_crossings=consist.counter.counts())
 
         # -----------------------------
         # STEP 2: Model B (Crops) - Detect Numbers
         # -----------------------------
-        if model_b:
+        if model_b and run_detection and detect_pass % NUMBER_EVERY == 0:
+            # Dim light: enhance only the crops that feed Model B / OCR, all in one batched call
+            dim_crops = {}
+            if light == 'dim' and enhancer is not None and active_wagons_list:
+                fh, fw = det_frame.shape[:2]
+                raw_crops = {}
+                for wagon_id, box in active_wagons_list:
+                    x1, y1, x2, y2 = map(int, box)
+                    if x2 > x1 and y2 > y1:
+                        raw_crops[wagon_id] = det_frame[max(0,y1):min(fh,y2), max(0,x1):min(fw,x2)]
+                t_stage = time.time()
+                with profiler.span('zero_dce_crops', crops=len(raw_crops)):
+                    dim_crops = dict(zip(raw_crops, enhancer.enhance_crops(list(raw_crops.values()))))
+                progress.record_stage('zero_dce', (time.time()-t_stage)*1000)
+
             for wagon_id, box in active_wagons_list:
                 x1, y1, x2, y2 = map(int, box)
                 h, w = frame.shape[:2]
@@ -193,205 +475,152 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
                 if x2<=x1 or y2<=y1: continue
                 
                 # Crop Wagon (FULL CONTEXT)
-                wagon_crop = frame[max(0,y1):min(h,y2), max(0,x1):min(w,x2)]
+                wagon_crop = det_frame[max(0,y1):min(h,y2), max(0,x1):min(w,x2)]
 
                 if wagon_crop.size == 0:
                     continue
 
+                wagon_crop = dim_crops.get(wagon_id, wagon_crop)
+
                 # -----------------------------
-                # WAGON-LEVEL RESIZE (IMPORTANT)
+                # ROUTING: deblur (and upscale for it) only blurry wagons
                 # -----------------------------
+                with profiler.span('route_wagon', wagon=wagon_id):
+                    wagon_route = router.route_wagon(wagon_crop)
+
                 # Ensure minimum spatial resolution for deblurring
-                if wagon_crop.shape[0] < 256:
-                    scale = 256 / wagon_crop.shape[0]
-                    wagon_crop = cv2.resize(
-                        wagon_crop,
-                        (int(wagon_crop.shape[1] * scale), 256),
-                        interpolation=cv2.INTER_CUBIC
-                    )
-
-                # Initialize Paths & Timestamp (Unified)
-                ts = int(time.time()*100)
-                orig_path = ""
-                deblur_path = ""
-                
-                # Make directories absolute
-                deblur_save_dir = os.path.abspath(deblur_save_dir)
-                original_save_dir = os.path.abspath(original_save_dir)
-                ocr_save_dir = os.path.abspath(ocr_save_dir)
+                wagon_scale = 1.0
+                if wagon_route['upscale']:
+                    # Upscaled by the router already (the blur score is taken at this size)
+                    wagon_scale = router.deblur_min_height / wagon_crop.shape[0]
+                    wagon_crop = wagon_route['upscaled']
+
+                # Crops kept in memory; only persisted if this wagon is sent to OCR
+                orig_img = None
+                deblur_img = None
 
                 # -----------------------------
                 # WAGON-LEVEL DEBLUR (KEY FIX)
                 # -----------------------------
-                if deblur_engine:
-                    blur_score = calculate_blur_score(wagon_crop)
-
-                    # Use realistic thresholds for text motion blur
-                    if blur_score < 1:
-                        # -----------------------------
-                        # SAVE ORIGINAL (BLURRED) WAGON
-                        # -----------------------------
-
-                        wagon_blur = wagon_crop.copy()
-                        # Use unified 'ts'
-                        orig_path = os.path.join(original_save_dir, f"wagon_{wagon_id}_{ts}.jpg")
-                        cv2.imwrite(orig_path, wagon_blur)
-
-                        print(f"[INFO] Deblurring wagon {wagon_id} | Blur score: {blur_score:.1f} | Size: {wagon_crop.shape[:2]}")
+                if wagon_route['deblur']:
+                    # -----------------------------
+                    # SAVE ORIGINAL (BLURRED) WAGON
+                    # -----------------------------
+                    orig_img = wagon_crop.copy()
+
+                    print(f"[INFO] Deblurring wagon {wagon_id} | Blur score: {wagon_route['blur_score']:.1f} | Size: {wagon_crop.shape[:2]}")
+                    router.record_deblur(wagon_crop)
+                    t_stage = time.time()
+                    with profiler.span('deblur', wagon=wagon_id):
                         wagon_crop = deblur_engine.deblur(wagon_crop)
+                    progress.record_stage('deblur', (time.time()-t_stage)*1000)
 
-                        # Save Deburred using same 'ts'
-                        wagon_save_path = os.path.join(deblur_save_dir, f"wagon_{wagon_id}_{ts}.jpg")
-                        cv2.imwrite(wagon_save_path, wagon_crop)
-                        deblur_path = wagon_save_path
+                    deblur_img = wagon_crop
                     
                 # -----------------------------
                 # NOW run Model B on CLEAN wagon
                 # -----------------------------
-                if frame_cnt % 3 == 0:
+                t_stage = time.time()
+                with profiler.span('model_b', wagon=wagon_id):
                     results_b = model_b.predict(wagon_crop, verbose=False, conf=0.25)
+                progress.record_stage('model_b', (time.time()-t_stage)*1000)
                     
-                    # DEBUG: Log results
-                    print(f"[DEBUG] Wagon {wagon_id}: Model B found {len(results_b[0].boxes)} boxes")
+                # DEBUG: Log results
+                print(f"[DEBUG] Wagon {wagon_id}: Model B found {len(results_b[0].boxes)} boxes")
 
-                    # If Number Found (Class 0 in Model B)
-                    for r in results_b:
-                        for nbox in r.boxes.xyxy:
-                            nx1, ny1, nx2, ny2 = map(int, nbox)
+                # If Number Found (Class 0 in Model B)
+                for r in results_b:
+                    for nbox in r.boxes.xyxy:
+                        nx1, ny1, nx2, ny2 = map(int, nbox)
                             
-                            # Only trigger OCR once per wagon for now
-                            if wagon_id not in ocr_requested:
-                                # 1. Add Padding (50%) - Sufficient context without too much noise
-                                pad_w = int((nx2 - nx1) * 1.2)
-                                pad_h = int((ny2 - ny1) * 1.0)
-                                px1 = max(0, nx1 - pad_w)
-                                py1 = max(0, ny1 - pad_h)
-                                px2 = min(w, nx2 + pad_w)
-                                py2 = min(h, ny2 + pad_h)
+                        # One read in flight per wagon, until its consensus settles
+                        if (wagon_id not in ocr_inflight and wagon_id not in finalized
+                                and not consensus.is_settled(wagon_id)):
+                            # 1. Add Padding (50%) - Sufficient context without too much noise
+                            pad_w = int((nx2 - nx1) * 1.2)
+                            pad_h = int((ny2 - ny1) * 1.0)
+                            px1 = max(0, nx1 - pad_w)
+                            py1 = max(0, ny1 - pad_h)
+                            px2 = min(w, nx2 + pad_w)
+                            py2 = min(h, ny2 + pad_h)
                                 
-                                number_img = wagon_crop[py1:py2, px1:px2]
+                            number_img = wagon_crop[py1:py2, px1:px2]
                                 
-                                # 2. Dynamic Scaling (Target Height ~96px)
-                                # PaddleOCR works best with text height 32-96px.
-                                # Avoid making it massive (300px+) or tiny (<20px).
-                                if number_img.size > 0:
+                            # 2. Route the number crop: upscale small ones, deblur / enhance only when it helps
+                            if number_img.size > 0:
+                                with profiler.span('route_number', wagon=wagon_id):
+                                    number_route = router.route_number(number_img, wagon_deblurred=deblur_img is not None)
+
+                                if number_route['upscale']:
                                     h_img, w_img = number_img.shape[:2]
-                                    target_height = 96.0
-                                    
-                                    if h_img < target_height:
-                                        scale_factor = target_height / h_img
+                                    scale_factor = router.number_target_height / h_img
+                                    with profiler.span('number_resize', wagon=wagon_id):
                                         number_img = cv2.resize(number_img, (int(w_img * scale_factor), int(h_img * scale_factor)), interpolation=cv2.INTER_CUBIC)
+
+                                if number_route['deblur']:
+                                    orig_img = number_img
+                                    router.record_deblur(number_img)
+                                    t_stage = time.time()
+                                    with profiler.span('deblur', wagon=wagon_id):
+                                        number_img = deblur_engine.deblur(number_img)
+                                    progress.record_stage('deblur', (time.time()-t_stage)*1000)
+                                    deblur_img = number_img
+
+                                # Preprocessing chain (default: one detailEnhance at reduced size;
+                                # 'legacy' restores the double full-size pass)
+                                final_img = number_img
+                                if number_route['enhance']:
+                                    t_stage = time.time()
+                                    with profiler.span('ocr_preprocess', wagon=wagon_id):
+                                        final_img = preprocess(number_img)
+                                    progress.record_stage('ocr_preprocess', (time.time()-t_stage)*1000)
+
+                                # Crops are kept with the read; only the best read's are saved at finalize
+                                print(f"[DEBUG] Queueing OCR for Wagon {wagon_id}")
+                                ocr_in_q.put((wagon_id, final_img, time.time()))
+                                ocr_inflight[wagon_id] = (final_img, orig_img, deblur_img)
+                                ocr_routes[wagon_id] = number_route['route']
+                                wagon_night[wagon_id] = illumination.is_night
+                                progress.update(ocr_requested=progress.ocr_requested + 1)
                                     
-                                    # Initialize Paths (Important for DB)
-                                    orig_path = ""
-                                    deblur_path = ""
-                                    
-                                    # DEBLUR CHECK
-                                    # final_img = number_img
-                                    # if deblur_engine:
-                                    #     score = calculate_blur_score(number_img)
-                                        # Threshold logic: Lower score = more blur. 
-                                        # Typical Laplacian var for sharp text is > 100-200.
-                                        # We trigger deblur if score < 150 (Tunable)
-                                        # Bumping to 500 to ensure it triggers for demo
-                                        # if score < 500:
-                                        #     print(f"[INFO] Deblurring Wagon {wagon_id} (Score: {score:.1f}, Size: {number_img.shape[:2]})")
-                                        #     h_img, w_img = number_img.shape[:2]
-                                        #     if h_img < 64 or w_img < 128:
-                                        #         # Too small for deblurring – skip
-                                        #         final_img = number_img
-                                        #     else:
-                                        #         final_img = deblur_engine.deblur(number_img)
-
-                                    final_img = number_img
-
-                                    # User's Modified Deblur/Process Block
-                                    # (Preserving their commented out style or logical intent, but fixing scope)
-                                    # It seems they want detailEnhance.
-                                    final_img = cv2.detailEnhance(final_img, sigma_s=10, sigma_r=0.15)
-
-                                    final_img = cv2.detailEnhance(final_img, sigma_s=10, sigma_r=0.15)
-
-                                    # Save Result
-                                    # Use unified 'ts'
-                                    save_path = os.path.join(ocr_save_dir, f"wagon_{wagon_id}_{ts}.jpg")
-                                    cv2.imwrite(save_path, final_img)
-                                    
-                                    # Fallback logic for DB paths
-                                    # If deblur didn't happen, use the OCR crop path as placeholder 
-                                    # so the DB has *something* to show.
-                                    if not deblur_path:
-                                        deblur_path = save_path
-                                    if not orig_path:
-                                         orig_path = save_path 
-                                    
-                                    # Pass 'save_path' as 'ocr_path'
-                                    print(f"[DEBUG] Queueing OCR for Wagon {wagon_id}")
-                                    ocr_in_q.put((wagon_id, final_img, time.time(), orig_path, deblur_path, save_path))
-                                    ocr_requested.add(wagon_id)
-                                    
-                            # Visualization
-                            gx1, gy1 = x1 + nx1, y1 + ny1
-                            gx2, gy2 = x1 + nx2, y1 + ny2
-                            cv2.rectangle(frame, (gx1, gy1), (gx2, gy2), (0, 255, 0), 2)
+                        # Visualization (number box back in frame coordinates)
+                        gx1, gy1 = x1 + int(nx1 / wagon_scale), y1 + int(ny1 / wagon_scale)
+                        gx2, gy2 = x1 + int(nx2 / wagon_scale), y1 + int(ny2 / wagon_scale)
+                        cv2.rectangle(frame, (gx1, gy1), (gx2, gy2), (0, 255, 0), 2)
 
 
         metrics['det'].append((time.time()-t0)*1000)
+        progress.record_stage('frame_detect', metrics['det'][-1])
 
         # -----------------------------
         # STEP 3: Check OCR & Buffer Data
         # -----------------------------
+        t_stage = profiler.clock()
         while True:
             try:
                 # Non-blocking get. If empty, raises queue.Empty immediately.
                 item = ocr_out_q.get_nowait()
-                
-                # Unpack 7 items (CORRECTED)
-                wagon_id, raw_text, parsed, req_time, orig_path, deblur_path, ocr_path = item
-                
-                # Calculate Latency
-                latency = time.time() - req_time
-                metrics['ocr'].append(latency)
-                
-                # Timestamp for this specific detection
-                det_time = datetime.datetime.now().strftime("%H:%M:%S")
-                wagon_data[wagon_id] = {'raw': raw_text, 'parsed': parsed}
-                
-                # Formatted Output
-                parsed_str = str(parsed) if parsed else "Invalid"
-                
-                log_entry = f"[{det_time}] ID: {wagon_id} | OCR: {raw_text:<15} | Parsed: {parsed_str} | Latency: {latency:.2f}s"
-                print(log_entry)
-                
-                consist_log.append({
-                    'id': wagon_id,
-                    'raw': raw_text, 
-                    'parsed': parsed,
-                    'timestamp': det_time
-                })
-
-                # DB Log (Using Actual Paths)
-                print(f"[DEBUG] Adding Wagon {wagon_id} to DB...")
-                database.add_wagon(
-                    inspection_id=inspection_id,
-                    wagon_index=wagon_id,
-                    ocr_text=raw_text,
-                    ocr_conf=0.99 if raw_text != "OCR Failed" else 0.0,
-                    orig_path=orig_path or "",
-                    deblur_path=deblur_path or "",
-                    ocr_path=ocr_path or "",
-                    defects="None",
-                    is_night=False 
-                )
-
             except queue.Empty:
                 # Continue main video loop if no OCR result ready
                 break
+            if item[0] == OCR_PROFILE:
+                profiler.merge(item[1])
+            elif item[0] != OCR_FLUSH:  # Skip stale markers from an interrupted earlier run
+                handle_ocr_result(item)
+
+        # Tracks that left the view: write out whatever consensus they reached
+        for wagon_id, _ in active_wagons_list:
+            last_seen[wagon_id] = frame_cnt
+        for wagon_id in consensus.tracks():
+            if wagon_id not in ocr_inflight and frame_cnt - last_seen.get(wagon_id, frame_cnt) > TRACK_LOST_FRAMES:
+                finalize_track(wagon_id)
+        profiler.record('ocr_results', t_stage)
 
 
         # -----------------------------
         # STEP 4: Visualization
         # -----------------------------
+        t_stage = profiler.clock()
         for wagon_id, box in active_wagons_list:
             x1, y1, x2, y2 = map(int, box)
             
@@ -410,7 +639,7 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
         avg_fps = sum(metrics['fps'])/len(metrics['fps']) if metrics['fps'] else 0
         stats = [f"FPS: {avg_fps:.1f}", 
                  f"Det Time: {sum(metrics['det'])/len(metrics['det']):.0f}ms",
-                 f"Count: {len(unique_wagons)}"]
+                 f"Count: {consist.count}"]
         draw_stats(frame, stats)
 
                 # -----------------------------
@@ -425,7 +654,7 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
         frame = cv2.addWeighted(overlay, 0.7, frame, 0.3, 0)
         
         # Progress bar
-        progress = frame_cnt / total_frames if total_frames > 0 else 0
+        progress_ratio = frame_cnt / total_frames if total_frames > 0 else 0
         bar_y = h - 25
         bar_start_x = 120
         bar_end_x = w - 120
@@ -434,7 +663,7 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
         # Background bar (gray)
         cv2.rectangle(frame, (bar_start_x, bar_y - 3), (bar_end_x, bar_y + 3), (80, 80, 80), -1)
         # Progress bar (orange/yellow like VLC)
-        progress_x = int(bar_start_x + bar_width * progress)
+        progress_x = int(bar_start_x + bar_width * progress_ratio)
         cv2.rectangle(frame, (bar_start_x, bar_y - 3), (progress_x, bar_y + 3), (0, 165, 255), -1)
         # Progress knob
         cv2.circle(frame, (progress_x, bar_y), 6, (255, 255, 255), -1)
@@ -446,7 +675,7 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
         cv2.putText(frame, time_str, (10, h - 12), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
         
         # Wagon count display (right side)
-        count_str = f"Wagons: {len(unique_wagons)}"
+        count_str = f"Wagons: {consist.count}"
         cv2.putText(frame, count_str, (w - 110, h - 12), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
         
         # Top banner (semi-transparent)
@@ -454,6 +683,13 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
         cv2.rectangle(overlay_top, (0, 0), (w, 35), (30, 30, 30), -1)
         frame = cv2.addWeighted(overlay_top, 0.7, frame, 0.3, 0)
 
+
+        profiler.record('overlay', t_stage)
+
+        progress.frame_done()
+        progress.update(wagons_counted=consist.count, crop_routes=dict(router.routes), illumination=light)
+        progress.publish()
+        profiler.record('frame', t_frame, frame=frame_cnt)
         
         if not headless:
             cv2.imshow(window_name, frame)
@@ -466,8 +702,27 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
                 print("[INFO] Paused. Press any key to continue...")
                 cv2.waitKey(0)
 
-    ocr_in_q.put(None)
-    ocr_p.join()
+    # Drain OCR results still in flight for this run (the worker itself stays up)
+    flush_token = (OCR_FLUSH, time.time())
+    ocr_in_q.put(flush_token)
+    while True:
+        try:
+            item = ocr_out_q.get(timeout=120)
+        except queue.Empty:
+            print("[WARNING] OCR worker did not flush in time; dropping pending results.")
+            break
+        if item[0] == OCR_PROFILE:
+            profiler.merge(item[1])
+            continue
+        if item[0] == OCR_FLUSH:
+            if item == flush_token: break
+            continue  # stale marker from an interrupted earlier run
+        handle_ocr_result(item)
+
+    # Tracks still open at the end keep the best consensus they reached
+    for wagon_id in set(consensus.tracks()) | set(best_crops):
+        if wagon_id not in finalized:
+            finalize_track(wagon_id)
     cap.release()
     if not headless:
         cv2.destroyAllWindows()
@@ -477,7 +732,14 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
     # ---------------------------------------------------------
     print("[INFO] Generating final report...")
     
-    total_wagons = len(unique_wagons)
+    consist_entries = consist.entries()
+    total_wagons = consist.count
+    if total_wagons == 0 and unique_wagons:
+        # Nothing crossed the counting line (e.g. train stopped in view): fall back to track count
+        print("[WARNING] No wagon crossed the counting line; reporting tracked wagons instead.")
+        consist_entries = [{'position': i, 'track_ids': [uid], 'wagon_number': None, 'parsed': None, 'gap_before': False}
+                           for i, uid in enumerate(sorted(unique_wagons), 1)]
+        total_wagons = len(consist_entries)
     end_time_str = datetime.datetime.now().strftime("%H:%M")
     report_date = start_time.strftime("%d-%b-%Y")
     
@@ -501,24 +763,32 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
     report_lines.append("|  #   | Wagon ID       | Type   | Owner | Condition  | Timestamp       |")
     
     # Populate Consist List from Data
-    # Match consist_log items to unique_wagons. 
-    # Some wagons in unique_wagons might not have OCR data (missed detection/ocr).
-    # We list ALL detected wagons.
-    
-    sorted_ids = sorted(list(unique_wagons))
+    # Wagons in passage order (one row per wagon, merged tracks included).
+    # Some wagons might not have OCR data (missed detection/ocr).
     
-    # Create lookup from id -> ocr data
+    # Create lookup from track id -> ocr data
     ocr_lookup = {item['id']: item for item in consist_log}
     
-    for idx, uid in enumerate(sorted_ids, 1):
+    for entry in consist_entries:
+        idx = entry['position']
         wagon_id_str = "Unknown"
         w_type = "-"
         w_owner = "-"
         w_cond = "Good"
         w_time = "-"
-        
-        if uid in ocr_lookup:
-            data = ocr_lookup[uid]
+
+        if entry['gap_before']:
+            report_lines.append("|  ...   (possible missed wagon: unusually long gap before next)       |")
+
+        logged = [ocr_lookup[t] for t in entry['track_ids'] if t in ocr_lookup]
+        data = None
+        if entry['wagon_number']:
+            data = {'raw': entry['wagon_number'], 'parsed': entry['parsed'],
+                    'timestamp': logged[0]['timestamp'] if logged else "-"}
+        elif logged:
+            data = logged[0]
+
+        if data:
             # ID: Prefer parsed 11-digit formatted, else raw text
             if data['parsed']:
                 wagon_id_str = data['parsed']['formatted']
@@ -529,7 +799,7 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
             
             w_time = data['timestamp']
         else:
-            wagon_id_str = f"Track-{uid}" # Fallback
+            wagon_id_str = f"Track-{entry['track_ids'][0]}" # Fallback
             
         # Formatting Line (Fixed Width approx)
         # ID: 14 chars, Type: 6, Owner: 5, Cond: 10
@@ -550,11 +820,34 @@ def cascaded_pipeline(video_path, model_a_path, model_b_path, deblur_model_path,
 
     print("-" * 50)
     print(f"[SUMMARY] Total Wagons Counted: {total_wagons}")
+    print(f"[SUMMARY] Crop routes: {router.stats()}")
+    print(f"[SUMMARY] Illumination: {illumination.stats()}")
     print(f"[SUMMARY] Report saved to: {log_file_path}")
     print("-" * 50)
+
+    if profiler.enabled:
+        trace_path = profiler.export_chrome_trace(os.path.join(output_dir, f"{timestamp_str}_trace.json"))
+        summary_path = profiler.export_summary(os.path.join(output_dir, f"{timestamp_str}_profile.json"))
+        for stage, st in list(profiler.summary().items())[:10]:
+            print(f"[PROFILE] {stage:<16} n={st['count']:<6} total {st['total_ms']:>10.1f} ms | "
+                  f"p50 {st['p50_ms']:>8.2f} | p95 {st['p95_ms']:>8.2f} | p99 {st['p99_ms']:>8.2f}")
+        print(f"[PROFILE] Trace: {trace_path} | Summary: {summary_path}")
+        profiler.reset()
     
-    # Mark as Completed
-    database.update_inspection_status(inspection_id, "COMPLETED")
+    # Mark as Completed (or Cancelled)
+    database.update_inspection_count(inspection_id, total_wagons)
+    database.update_inspection_status(inspection_id, final_status)
+
+    # Build the PDF once now so downloads are served from the cache
+    if final_status == "COMPLETED":
+        try:
+            report_cache.build_report(inspection_id)
+            report_cache.prebuild_in_background(inspection_id)
+        except Exception as e:
+            print(f"[WARNING] Report pre-generation failed: {e}")
+    progress.update(crop_router=router.stats())
+    progress.finish(final_status)
+    return final_status
 
 if __name__ == "__main__":
     mp.set_start_method("spawn", force=True)
@@ -565,6 +858,15 @@ if __name__ == "__main__":
     # Placeholder for Model B until user trains it
     parser.add_argument("--model_b", default="railway_hackathon_numbers/number_detector_v1/weights/best.pt")
     parser.add_argument("--deblur_model", default="NAFnet/NAFNet-GoPro-width32.pth")
+    parser.add_argument("--zero_dce", default="zero_dce_model/Epoch99.pth")
+    parser.add_argument("--profile", action="store_true", help="Record per-stage spans and export a Chrome trace")
+    parser.add_argument("--ocr_preprocess", default=None, help="OCR preprocessing profile for this camera (default: OCR_PREPROCESS)")
+    parser.add_argument("--deblur_scope", choices=("wagon", "number"), default=None, help="Deblur whole wagon crops or only number crops (default: DEBLUR_SCOPE)")
     
     args = parser.parse_args()
-    cascaded_pipeline(args.video_path, args.model_a, args.model_b, args.deblur_model)
+    if args.profile:
+        enable_profiling("pipeline")
+    cpu_resources.apply('pipeline', cpu_resources.make_plans()[0])
+    cascaded_pipeline(args.video_path, args.model_a, args.model_b, args.deblur_model, ocr_preprocess=args.ocr_preprocess,
+                      deblur_scope=args.deblur_scope, zero_dce_path=args.zero_dce)
+    shutdown_ocr_service()
@@ -0,0 +1,226 @@
+import sys
+import os
+import argparse
+import multiprocessing as mp
+import threading
+import time
+import queue
+import traceback
+
+# Add project root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import src.core.database as database
+import src.core.job_queue as job_queue
+import src.core.artifact_store as artifact_store
+import src.core.cpu_resources as cpu_resources
+from src.core.progress import get_store
+
+# Default model locations (same as the API upload route)
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../full model'))
+DEFAULT_MODEL_PATHS = {
+    'model_a_path': os.path.join(BASE_DIR, "railway_hackathon_take6/merged_model_v6_generalized/weights/best.pt"),
+    'model_b_path': os.path.join(BASE_DIR, "railway_hackathon_numbers/number_detector_v1/weights/best.pt"),
+    'deblur_model_path': os.path.join(BASE_DIR, "NAFnet/NAFNet-GoPro-width64.pth"),
+    'zero_dce_path': os.path.join(BASE_DIR, "zero_dce_model/Epoch99.pth"),
+}
+
+POLL_INTERVAL = 1.0  # seconds between queue polls when idle
+
+
+# -----------------------------
+# Worker Process
+# -----------------------------
+def job_worker(worker_idx, model_paths, stop_event, events_q=None, cpu_plan=None):
+    """
+    Long-lived worker: loads the models once, then drains the job queue
+    until stop_event is set. Model stats are reported on events_q.
+    cpu_plan: this worker's share of the cores (see src.core.cpu_resources).
+    """
+    # First, before any model loads: thread pools and affinity for this worker and its OCR process
+    cpu_resources.apply('pipeline', cpu_plan or cpu_resources.make_plans()[0])
+    # Imported here so the API process never pays for torch/ultralytics
+    from src.scripts.cascaded_pipeline import cascaded_pipeline, load_models, get_ocr_service, shutdown_ocr_service
+    from src.core.model_registry import get_registry
+
+    pid = os.getpid()
+    print(f"[WORKER {worker_idx}] Started (pid {pid}). Loading models...")
+    models = load_models(**model_paths)
+    # Start the OCR process now so EasyOCR loads before the first job arrives
+    get_ocr_service()
+    if events_q is not None:
+        events_q.put(('models', worker_idx, {'pid': pid, 'models': get_registry().stats(),
+                                             'cpu': cpu_resources.inherited_plan()}))
+    print(f"[WORKER {worker_idx}] Models warm. Waiting for jobs.")
+
+    # Live progress goes back to the pool (and from there into the API's ProgressStore)
+    progress_sink = None
+    if events_q is not None:
+        progress_sink = lambda snap: events_q.put(('progress', worker_idx, snap))
+
+    while not stop_event.is_set():
+        job = job_queue.claim_next(pid)
+        if job is None:
+            stop_event.wait(POLL_INTERVAL)
+            continue
+
+        job_id = job['id']
+        inspection_id = job['inspection_id']
+        print(f"[WORKER {worker_idx}] Job {job_id} (attempt {job['attempts']}): {job['video_path']}")
+        if inspection_id is not None:
+            if job['attempts'] > 1:
+                # A failed or interrupted attempt may have written wagons already
+                database.reset_inspection(inspection_id)
+            database.update_inspection_status(inspection_id, "PROCESSING")
+
+        try:
+            status = cascaded_pipeline(
+                video_path=job['video_path'],
+                headless=True,
+                inspection_id=inspection_id,
+                models=models,
+                should_stop=lambda: job_queue.is_cancel_requested(job_id),
+                progress_sink=progress_sink,
+                **model_paths
+            )
+        except Exception as e:
+            traceback.print_exc()
+            status = job_queue.retry_or_fail(job_id, str(e))
+            print(f"[WORKER {worker_idx}] Job {job_id} failed: {e} -> {status}")
+            if inspection_id is not None:
+                database.update_inspection_status(inspection_id, "QUEUED" if status == job_queue.QUEUED else status)
+            continue
+
+        if status is None:
+            # Video missing: retrying won't help
+            job_queue.finish_job(job_id, job_queue.FAILED, "Video not found")
+            if inspection_id is not None:
+                database.update_inspection_status(inspection_id, job_queue.FAILED)
+        else:
+            job_queue.finish_job(job_id, status)
+        print(f"[WORKER {worker_idx}] Job {job_id} finished: {status}")
+
+    shutdown_ocr_service()
+    print(f"[WORKER {worker_idx}] Stopped.")
+
+
+# -----------------------------
+# Pool Supervisor
+# -----------------------------
+class WorkerPool:
+    """
+    Fixed pool of job_worker processes plus a supervisor thread that
+    restarts crashed workers and re-queues the jobs they were holding,
+    and an event thread that feeds worker progress into the ProgressStore.
+    """
+
+    def __init__(self, num_workers=1, model_paths=None, supervise_interval=5.0):
+        self.num_workers = num_workers
+        self.model_paths = model_paths or DEFAULT_MODEL_PATHS
+        self.supervise_interval = supervise_interval
+        # spawn: CUDA/torch are not fork-safe, and matches cascaded_pipeline's OCR worker
+        self.ctx = mp.get_context("spawn")
+        self.stop_event = self.ctx.Event()
+        self.events_q = self.ctx.Queue()
+        self.model_stats = {}
+        # One slice of the cores per worker, split again between it and its OCR process
+        self.cpu_plans = cpu_resources.make_plans(num_workers)
+        self.workers = [None] * num_workers
+        self._supervisor = None
+        self._events_thread = None
+        self._stopping = threading.Event()
+
+    def _spawn(self, idx):
+        # Not daemonic: each worker starts its own OCR subprocess, which daemons may not do.
+        p = self.ctx.Process(target=job_worker, name=f"job-worker-{idx}",
+                             args=(idx, self.model_paths, self.stop_event, self.events_q, self.cpu_plans[idx]))
+        p.start()
+        self.workers[idx] = p
+        return p
+
+    def alive_pids(self):
+        return {p.pid for p in self.workers if p is not None and p.is_alive()}
+
+    def start(self):
+        database.init_db()
+        job_queue.init_queue()
+
+        # Anything left PROCESSING from a previous run belongs to a dead worker
+        job_queue.recover_stale_jobs()
+
+        # Optional artifact retention on startup (configured through the environment)
+        max_age = os.environ.get("ARTIFACT_MAX_AGE_DAYS")
+        quota = os.environ.get("ARTIFACT_QUOTA_MB")
+        if max_age or quota:
+            artifact_store.init_store()
+            try:
+                artifact_store.run_retention(max_age_days=float(max_age) if max_age else None,
+                                             quota_mb=float(quota) if quota else None)
+            except Exception as e:
+                print(f"[POOL] Artifact retention failed: {e}")
+
+        for idx in range(self.num_workers):
+            self._spawn(idx)
+        print(f"[POOL] Started {self.num_workers} worker(s).")
+
+        self._supervisor = threading.Thread(target=self._supervise, name="pool-supervisor", daemon=True)
+        self._supervisor.start()
+        self._events_thread = threading.Thread(target=self._read_events, name="pool-events", daemon=True)
+        self._events_thread.start()
+
+    def _read_events(self):
+        store = get_store()
+        while not self._stopping.is_set():
+            try:
+                kind, idx, payload = self.events_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if kind == 'models':
+                self.model_stats[idx] = payload
+            elif kind == 'progress':
+                store.update(payload)
+
+    def _supervise(self):
+        while not self._stopping.wait(self.supervise_interval):
+            for idx, p in enumerate(self.workers):
+                if p is not None and not p.is_alive() and not self.stop_event.is_set():
+                    print(f"[POOL] Worker {idx} (pid {p.pid}) died with exit code {p.exitcode}. Restarting.")
+                    self._spawn(idx)
+            job_queue.recover_stale_jobs(self.alive_pids())
+
+    def stop(self, timeout=30):
+        """Ask workers to finish their current job and exit."""
+        self._stopping.set()
+        self.stop_event.set()
+        for p in self.workers:
+            if p is None:
+                continue
+            p.join(timeout)
+            if p.is_alive():
+                print(f"[POOL] Worker pid {p.pid} did not stop in time; terminating.")
+                p.terminate()
+        print("[POOL] Stopped.")
+
+    def status(self):
+        return [
+            {'worker': idx, 'pid': p.pid if p else None, 'alive': bool(p and p.is_alive())}
+            for idx, p in enumerate(self.workers)
+        ]
+
+    def models(self):
+        """Per-worker model registry stats (load time, memory, hits at warm-up)."""
+        return [{'worker': idx, **stats} for idx, stats in sorted(self.model_stats.items())]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the inspection worker pool without the API.")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    pool = WorkerPool(num_workers=args.workers)
+    pool.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
@@ -1,56 +1,204 @@
-import cv2
-import sys
+import argparse
+import csv
+import glob
+import json
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
 
 # Add the parent directory to sys.path to allow importing 'wnd'
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from wnd import WagonNumberDetection
+from wnd import WagonNumberDetector
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+# one warm detector per worker process (created by initWorker)
+_detector = None
+
+
+def initWorker(modelPath):
+    global _detector
+    if modelPath:
+        WagonNumberDetection.MODEL_PATH = modelPath
+    _detector = WagonNumberDetector(draw=True)
+    # load the models now so the first video isn't slower than the rest
+    _detector.model
+    _detector.reader
+
+
+def findVideos(inputs):
+    """Expand files, directories and glob patterns into a sorted list of video paths."""
+    videos = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = glob.glob(os.path.join(item, '**', '*'), recursive=True)
+        else:
+            candidates = glob.glob(item, recursive=True) or [item]
+        videos += [c for c in candidates if os.path.isfile(c) and c.lower().endswith(VIDEO_EXTENSIONS)]
+    return sorted(set(videos))
+
+
+def outputPaths(videos, outputDir):
+    """
+    Annotated-video path per input, named after the video's path relative to the
+    inputs' common root (cam1/2024-01/a.mp4 -> output_cam1__2024-01__a.mp4), so
+    same-named videos from different directories don't overwrite each other.
+    """
+    if not outputDir:
+        return {v: None for v in videos}
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(v)) for v in videos])
+    paths, used = {}, set()
+    for videoPath in videos:
+        stem = os.path.splitext(os.path.relpath(os.path.abspath(videoPath), root))[0]
+        name = stem.replace(os.sep, '__')
+        candidate, n = name, 1
+        while candidate.lower() in used:  # e.g. a.mp4 and a.MP4 in one directory
+            n += 1
+            candidate = f"{name}_{n}"
+        used.add(candidate.lower())
+        paths[videoPath] = os.path.join(outputDir, f"output_{candidate}.mp4")
+    return paths
 
-videoPath = "vids/4.MP4"
-output_path = "results/output_4.mp4"
 
-# Ensure results directory exists
-os.makedirs(os.path.dirname(output_path), exist_ok=True)
+def processVideo(videoPath, outputPath, batchSize=8, stride=1, show=False):
+    """
+    Run the worker's detector over one video.
+    Returns a summary dict with the detections (first frame each new wagon number was seen).
+    """
+    detector = _detector
+    detector.reset()
 
-vid = cv2.VideoCapture(videoPath)
+    vid = cv2.VideoCapture(videoPath)
+    fps = vid.get(cv2.CAP_PROP_FPS) or 25.0
+    out = None
 
-# --- Setup Video Writer ---
-frame_width = int(vid.get(3))
-frame_height = int(vid.get(4))
-fps = int(vid.get(cv2.CAP_PROP_FPS))
-fourcc = cv2.VideoWriter_fourcc(*'mp4v') 
-out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
-# --------------------------
+    detections = []
+    previousWagonNumber = ""
+    frameIdx = 0
+    processed = 0
+    start = time.time()
 
-previousWagonNumber = ""
-currentWagonNumber = ""
+    def flush(batch):
+        nonlocal out, previousWagonNumber, processed
+        for (idx, _), (wagonNumber, outputFrame) in zip(batch, detector.detect_many([f for _, f in batch])):
+            processed += 1
+            if wagonNumber and wagonNumber != previousWagonNumber:
+                detections.append({'video': videoPath, 'frame': idx, 'time_s': round(idx / fps, 2),
+                                   'wagon_number': wagonNumber})
+                previousWagonNumber = wagonNumber
 
-print(f"Processing video... Saving to {output_path}")
+            # Write the annotated frame to the file
+            if outputPath:
+                if out is None:
+                    height, width = outputFrame.shape[:2]
+                    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                    out = cv2.VideoWriter(outputPath, fourcc, fps / stride, (width, height))
+                out.write(outputFrame)
 
-while True:
-    ret, frame = vid.read()
+            if show:
+                cv2.imshow("frame", outputFrame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    return False
+        return True
 
-    if not ret:
-        print("End of video.")
-        break
-    
-    wagonNumber, outputFrame = WagonNumberDetection.DetectWagonNumber(frame)
+    batch = []
+    keepGoing = True
+    while keepGoing:
+        ret, frame = vid.read()
+        if not ret:
+            break
+        if frameIdx % stride == 0:
+            batch.append((frameIdx, frame))
+            if len(batch) >= batchSize:
+                keepGoing = flush(batch)
+                batch = []
+        frameIdx += 1
+    if batch and keepGoing:
+        flush(batch)
 
-    currentWagonNumber = wagonNumber
-    if currentWagonNumber == "" or previousWagonNumber == currentWagonNumber:
-        print("no wagon number")
+    vid.release()
+    if out is not None:
+        out.release()
+    if show:
+        cv2.destroyAllWindows()
+
+    elapsed = time.time() - start
+    return {'video': videoPath, 'output': outputPath, 'frames': processed, 'seconds': round(elapsed, 2),
+            'fps': round(processed / elapsed, 2) if elapsed > 0 else 0.0, 'detections': detections}
+
+
+def writeReport(summaries, reportPath):
+    rows = [d for s in summaries for d in s['detections']]
+    if reportPath.lower().endswith('.json'):
+        with open(reportPath, 'w') as f:
+            json.dump({'videos': summaries}, f, indent=2)
     else:
-        cv2.putText(frame, wagonNumber, (230, 380), cv2.FONT_HERSHEY_DUPLEX, 1.8, (255,255,255) , 1, cv2.LINE_AA)
-        
-    # Write the frame to the file
-    out.write(frame)
-
-    cv2.imshow("frame", frame)
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-vid.release()
-out.release()
-cv2.destroyAllWindows()
-print("Done.")
+        with open(reportPath, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['video', 'frame', 'time_s', 'wagon_number'])
+            writer.writeheader()
+            writer.writerows(rows)
+    print(f"Wrote {len(rows)} detections to {reportPath}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect wagon numbers in one or many videos.")
+    parser.add_argument("inputs", nargs="*", default=["vids/4.MP4"], help="Video files, directories or glob patterns")
+    parser.add_argument("--output-dir", default="results", help="Annotated videos go here ('' to skip writing them)")
+    parser.add_argument("--report", default="results/detections.csv", help="Detections report (.csv or .json)")
+    parser.add_argument("--workers", type=int, default=1, help="Parallel worker processes (one detector each)")
+    parser.add_argument("--batch", type=int, default=8, help="Frames per detector batch")
+    parser.add_argument("--stride", type=int, default=1, help="Process every Nth frame")
+    parser.add_argument("--model", default=None, help="Detection weights (default: wnd/models/wagonNumberDetectionV2.pt)")
+    parser.add_argument("--show", action="store_true", help="Display frames (single worker only)")
+    args = parser.parse_args()
+
+    videos = findVideos(args.inputs)
+    if not videos:
+        print("No videos found.")
+        return
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    if os.path.dirname(args.report):
+        os.makedirs(os.path.dirname(args.report), exist_ok=True)
+
+    outputs = outputPaths(videos, args.output_dir)
+
+    print(f"Processing {len(videos)} video(s) with {args.workers} worker(s)...")
+    start = time.time()
+    summaries = []
+    if args.workers <= 1:
+        initWorker(args.model)
+        for videoPath in videos:
+            summary = processVideo(videoPath, outputs[videoPath], args.batch, args.stride, show=args.show)
+            print(f"{videoPath}: {summary['frames']} frames at {summary['fps']} fps, {len(summary['detections'])} wagon numbers")
+            summaries.append(summary)
+    else:
+        if args.show:
+            print("--show is ignored with several workers.")
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=initWorker, initargs=(args.model,)) as pool:
+            futures = {pool.submit(processVideo, v, outputs[v], args.batch, args.stride): v for v in videos}
+            for future in as_completed(futures):
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    print(f"{futures[future]}: failed ({e})")
+                    continue
+                print(f"{summary['video']}: {summary['frames']} frames at {summary['fps']} fps, {len(summary['detections'])} wagon numbers")
+                summaries.append(summary)
+
+    summaries.sort(key=lambda s: s['video'])
+    writeReport(summaries, args.report)
+
+    elapsed = time.time() - start
+    totalFrames = sum(s['frames'] for s in summaries)
+    print(f"Done: {len(summaries)}/{len(videos)} videos, {totalFrames} frames in {elapsed:.1f}s "
+          f"({totalFrames / elapsed if elapsed > 0 else 0:.1f} frames/s overall).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
-from ultralytics import YOLO
+import threading
+
 import cv2
-import easyocr
 
 # function to varify detected wagon number is 11 digit
 def detectionVerification(s):
@@ -40,9 +40,9 @@ def verifyWN(s):
       else:
             return False
 
-def performOCR(img):
+def performOCR(img, reader=None):
     # perform OCR on the frame
-    ocrResults = reader.readtext(img)
+    ocrResults = (reader or getReader()).readtext(img)
     return ocrResults
 
 
@@ -103,56 +103,177 @@ def drawBbox(img, pt1, pt2, color=(255,255,127), thickness=3, r=10, d=10):
 
 
 # function to extract single line wagon number
-def getSingleLineWagonNo(ocrResults, wagonNo):
-    global savedWagonNumber
-    freezCount = 0
+# returns the last verified 11 digit number in the OCR results, or "" if none
+def getSingleLineWagonNo(ocrResults):
+    wagonNo = ""
     for result in ocrResults:
-        # render results on image
         text = result[1]
         if detectionVerification(text) and verifyWN(text):
             wagonNo = text
-            if freezCount <= 1:
-                  freezCount += 1
-                  savedWagonNumber = wagonNo
-    return savedWagonNumber
+    return wagonNo
 
 # function to extract multi line wagon number
-def getMultiLineWagonNo(ocrResults, wagonNo):
-    text = ""
-    freezCount = 0
-    global savedWagonNumber
+# joins the 5/6 digit OCR segments and returns the number if it verifies, else ""
+def getMultiLineWagonNo(ocrResults):
+    wagonNo = ""
     for result in ocrResults:
-        # render results on image
         text = result[1]
         if len(text) == 5 or len(text) == 6:
             wagonNo = wagonNo + text
 
-    if detectionVerification(wagonNo):
-        if verifyWN(wagonNo):
-            if freezCount <= 1:
-                freezCount += 1
-                savedWagonNumber = wagonNo
-    return savedWagonNumber
-
+    if detectionVerification(wagonNo) and verifyWN(wagonNo):
+        return wagonNo
+    return ""
+
+
+# models are loaded on first use (not at import) and cached for the process;
+# ultralytics / easyocr themselves are imported lazily too, so importing wnd is cheap
+MODEL_PATH = "wnd/models/wagonNumberDetectionV2.pt"
+_model = None
+_reader = None
+_loadLock = threading.Lock()
+# shared models are not safe to run from several threads at once
+_inferenceLock = threading.Lock()
+
+def getModel():
+    global _model
+    with _loadLock:
+        if _model is None:
+            from ultralytics import YOLO
+            _model = YOLO(MODEL_PATH)
+    return _model
+
+def getReader():
+    global _reader
+    with _loadLock:
+        if _reader is None:
+            import easyocr
+            _reader = easyocr.Reader(['en'], gpu=False)
+    return _reader
 
 
+font = cv2.FONT_HERSHEY_DUPLEX
 
-# load the model
-wadonNumberDetectionModel = YOLO("wnd/models/wagonNumberDetectionV2.pt")
 
-# initilize the reader
-reader = easyocr.Reader(['en'], gpu=False)
+class WagonNumberDetector:
+    """
+    Wagon number detector for one video stream.
 
+    All per-stream state (last verified wagon number, detection counters) lives
+    on the instance, so several streams can run in one process. Models are
+    loaded on first use; by default they are the process-wide shared ones
+    (guarded by a lock), or pass model/reader to give a detector its own.
 
-wagonNo = "-"
-savedWagonNumber = ""
-confidence = 0
-countDetect = 0
-singleLineDetection = 0
-multiLineDetection = 0
-font = cv2.FONT_HERSHEY_DUPLEX
-
+    Parameters:
+        frameHeight (int|None): frames are resized to this height before detection (None keeps the size).
+        draw (bool): draw boxes and the result layout on the returned frame.
+        verbose (bool): print per-detection counters.
+    """
 
+    def __init__(self, model=None, reader=None, frameHeight=480, draw=True, verbose=False):
+        self._model = model
+        self._reader = reader
+        self._lock = _inferenceLock if model is None and reader is None else threading.Lock()
+        self.frameHeight = frameHeight
+        self.draw = draw
+        self.verbose = verbose
+        self.reset()
+
+    def reset(self):
+        """Forget the stream state (e.g. before starting a new video)."""
+        self.savedWagonNumber = ""
+        self.countDetect = 0
+        self.singleLineDetection = 0
+        self.multiLineDetection = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = getModel()
+        return self._model
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            self._reader = getReader()
+        return self._reader
+
+    def _resize(self, frame):
+        if self.frameHeight is None or frame.shape[0] == self.frameHeight:
+            return frame
+        new_width = int(frame.shape[1] * (self.frameHeight / frame.shape[0]))
+        return cv2.resize(frame, (new_width, self.frameHeight))
+
+    def _handleResult(self, result, frame):
+        """OCR the boxes of one YOLO result. Returns (wagon number or "", frame)."""
+        if result.boxes.cls.numel() == 0:
+            if self.verbose:
+                print("no detection")
+            if self.draw:
+                frame = drawLayout(frame, "[ Wagon ]", "", greenORred=False)
+            return "", frame
+
+        clsid = result.boxes.cls.tolist()
+        for id in clsid:
+            self.countDetect += 1
+            if id == 0:
+                self.singleLineDetection += 1
+            else:
+                self.multiLineDetection += 1
+
+        clean = frame
+        if self.draw:
+            frame = frame.copy()
+
+        for bbox, id in zip(result.boxes.xyxy.tolist(), clsid):
+            x1, y1, x2, y2 = (int(v) for v in bbox)
+            croppedFrame = clean[y1:y2, x1:x2]
+            if croppedFrame.size == 0:
+                continue
+
+            if self.draw:
+                frame = drawBbox(frame, (x1, y1), (x2, y2), (0,255,0), 3)
+            if self.verbose:
+                print(f"Total Detection: {self.countDetect}")
+                print(f"Single Line wagon number: {self.singleLineDetection}")
+                print(f"Multi Line wagon number: {self.multiLineDetection}")
+
+            with self._lock:
+                ocrResults = performOCR(croppedFrame, self.reader)
+
+            if result.names[int(id)] == "Wagon_number_single_line":
+                wagonNo = getSingleLineWagonNo(ocrResults)
+            else:
+                wagonNo = getMultiLineWagonNo(ocrResults)
+            if wagonNo:
+                self.savedWagonNumber = wagonNo
+
+        if self.draw:
+            frame = drawLayout(frame, "[ Wagon ]", self.savedWagonNumber, greenORred=True)
+        return self.savedWagonNumber, frame
+
+    def detect(self, frame):
+        """
+        Detect the wagon number in one frame.
+
+        Returns:
+            (String, numpy.ndarray): the last verified 11 digit wagon number of this stream
+            ("" if no number box is in the frame) and the resized (annotated if draw) frame.
+        """
+        return self.detect_many([frame])[0]
+
+    def detect_many(self, frames):
+        """Detect on a batch of frames (one YOLO call). Returns a list of (wagonNo, frame), in order."""
+        if not frames:
+            return []
+        resized = [self._resize(f) for f in frames]
+        with self._lock:
+            results = self.model.predict(source=resized, show=False, save=False, save_txt=False, verbose=False)
+        return [self._handleResult(result, frame) for result, frame in zip(results, resized)]
+
+
+# module level detector kept for the old function API (single stream)
+_defaultDetector = None
 
 def DetectWagonNumber(frame):
     """
@@ -163,78 +284,7 @@ def DetectWagonNumber(frame):
     Returns:
         String: If detected, 11 digit neumirical wagon number is returned else empty string is returned.
     """
-    # Resize the image
-    global wagonNo, countDetect, singleLineDetection, multiLineDetection
-    new_height = 480
-    new_width = int(frame.shape[1] * (new_height / frame.shape[0]))
-    resized_frame = cv2.resize(frame, (new_width, new_height))
-
-    
-
-    # perform wagon no detection on the frame
-    wagonNoDetectionResults = wadonNumberDetectionModel.predict(source=resized_frame, show=False, save=False, save_txt=False)
-    # segemnt or crop the frame
-    for result in wagonNoDetectionResults:
-        # fetching detection results
-        bboxes = []
-        bboxes = result.boxes.xyxy
-        clsid = []
-        clsName = ""
-
-        # check if there is any detction or not
-        if result.boxes.cls.numel() == 0:
-            print("no detection")
-            wagonNo = ""
-        if result.boxes.cls.numel() > 0:
-            clsid = result.boxes.cls.tolist()
-            clsName = wagonNoDetectionResults[0].names[clsid[0]]
-            #check detected class
-            for id in clsid:
-                if id == 0:
-                    countDetect +=1
-                    singleLineDetection += 1
-                else:
-                        countDetect +=1
-                        multiLineDetection += 1
-
-        for bbox in bboxes:
-            # print("Bounding box of detection: ", bbox)
-                x1 = int(bbox[0])
-                y1 = int(bbox[1])
-                x2 = int(bbox[2])
-                y2 = int(bbox[3])
-            
-                point1 = (x1, y1)
-                point2 = (x2, y2)
-
-                # crop and display the frame
-                croppedFrame = resized_frame[point1[1]:point2[1],point1[0]:point2[0]]
-
-                # draw detection box
-                resized_frame = drawBbox(resized_frame, point1, point2, (0,255,0), 3)
-                # print("Detected class", clsName)
-
-                print(f"Total Detection: {countDetect}")
-                print(f"Single Line wagon number: {singleLineDetection}")
-                print(f"Multi Line wagon number: {multiLineDetection}")
-                
-                # perform OCR on the frame
-                ocrResults = performOCR(croppedFrame)
-                # print("OCR results: ", ocrResults)
-
-                  # if clsName == "":
-
-                wagonNo = ""
-                if clsName == "Wagon_number_single_line":
-                    wagonNo = getSingleLineWagonNo(ocrResults, wagonNo)
-                else:
-                    wagonNo = getMultiLineWagonNo(ocrResults, wagonNo)
-
-    
-        # draw layout with results on image
-        resized_frame = drawLayout(resized_frame, "[ Wagon ]", wagonNo, greenORred = True)
-    else:
-        # draw red layout on the frame
-        resized_frame = drawLayout(resized_frame, "[ Wagon ]", wagonNo, greenORred=False)
-
-    return wagonNo , resized_frame
\ No newline at end of file
+    global _defaultDetector
+    if _defaultDetector is None:
+        _defaultDetector = WagonNumberDetector()
+    return _defaultDetector.detect(frame)
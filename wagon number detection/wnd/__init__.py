@@ -3,4 +3,6 @@
 # |_________________________________________|
 # |            author - tamal das           |
 # |         creation - 2024 march           |
-# |_________________________________________|
\ No newline at end of file
+# |_________________________________________|
+
+from .WagonNumberDetection import WagonNumberDetector, DetectWagonNumber